@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+import tempfile
 
 import django_heroku
 from decouple import config
@@ -45,15 +46,20 @@ INSTALLED_APPS = [
 ]
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 MIDDLEWARE = [
+    'remider.middleware.RequestIdMiddleware',
+    'remider.middleware.MemoryProfileMiddleware',
+    'remider.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.locale.LocaleMiddleware',
+    'remider.middleware.LeanSessionMiddleware',
+    'remider.middleware.LeanLocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'remider.middleware.LeanAuthenticationMiddleware',
+    'remider.middleware.LeanMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+# machine-invoked endpoints, which skip session, locale, auth and messages middleware
+LEAN_PATH_PREFIXES = ("/api/",)
 
 ROOT_URLCONF = 'infusionset_reminder.urls'
 
@@ -81,11 +87,32 @@ WSGI_APPLICATION = 'infusionset_reminder.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'remider.sqlite_backend',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # tests use file, in-memory SQLite locks whole tables on concurrent writes of worker threads
+        'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'infusionset_reminder_test.sqlite3')},
     }
 }
 
+# set on every new SQLite connection (see remider.db), ignored by other databases
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # durable enough with WAL, no fsync on every commit
+    "busy_timeout": 5000,  # ms
+    "temp_store": "MEMORY",
+}
+
+# maximal number of database queries of views (url name -> queries), views over budget are logged
+# measured counts of next runs (with and without DELIVERY_RECEIPTS) plus small margin, savepoints of
+# get_or_create/update_or_create count too; first run of reminder creates rows and trigger (about 50 queries)
+QUERY_BUDGETS = {
+    "reminder": 23,
+    "quiet": 21,
+    "menu": 3,
+    "manage_ph_numbers": 1,
+    "manage_ifttt_makers": 1,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -137,34 +164,127 @@ SENSOR_ALERT_FREQUENCY = config("SENSOR_ALERT_FREQUENCY", default=144, cast=int)
 
 TWILIO_ACCOUNT_SID = config("TWILIO_ACCOUNT_SID", default="")
 TWILIO_AUTH_TOKEN = config("TWILIO_AUTH_TOKEN", default="")
+# one Twilio Notify request for all recipients (empty - one request per recipient)
+TWILIO_NOTIFY_SERVICE_SID = config("TWILIO_NOTIFY_SERVICE_SID", default="")
+# sender of per-recipient messages (empty - from_number)
+TWILIO_MESSAGING_SERVICE_SID = config("TWILIO_MESSAGING_SERVICE_SID", default="")
+# per-recipient requests: concurrent requests and requests per second
+SMS_WORKERS = config("SMS_WORKERS", default=4, cast=int)
+SMS_RATE = config("SMS_RATE", default=10, cast=float)
+# Twilio`s delivery receipts (status callbacks), buffered and saved in batches of DELIVERY_BATCH_SIZE messages
+# or by background thread DELIVERY_FLUSH_INTERVAL seconds after first buffered status;
+# success rates of last DELIVERY_STATISTICS_DAYS are shown in menu
+# and run_reminder --retry-undelivered resends to recipients, whose message of last DELIVERY_RETRY_HOURS failed
+DELIVERY_RECEIPTS = config("DELIVERY_RECEIPTS", default=False, cast=bool)
+DELIVERY_BATCH_SIZE = config("DELIVERY_BATCH_SIZE", default=50, cast=int)
+DELIVERY_FLUSH_INTERVAL = config("DELIVERY_FLUSH_INTERVAL", default=30, cast=float)
+DELIVERY_STATISTICS_DAYS = config("DELIVERY_STATISTICS_DAYS", default=30, cast=int)
+DELIVERY_RETRY_HOURS = config("DELIVERY_RETRY_HOURS", default=12, cast=int)
 
 ATRIGGER_KEY = config("ATRIGGER_KEY", default="")
 ATRIGGER_SECRET = config("ATRIGGER_SECRET", default="")
+# "daily" - one task created on every run, "series" - one recurring series replaced only when TriggerTime changes
+ATRIGGER_SCHEDULE = config("ATRIGGER_SCHEDULE", default="daily")
+ATRIGGER_SERIES_COUNT = config("ATRIGGER_SERIES_COUNT", default=0, cast=int)
+# notifications scheduled for exact instants (hours before next change), daily run only synchronizes data
+EVENT_REMINDERS = config("EVENT_REMINDERS", default=False, cast=bool)
+REMINDER_OFFSETS = [int(hours) for hours in config("REMINDER_OFFSETS", default="24,6,0").split(",")]
+# notification isn`t repeated to recipient until remaining time reaches next bucket (one of REMINDER_OFFSETS
+# or whole day), entries of ledger are kept for NOTIFICATION_LEDGER_DAYS
+NOTIFICATION_DEDUPE = config("NOTIFICATION_DEDUPE", default=True, cast=bool)
+NOTIFICATION_LEDGER_DAYS = config("NOTIFICATION_LEDGER_DAYS", default=30, cast=int)
 
 FROM_NUMBER = config("from_number", default="")
 NIGTSCOUT_LINK = config("NIGHTSCOUT_LINK", default="")
 
+# numbered config variables (to_number_1, to_number_2, ...) are read until the first missing one
 TO_NUMBERS = []
-i = 0
-while True:
-    i += 1
-    try:
-        number = config("to_number_" + str(i))
-        TO_NUMBERS.append(number)
-    except:
-        break
+number = config("to_number_1", default=None)
+while number is not None:
+    TO_NUMBERS.append(number)
+    number = config("to_number_" + str(len(TO_NUMBERS) + 1), default=None)
 
 IFTTT_MAKERS = []
-i = 0
-
-while True:
-    i += 1
-    try:
-        marker = config("IFTTT_MAKER_" + str(i))
-        IFTTT_MAKERS.append(marker)
-    except:
-        break
+maker = config("IFTTT_MAKER_1", default=None)
+while maker is not None:
+    IFTTT_MAKERS.append(maker)
+    maker = config("IFTTT_MAKER_" + str(len(IFTTT_MAKERS) + 1), default=None)
+
+EMAIL_RECIPIENTS = []
+email = config("email_1", default=None)
+while email is not None:
+    EMAIL_RECIPIENTS.append(email)
+    email = config("email_" + str(len(EMAIL_RECIPIENTS) + 1), default=None)
+
+# native email notifications sent over one persistent SMTP connection of worker (see send_emails)
+EMAIL_HOST = config("EMAIL_HOST", default="localhost")
+EMAIL_PORT = config("EMAIL_PORT", default=25, cast=int)
+EMAIL_HOST_USER = config("EMAIL_HOST_USER", default="")
+EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", default="")
+EMAIL_USE_TLS = config("EMAIL_USE_TLS", default=False, cast=bool)
+EMAIL_TIMEOUT = config("EMAIL_TIMEOUT", default=10, cast=float)
+DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default="webmaster@localhost")
+EMAIL_SUBJECT = config("EMAIL_SUBJECT", default="Sugarbot")
+EMAIL_RETRIES = config("EMAIL_RETRIES", default=2, cast=int)
+EMAIL_RETRY_DELAY = config("EMAIL_RETRY_DELAY", default=1, cast=float)
+
+# changes made more than WEAR_TOLERANCE hours before/after due date are counted as early/late
+WEAR_TOLERANCE = config("WEAR_TOLERANCE", default=6, cast=int)
+
+# reservoir-empty forecast (units of insulin in filled reservoir, 0 - disabled; scheduled basal in U/h)
+RESERVOIR_VOLUME = config("RESERVOIR_VOLUME", default=0, cast=float)
+RESERVOIR_BASAL_RATE = config("RESERVOIR_BASAL_RATE", default=0, cast=float)
+
+# directory of compact on-disk cache of treatments (empty - disabled), e.g. os.path.join(BASE_DIR, "store")
+TREATMENT_STORE = config("TREATMENT_STORE", default="")
+
+# maximal size of body of treatments pushed to api/treatments/ (bytes)
+INGEST_MAX_BODY_SIZE = config("INGEST_MAX_BODY_SIZE", default=5 * 1024 * 1024, cast=int)
+
+# CGM signal-gap and sensor-degradation detector (optional stage of reminder)
+CGM_MONITORING = config("CGM_MONITORING", default=False, cast=bool)
+CGM_FETCH_COUNT = config("CGM_FETCH_COUNT", default=5000, cast=int)
+CGM_MAX_GAP_SHARE = config("CGM_MAX_GAP_SHARE", default=0.15, cast=float)  # part of session without readings
+CGM_MAX_NOISE = config("CGM_MAX_NOISE", default=8, cast=float)  # mg/dL, mean absolute second difference
+CGM_MAX_OUTLIER_SHARE = config("CGM_MAX_OUTLIER_SHARE", default=0.02, cast=float)
+
+# maximal cold start (django.setup and loading of views) in seconds, see startup_report command
+STARTUP_BUDGET = config("STARTUP_BUDGET", default=2.0, cast=float)
+
+# tracemalloc profiling of requests (part of requests traced, 0 - disabled; tracing slows request down)
+# and RSS of worker sampled at most once per MEMORY_RSS_INTERVAL seconds, see memory page
+MEMORY_PROFILING_RATE = config("MEMORY_PROFILING_RATE", default=0, cast=float)
+MEMORY_RSS_SAMPLES = config("MEMORY_RSS_SAMPLES", default=360, cast=int)
+MEMORY_RSS_INTERVAL = config("MEMORY_RSS_INTERVAL", default=10, cast=float)
+
+# sms composer (see remider.sms): notification is compacted to fit in SMS_TARGET_SEGMENTS (0 - never compacted)
+# SMS_TRANSLITERATE replaces diacritics, which force UCS-2 encoding (70 instead of 160 characters a segment)
+SMS_TARGET_SEGMENTS = config("SMS_TARGET_SEGMENTS", default=1, cast=int)
+SMS_TRANSLITERATE = config("SMS_TRANSLITERATE", default=False, cast=bool)
+
+# "remider" logger writes JSON lines to stdout from background thread (see remider.log)
+# records are dropped when LOG_QUEUE_SIZE records wait for writing
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+
+# multi-patient ticks (see run_reminder --patients)
+TENANT_WORKERS = config("TENANT_WORKERS", default=8, cast=int)
+TENANT_HOST_CONNECTIONS = config("TENANT_HOST_CONNECTIONS", default=2, cast=int)
+
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}
+# "signed_cookies" or "cache" keeps admin pages away from django_session table
+SESSION_ENGINE = SESSION_ENGINES[config("SESSION_BACKEND", default="db")]
 
 TRIGGER_IFTTT = config("trigger_ifttt", default=False, cast=bool)
 SEND_SMS = config("send_sms", default=False, cast=bool)
+SEND_EMAIL = config("send_email", default=False, cast=bool)
 django_heroku.settings(locals())
+# persistent connections (seconds, 0 - closed after every request), also for local SQLite
+DATABASES["default"]["CONN_MAX_AGE"] = config("CONN_MAX_AGE", default=600, cast=int)
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":  # SQLite given by DATABASE_URL
+    DATABASES["default"]["ENGINE"] = "remider.sqlite_backend"
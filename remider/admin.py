@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import InfusionChanged, SensorChanged, LastTriggerSet
+from .models import InfusionChanged, SensorChanged, LastTriggerSet, NightscoutSync, Patient
 
 admin.site.register(InfusionChanged)
 admin.site.register(SensorChanged)
 admin.site.register(LastTriggerSet)
+admin.site.register(NightscoutSync)
+admin.site.register(Patient)
@@ -1,54 +1,323 @@
+import atexit
+import hashlib
 import json
-import sys
-from datetime import datetime, timedelta
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 import requests.exceptions
+from urllib3.exceptions import ProtocolError
 from django.conf import settings
-from django.utils.translation import ugettext as _
-from twilio.rest import Client
+from django.core.mail import EmailMessage, get_connection
 
-from .data_processing import not_today, update_last_triggerset, get_trigger_model
+from .delivery import get_status_callback_url, record_status
+from .data_processing import not_today, update_last_triggerset, get_trigger_model, get_reminder_instants
+from .ledger import get_pending_recipients, record_notifications
+from .models import TriggerSeries, ScheduledReminder
+from .log import mask, map_in_context
+from .tenancy import get_config
 
+logger = logging.getLogger(__name__)
 
-def notify(sms_text):
+# SMTP connection of worker process, opened on first email and kept open between notifications (see send_emails)
+_smtp_lock = threading.Lock()
+_smtp_connection = [None]
+
+
+def notify(sms_text, config=None, events=(), full_text=None):
     """
-    sends notifications via chosen ways
-    :param sms_text: text of notification
+    sends notifications via chosen ways, recipients already notified about all of events are skipped
+    :param sms_text: text of sms (compacted to SMS_TARGET_SEGMENTS, see compose_sms)
+    :param config: PatientConfig of recipients, defaults to app`s settings
+    :param events: list of (kind, change date, bucket) tuples, which notification is about (see remider.ledger)
+    :param full_text: uncompacted text of IFTTT webhooks and emails, defaults to sms_text
+    :return: boolean, True if all notifications have been sent
     """
-    if settings.SEND_SMS:
-        send_message(sms_text)
-    if settings.TRIGGER_IFTTT:
-        send_webhook_IFTTT(val1=sms_text[1:])
+    full_text = sms_text if full_text is None else full_text
+    config = config or get_config()
+    recipients = [*(config.to_numbers if config.send_sms else []),
+                  *(config.ifttt_makers if config.trigger_ifttt else []),
+                  *(config.emails if config.send_email else [])]
+    pending = set(get_pending_recipients(recipients, events))
+    notified = []
+    success = True
+    if config.send_sms:
+        statuses = send_messages(sms_text, [number for number in config.to_numbers if number in pending])
+        notified += [number for number, status in statuses.items() if status != "failed"]
+        success = "failed" not in statuses.values()
+    if config.trigger_ifttt:
+        for maker in config.ifttt_makers:
+            if maker not in pending:
+                continue
+            if send_webhook_IFTTT(val1=full_text, makers=[maker]):
+                notified.append(maker)
+            else:
+                success = False
+    if config.send_email:
+        statuses = send_emails(full_text, [email for email in config.emails if email in pending])
+        notified += [email for email, sent in statuses.items() if sent]
+        success = all(statuses.values()) and success
+    record_notifications(notified, events)
+    return success
 
 
-def send_webhook_IFTTT(val1="", val2="", val3=""):
-    """ sends IFTTT webhook to all of ifttt makers from ifttt_makers list """
-    for IFTTT_MAKER in settings.IFTTT_MAKERS:
+def send_webhook_IFTTT(val1="", val2="", val3="", makers=None):
+    """
+    sends IFTTT webhook to all of ifttt makers from ifttt_makers list
+    :param makers: list of IFTTT makers, defaults to IFTTT_MAKERS
+    :return: boolean, True if all webhooks have been sent
+    """
+    success = True
+    for IFTTT_MAKER in settings.IFTTT_MAKERS if makers is None else makers:
         r = requests.post("https://maker.ifttt.com/trigger/sugarbot-notification/with/key/{0}".format(IFTTT_MAKER),
                           data={"value1": val1, "value2": val2, "value3": val3})
         if r.status_code != 200:
-            print(_("error: unsuccessful IFTTT notification to {}").format(str(IFTTT_MAKER)))
-            sys.stdout.flush()
+            success = False
+            logger.error("unsuccessful IFTTT notification", extra={
+                "stage": "notify", "recipient": mask(IFTTT_MAKER), "status": r.status_code,
+                "latency": r.elapsed.total_seconds()})
+    return success
 
 
-def send_message(body):
-    """ sends sms via Twilio gateway """
+def send_message(body, to_numbers=None):
+    """
+    sends sms via Twilio gateway
+    :param to_numbers: list of phone numbers, defaults to TO_NUMBERS
+    :return: boolean, True if all messages have been sent
+    """
+    statuses = send_messages(body, settings.TO_NUMBERS if to_numbers is None else to_numbers)
+    return "failed" not in statuses.values()
+
+
+def send_messages(body, to_numbers):
+    """
+    sends sms to all numbers with one Twilio Notify request (if TWILIO_NOTIFY_SERVICE_SID is set),
+    falls back to concurrent per-number requests if Notify certainly hasn`t accepted the request
+    (numbers aren`t sent twice when e.g. response timed out after the notification had been created)
+    :param body: text of sms
+    :param to_numbers: list of phone numbers
+    :return: dict phone number -> Twilio`s status of message ("queued", "accepted", ...) or "failed"
+    """
+    if not to_numbers:
+        return {}
+    from twilio.rest import Client  # imported on first use, it`s the slowest import of cold start
+    from twilio.base.exceptions import TwilioException
+
     client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    status_callback = get_status_callback_url()
+
+    if settings.TWILIO_NOTIFY_SERVICE_SID:
+        start = time.monotonic()
+        # sids of messages sent by Notify aren`t known here, deliveries are saved by their first status callback
+        overrides = {"sms": json.dumps({"status_callback": status_callback})} if status_callback else {}
+        try:
+            client.notify.services(settings.TWILIO_NOTIFY_SERVICE_SID).notifications.create(
+                body=body, to_binding=[json.dumps({"binding_type": "sms", "address": number}) for number in to_numbers],
+                **overrides)
+            return {number: "queued" for number in to_numbers}
+        except (TwilioException, requests.exceptions.RequestException) as error:
+            if not is_rejected(error):
+                logger.exception("bulk sms notification may have been sent, not resent", extra={
+                    "stage": "notify", "latency": time.monotonic() - start})
+                return {number: "failed" for number in to_numbers}
+            logger.exception("unsuccessful bulk sms notification, sent one by one", extra={
+                "stage": "notify", "latency": time.monotonic() - start})
+
+    limiter = RateLimiter(settings.SMS_RATE)
+    parameters = get_sender()
+    if status_callback:
+        parameters["status_callback"] = status_callback
+
+    def send(to_number):
+        limiter.wait()
+        start = time.monotonic()
+        try:
+            message = client.messages.create(body=body, to=to_number, **parameters)
+            if status_callback:
+                record_status(message.sid, to_number, message.status)
+            return message.status
+        except (TwilioException, requests.exceptions.RequestException):
+            logger.exception("unsuccessful sms notification", extra={
+                "stage": "notify", "recipient": mask(to_number), "latency": time.monotonic() - start})
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=settings.SMS_WORKERS) as executor:
+        return dict(zip(to_numbers, map_in_context(executor, send, to_numbers)))
+
+
+def is_rejected(error):
+    """
+    :param error: exception raised by request to Twilio
+    :return: boolean, True if Twilio certainly hasn`t accepted the request (connection not established,
+             4xx reply or 503 Service Unavailable), False if it might have been processed (e.g. read timeout)
+    """
+    from twilio.base.exceptions import TwilioRestException
+
+    if isinstance(error, TwilioRestException):
+        return error.status < 500 or error.status == 503
+    if isinstance(error, requests.exceptions.ConnectionError):
+        # ProtocolError - connection dropped after request had been sent
+        return not (error.args and isinstance(error.args[0], ProtocolError))
+    return False
+
+
+def send_email(body, recipients=None):
+    """
+    sends email via SMTP server (EMAIL_HOST)
+    :param recipients: list of email addresses, defaults to EMAIL_RECIPIENTS
+    :return: boolean, True if all emails have been sent
+    """
+    statuses = send_emails(body, settings.EMAIL_RECIPIENTS if recipients is None else recipients)
+    return all(statuses.values())
+
 
-    for to_number in settings.TO_NUMBERS:
+def send_emails(body, recipients):
+    """
+    sends one email per recipient, all of them in one session of worker`s persistent SMTP connection
+    transient failures (4xx replies, dropped connection) are retried EMAIL_RETRIES times,
+    refused transaction is retried on the same connection, dropped connection is reopened,
+    reused connection is checked with NOOP first (server may have closed it while idle)
+    :param body: text of email
+    :param recipients: list of email addresses
+    :return: dict email address -> boolean, True if email has been sent
+    """
+    if not recipients:
+        return {}
+    statuses = {}
+    with _smtp_lock:
+        connection = get_smtp_connection()
+        check_smtp_connection(connection)
+        for recipient in recipients:
+            message = EmailMessage(settings.EMAIL_SUBJECT, body, settings.DEFAULT_FROM_EMAIL, [recipient],
+                                   connection=connection)
+            statuses[recipient] = deliver_email(connection, message)
+    return statuses
+
+
+def deliver_email(connection, message):
+    """
+    :param connection: Django`s SMTP backend
+    :param message: EmailMessage with one recipient
+    :return: boolean, True if email has been sent
+    """
+    start = time.monotonic()
+    code = None
+    for attempt in range(settings.EMAIL_RETRIES + 1):
+        if attempt:
+            time.sleep(settings.EMAIL_RETRY_DELAY)
         try:
-            client.messages.create(body=body, from_=settings.FROM_NUMBER, to=to_number)
-        except:
-            print(_("error: unsuccessful notification to {}").format(str(to_number)))
-            sys.stdout.flush()
+            connection.open()  # no-op when connection is open
+            return connection.send_messages([message]) == 1
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as error:
+            # server has refused transaction and session goes on (smtplib has sent RSET)
+            code = get_smtp_code(error)
+            if code == 421:  # server is closing connection
+                close_smtp_connection()
+            elif not 400 <= code < 500:
+                break
+        except OSError as error:  # refused or dropped connection (includes SMTPServerDisconnected)
+            close_smtp_connection()
+            code = getattr(error, "smtp_code", None)
+            if code is not None and not 400 <= code < 500:
+                break
+    logger.error("unsuccessful email notification", extra={
+        "stage": "notify", "recipient": mask(message.to[0]), "status": code, "latency": time.monotonic() - start})
+    return False
+
+
+def get_smtp_code(error):
+    """
+    :param error: SMTPException of refused transaction
+    :return: SMTP reply code (the highest one of refused recipients)
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return max(code for code, _ in error.recipients.values())
+    return error.smtp_code
+
+
+def get_smtp_connection():
+    """
+    :return: Django`s email backend of worker (EMAIL_BACKEND), which is closed at exit
+    """
+    if _smtp_connection[0] is None:
+        _smtp_connection[0] = get_connection(fail_silently=False)
+        atexit.register(close_smtp_connection)
+    return _smtp_connection[0]
+
+
+def check_smtp_connection(connection):
+    """
+    sends NOOP over open connection, stale connection is closed (and reopened by deliver_email)
+    :param connection: Django`s email backend
+    """
+    smtp = getattr(connection, "connection", None)  # None if connection isn`t open or backend isn`t SMTP
+    if smtp is None:
+        return
+    try:
+        if smtp.noop()[0] == 250:
+            return
+    except (smtplib.SMTPException, OSError):
+        pass
+    close_smtp_connection()
+
+
+def close_smtp_connection():
+    """ closes worker`s SMTP connection, broken connection is dropped without error """
+    connection = _smtp_connection[0]
+    if connection is None:
+        return
+    try:
+        connection.close()  # SMTP backend forgets connection even if QUIT fails
+    except OSError:
+        pass
+
+
+def get_sender():
+    """
+    :return: sender`s parameters of Twilio message: Messaging Service (TWILIO_MESSAGING_SERVICE_SID) or FROM_NUMBER
+    """
+    if settings.TWILIO_MESSAGING_SERVICE_SID:
+        return {"messaging_service_sid": settings.TWILIO_MESSAGING_SERVICE_SID}
+    return {"from_": settings.FROM_NUMBER}
+
+
+class RateLimiter:
+    """ spaces calls of wait (from many threads) at least 1 / rate seconds apart """
+
+    def __init__(self, rate):
+        """
+        :param rate: calls per second (0 - unlimited)
+        """
+        self.interval = 1 / rate if rate else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            call = max(now, self.next_call)
+            self.next_call = call + self.interval
+        if call > now:
+            time.sleep(call - now)
 
 
 def change_config_var(label, new_value):
     """ changes config variables on heroku.com"""
+    return change_config_vars({label: new_value})
+
+
+def change_config_vars(data):
+    """
+    changes many config variables on heroku.com with one request
+    :param data: dict name -> new value (None deletes variable)
+    :return: boolean, True if variables have been changed
+    """
     headers = {'Content-Type': 'application/json',
                'Accept': 'application/vnd.heroku+json; version=3',
                "Authorization": "Bearer {}".format(settings.TOKEN)}
-    data = {label: new_value}
 
     r = requests.patch('https://api.heroku.com/apps/{}/config-vars'.format(settings.APP_NAME), headers=headers,
                        data=json.dumps(data))
@@ -56,11 +325,22 @@ def change_config_var(label, new_value):
     if r.status_code == 200:
         return True
     else:
-        print(r.text)
-        sys.stdout.flush()
+        logger.error("unsuccessful change of Heroku`s config vars: %s", r.text, extra={
+            "stage": "config", "status": r.status_code, "latency": r.elapsed.total_seconds()})
         return False
 
 
+def schedule_trigger():
+    """
+    schedules next waking up of app on atrigger.com
+    according to ATRIGGER_SCHEDULE ("daily" - one task a day, "series" - one recurring series of tasks)
+    :return: boolean, True if app will be woken up
+    """
+    if settings.ATRIGGER_SCHEDULE == "series":
+        return sync_trigger_series()
+    return create_trigger()
+
+
 def create_trigger(tag="typical"):
     """ creates trigger on atrigger.com """
     if not_today():
@@ -68,18 +348,138 @@ def create_trigger(tag="typical"):
         notif_date = (datetime.utcnow() + timedelta(days=1)).replace(hour=time_model.time.hour,
                                                                      minute=time_model.time.minute,
                                                                      second=time_model.time.second,
-                                                                     microsecond=0).isoformat()
+                                                                     microsecond=0)
 
-        url = "https://api.atrigger.com/v1/tasks/create?key={}&secret={}&timeSlice={}&count={}&tag_id={}&url={}&first={}".format(
-            settings.ATRIGGER_KEY, settings.ATRIGGER_SECRET, '1minute', 1, tag,
-            'https://{}.herokuapp.com/reminder/?key={}'.format(settings.APP_NAME, settings.SECRET_KEY), notif_date)
-        r = requests.get(url)
-
-        if r.status_code == 200:
+        if create_atrigger_task(notif_date, tag, url=get_reminder_url(sync=settings.EVENT_REMINDERS)):
             update_last_triggerset()
             return True
         else:
-            print(_(
-                "unsuccessful trigger on atrigger.com creating \n perhaps wrong API key or secret ?? or an app_name ??"))
-            sys.stdout.flush()
+            logger.error("unsuccessful trigger on atrigger.com creating, perhaps wrong API key or secret or app_name",
+                         extra={"stage": "schedule"})
             return False
+
+
+def sync_trigger_series():
+    """
+    keeps recurring series of triggers on atrigger.com in line with TriggerTime and reminder`s url
+    atrigger.com is called only when time or url (SECRET_KEY, EVENT_REMINDERS) has changed,
+    previous series is deleted (by its tag) so it`s replaced, not duplicated
+    :return: boolean, True if series is up to date
+    """
+    time_model = get_trigger_model()
+    url = get_reminder_url(sync=settings.EVENT_REMINDERS)
+    url_hash = hashlib.sha256(url.encode()).hexdigest()
+    series = TriggerSeries.objects.filter(id=1).first()
+    if series is not None and series.time == time_model.time and series.url_hash == url_hash:
+        return True
+
+    if series is not None and not delete_atrigger_tasks(series.tag):
+        logger.error("unsuccessful deleting of previous triggers series on atrigger.com", extra={"stage": "schedule"})
+        return False
+
+    now = datetime.utcnow().replace(microsecond=0)
+    first = now.replace(hour=time_model.time.hour, minute=time_model.time.minute, second=time_model.time.second)
+    if first <= now:
+        first += timedelta(days=1)
+    tag = "series-{:%Y%m%d%H%M%S}".format(now)
+
+    if create_atrigger_task(first, tag, time_slice="1day", count=settings.ATRIGGER_SERIES_COUNT, url=url):
+        TriggerSeries.objects.update_or_create(id=1, defaults={"tag": tag, "time": time_model.time,
+                                                               "url_hash": url_hash})
+        return True
+    else:
+        TriggerSeries.objects.filter(id=1).delete()
+        logger.error("unsuccessful trigger on atrigger.com creating, perhaps wrong API key or secret or app_name",
+                     extra={"stage": "schedule"})
+        return False
+
+
+def schedule_event_reminders(date, sensor_date):
+    """
+    schedules notifications on atrigger.com for exact instants before next changes (see get_reminder_instants)
+    already scheduled instants are skipped, instants of outdated changes are deleted
+    reminders of unknown change (None, e.g. failed reading without cached date) are kept
+    :param date: datetime of previous change of infusion set or None
+    :param sensor_date: datetime of previous change of CGM sensor or None
+    :return: boolean, True if all reminders are scheduled
+    """
+    success = True
+    for kind, change_date in (("infusion", date), ("sensor", sensor_date)):
+        if change_date is None:
+            continue
+        outdated = ScheduledReminder.objects.filter(kind=kind).exclude(change_date=change_date)
+        for outdated_date in set(outdated.values_list("change_date", flat=True)):
+            if delete_atrigger_tasks(get_reminder_tag(kind, outdated_date)):
+                ScheduledReminder.objects.filter(kind=kind, change_date=outdated_date).delete()
+            else:
+                success = False
+
+    scheduled = set(ScheduledReminder.objects.values_list("kind", "change_date", "offset"))
+    new_reminders = []
+    for kind, change_date, offset, instant in get_reminder_instants(date, sensor_date):
+        if (kind, change_date, offset) in scheduled:
+            continue
+        naive_instant = instant.astimezone(timezone.utc).replace(tzinfo=None, microsecond=0)
+        if create_atrigger_task(naive_instant, get_reminder_tag(kind, change_date)):
+            new_reminders.append(ScheduledReminder(kind=kind, change_date=change_date, offset=offset, date=instant))
+        else:
+            success = False
+    ScheduledReminder.objects.bulk_create(new_reminders)
+
+    if not success:
+        logger.error("unsuccessful reminders scheduling on atrigger.com", extra={"stage": "schedule"})
+    return success
+
+
+def get_reminder_tag(kind, change_date):
+    """
+    :return: atrigger.com tag of reminders of given change
+    """
+    return "{}-{}".format(kind, int(change_date.timestamp()))
+
+
+def get_reminder_url(sync=False):
+    """
+    :param sync: boolean, if True url only synchronizes data and schedules reminders (no notification)
+    :return: url of lean reminder endpoint for atrigger.com
+    """
+    url = "https://{}.herokuapp.com/api/reminder/?key={}".format(settings.APP_NAME, settings.SECRET_KEY)
+    if sync:
+        url += "&sync=1"
+    return url
+
+
+def create_atrigger_task(first, tag, time_slice="1minute", count=1, url=None):
+    """
+    creates task (or series of tasks) on atrigger.com, which wakes up app
+    :param first: naive UTC datetime of first run
+    :param tag: tag of task, used for deleting it later
+    :param time_slice: interval between runs
+    :param count: number of runs (0 - unlimited)
+    :param url: url called by task, defaults to notifying reminder url
+    :return: boolean, True if task has been created
+    """
+    r = requests.get("https://api.atrigger.com/v1/tasks/create", params={
+        "key": settings.ATRIGGER_KEY,
+        "secret": settings.ATRIGGER_SECRET,
+        "timeSlice": time_slice,
+        "count": count,
+        "tag_id": tag,
+        "url": url or get_reminder_url(),
+        "first": first.isoformat(),
+    })
+    return r.status_code == 200
+
+
+def delete_atrigger_tasks(tag):
+    """
+    deletes all tasks with given tag on atrigger.com
+    :param tag: tag of tasks
+    :return: boolean, True if tasks have been deleted
+    """
+    r = requests.get("https://api.atrigger.com/v1/tasks/delete", params={
+        "key": settings.ATRIGGER_KEY,
+        "secret": settings.ATRIGGER_SECRET,
+        "tag_id": tag,
+    })
+    return r.status_code == 200
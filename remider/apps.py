@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+from .db import set_sqlite_pragmas
+from .log import setup_logging
 
 
 class RemiderConfig(AppConfig):
     name = 'remider'
+
+    def ready(self):
+        connection_created.connect(set_sqlite_pragmas, dispatch_uid="remider_sqlite_pragmas")
+        setup_logging()
@@ -0,0 +1,145 @@
+import json
+import logging
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.utils.translation import ugettext as _
+
+from .models import CgmSession
+from .tenancy import host_slot
+from .vectorized import EPOCH, MICROSECOND
+
+logger = logging.getLogger(__name__)
+
+GAP_MINUTES = 15  # longer intervals between readings are signal gaps (readings come every 5 minutes)
+READING_MINUTES = 5
+OUTLIER_RATE = 4  # mg/dL per minute, faster changes are physiologically implausible
+MIN_READINGS = 36  # three hours of readings, less isn`t enough to judge sensor
+AGGREGATE_FIELDS = ("readings", "gaps", "missing_minutes", "outliers", "noise_sum", "noise_count")
+
+
+def parse_sgv_lines(lines):
+    """
+    parses lines of Nightscout`s sgv.txt ("dateString" date sgv "direction" "device", separated with tabs)
+    :param lines: iterable of lines (e.g. response.iter_lines)
+    :return: int64 array of dates (milliseconds since epoch) and float array of sgv (sorted by date, unique)
+    """
+    dates, sgvs = [], []
+    for line in lines:
+        fields = line.split("\t")
+        try:
+            dates.append(int(fields[1]))
+            sgvs.append(float(fields[2]))
+        except (IndexError, ValueError):
+            pass
+
+    dates, indexes = np.unique(np.array(dates, dtype=np.int64), return_index=True)
+    return dates, np.array(sgvs, dtype=np.float64)[indexes]
+
+
+def reduce_readings(dates, sgvs, tail=()):
+    """
+    reduces readings into aggregates of gaps, outliers and noise
+    :param dates: sorted int64 array of dates (milliseconds since epoch)
+    :param sgvs: float array of sgv (mg/dL)
+    :param tail: last readings ([date, sgv]) of previous window, joined with this window
+    :return: dict of aggregates of this window
+    """
+    tail = [reading for reading in tail if not len(dates) or reading[0] < dates[0]]
+    dates = np.concatenate([np.array([reading[0] for reading in tail], dtype=np.int64), dates])
+    sgvs = np.concatenate([np.array([reading[1] for reading in tail], dtype=np.float64), sgvs])
+
+    minutes = np.diff(dates) / 60000
+    gaps = minutes > GAP_MINUTES
+    rates = np.abs(np.diff(sgvs)) / np.maximum(minutes, 1)
+    # second differences only over regular intervals, gaps aren`t noise
+    regular = ~gaps[1:] & ~gaps[:-1]
+    second_differences = np.abs(np.diff(sgvs, 2))[regular]
+
+    return {
+        "readings": len(dates) - len(tail),
+        "gaps": int(gaps.sum()),
+        "missing_minutes": float((minutes[gaps] - READING_MINUTES).sum()),
+        "outliers": int((~gaps & (rates > OUTLIER_RATE)).sum()),
+        "noise_sum": float(second_differences.sum()),
+        "noise_count": len(second_differences),
+        "tail": [[int(date), float(sgv)] for date, sgv in zip(dates[-2:], sgvs[-2:])],
+    }
+
+
+def get_problems(aggregates, minutes):
+    """
+    :param aggregates: dict of aggregates (see AGGREGATE_FIELDS)
+    :param minutes: length of period of aggregates
+    :return: list of descriptions of sensor`s problems (empty if sensor works well or there are too few readings)
+    """
+    if aggregates["readings"] < MIN_READINGS or minutes <= 0:
+        return []
+
+    problems = []
+    if aggregates["missing_minutes"] / minutes > settings.CGM_MAX_GAP_SHARE:
+        problems.append(_("{} signal gaps").format(aggregates["gaps"]))
+    if aggregates["noise_count"] and aggregates["noise_sum"] / aggregates["noise_count"] > settings.CGM_MAX_NOISE:
+        problems.append(_("noisy readings"))
+    if aggregates["outliers"] / aggregates["readings"] > settings.CGM_MAX_OUTLIER_SHARE:
+        problems.append(_("{} sudden jumps").format(aggregates["outliers"]))
+    return problems
+
+
+def update_cgm_session(nightscout_link, sensor_date, patient=None):
+    """
+    fetches (streams) readings newer than already reduced ones and updates rolling aggregates of sensor session
+    :param nightscout_link: link to Nightscout
+    :param sensor_date: aware datetime of last CGM sensor change
+    :param patient: Patient (None - app`s own data)
+    :return: list of sensor`s problems in this window or whole session (None if reading failed)
+    """
+    session, created = CgmSession.objects.get_or_create(patient=patient, defaults={"sensor_change": sensor_date})
+    if session.sensor_change != sensor_date:  # new session replaces aggregates in the same row
+        session = CgmSession(id=session.id, patient=patient, sensor_change=sensor_date)
+        session.save()
+    sensor_change = (sensor_date - EPOCH) // MICROSECOND // 1000
+
+    try:
+        with host_slot(nightscout_link):
+            response = requests.get(nightscout_link + "/api/v1/entries/sgv.txt", stream=True, params={
+                "find[date][$gt]": max(session.last_date, sensor_change), "count": settings.CGM_FETCH_COUNT})
+            with response:
+                if response.status_code != 200:
+                    logger.warning("unsuccessful reading of CGM entries", extra={
+                        "stage": "cgm", "status": response.status_code, "latency": response.elapsed.total_seconds()})
+                    return None
+                dates, sgvs = parse_sgv_lines(response.iter_lines(decode_unicode=True))
+    except requests.exceptions.RequestException as error:
+        logger.error("Nightscout`s API error: %s", error, extra={"stage": "cgm"})
+        return None
+
+    window = reduce_readings(dates, sgvs, json.loads(session.tail))
+    if window["readings"]:
+        window_start = max(session.last_date, sensor_change)
+        for field in AGGREGATE_FIELDS:
+            setattr(session, field, getattr(session, field) + window[field])
+        session.tail = json.dumps(window["tail"])
+        session.last_date = int(dates[-1])
+        session.save()
+    else:
+        window_start = session.last_date
+
+    window_problems = get_problems(window, (session.last_date - window_start) / 60000)
+    session_aggregates = {field: getattr(session, field) for field in AGGREGATE_FIELDS}
+    return window_problems or get_problems(session_aggregates, (session.last_date - sensor_change) / 60000)
+
+
+def get_sms_txt_cgm(problems, compact=False):
+    """
+    add warning about degrading CGM sensor to sms`s text
+    :param problems: list of sensor`s problems (see update_cgm_session)
+    :param compact: boolean, if True short text for sms is returned (see compose_sms)
+    :return: part of text for sms notification (empty if there are no problems)
+    """
+    if not problems:
+        return ""
+    if compact:
+        return _("CGM sensor may be degrading.")
+    return _("\n\n CGM sensor may be degrading ({}), consider changing it earlier.").format(", ".join(problems))
@@ -1,104 +1,243 @@
-import sys
+import logging
+import math
 from datetime import datetime, timedelta, timezone, time
 
 from django.conf import settings
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import ugettext as _
 
-from .models import InfusionChanged, SensorChanged, LastTriggerSet, TriggerTime
+from .models import InfusionChanged, SensorChanged, LastTriggerSet, TriggerTime, NightscoutSync, ChangeHistory
+from .vectorized import calculate_remaining_batch
+from .wear_statistics import observe_change
 
+logger = logging.getLogger(__name__)
 
-def process_nightscouts_api_response(response):
+
+def process_nightscouts_api_response(response, patient=None):
     """
     process nightscout`s response and return date and time of last change of infusion set and CGM sensor
     saves it in database
     if data not in response, get from database (if present)
 
     :param response: response from nightscout`s API
+    :param patient: Patient, whose data is processed (None - app`s own data)
     :return: last change date and time
     """
     if response.status_code == 200:
-        inf_date = None
-        sensor_date = None
-
-        response_text = response.json()
-
-        for set in response_text:
-            try:
-                if inf_date is None and set['notes'] == "Reservoir changed":
-                    inf_date = set["created_at"]
-                    InfusionChanged.objects.update_or_create(id=1, defaults={"date": inf_date, })
-                elif sensor_date is None and set['notes'] == "Sensor changed":
-                    sensor_date = set['created_at']
-                    SensorChanged.objects.update_or_create(id=1, defaults={"date": sensor_date, })
-            except KeyError:
-                pass
+        return process_treatments(response.json(), patient)
 
-        try:
-            inf_date = InfusionChanged.objects.get(id=1).date
-        except InfusionChanged.DoesNotExist:
-            print(_("warning: infusion set change has never been cached"))
-            sys.stdout.flush()
 
+def process_treatments(treatments, patient=None, only_newer=False):
+    """
+    process nightscout`s treatments (newest first)
+    and return date and time of last change of infusion set and CGM sensor
+    saves it in database
+    if data not in treatments, get from database (if present)
+
+    :param treatments: list of treatments from nightscout`s API
+    :param patient: Patient, whose data is processed (None - app`s own data)
+    :param only_newer: boolean, if True cached changes are replaced only with newer ones
+                       (treatments pushed by uploaders may come out of order)
+    :return: last change date and time
+    """
+    inf_date = None
+    sensor_date = None
+    history = []
+
+    NightscoutSync.objects.update_or_create(patient=patient, defaults={"date": datetime.now(timezone.utc)})
+
+    for set in treatments:
         try:
-            sensor_date = SensorChanged.objects.get(id=1).date
-        except SensorChanged.DoesNotExist:
-            print(_("warning: CGM sensor change has never been cached"))
-            sys.stdout.flush()
+            if set['notes'] in ("Reservoir changed", "Sensor changed"):
+                history.append(ChangeHistory(kind="infusion" if set['notes'] == "Reservoir changed" else "sensor",
+                                             date=parse_datetime(set["created_at"]), treatment_id=set.get("_id", ""),
+                                             patient=patient))
+            if inf_date is None and set['notes'] == "Reservoir changed":
+                inf_date = set["created_at"]
+                observe_change("infusion", parse_datetime(inf_date), patient)
+                if not (only_newer and InfusionChanged.objects.filter(patient=patient, date__gte=inf_date).exists()):
+                    InfusionChanged.objects.update_or_create(patient=patient, defaults={"date": inf_date, })
+            elif sensor_date is None and set['notes'] == "Sensor changed":
+                sensor_date = set['created_at']
+                observe_change("sensor", parse_datetime(sensor_date), patient)
+                if not (only_newer and SensorChanged.objects.filter(patient=patient, date__gte=sensor_date).exists()):
+                    SensorChanged.objects.update_or_create(patient=patient, defaults={"date": sensor_date, })
+        except KeyError:
+            pass
+
+    save_history(history, patient)
+    return get_cached_dates(patient)
+
 
-        return inf_date, sensor_date
+def save_history(history, patient=None):
+    """
+    saves changes, which aren`t in history yet
+    :param history: list of ChangeHistory (not saved)
+    :param patient: Patient, whose history it is (None - app`s own data)
+    :return: number of saved changes
+    """
+    # one lookup, because unique_together doesn`t catch duplicates of rows without patient (NULL)
+    existing = {(kind, date) for kind, date in ChangeHistory.objects.filter(
+        patient=patient, date__in=[change.date for change in history]).values_list("kind", "date")}
+    new = {(change.kind, change.date): change for change in history if (change.kind, change.date) not in existing}
+    ChangeHistory.objects.bulk_create(list(new.values()), ignore_conflicts=True)
+    return len(new)
 
 
-def calculate_infusion(date):
+def get_cached_dates(patient=None):
+    """
+    reads last change dates from database
+    :param patient: Patient (None - app`s own data)
+    :return: last change date and time of infusion set and CGM sensor (None if never cached)
+    """
+    inf_date = None
+    sensor_date = None
+
+    try:
+        inf_date = InfusionChanged.objects.get(patient=patient).date
+    except InfusionChanged.DoesNotExist:
+        logger.warning("infusion set change has never been cached", extra={"stage": "infusion"})
+
+    try:
+        sensor_date = SensorChanged.objects.get(patient=patient).date
+    except SensorChanged.DoesNotExist:
+        logger.warning("CGM sensor change has never been cached", extra={"stage": "sensor"})
+
+    return inf_date, sensor_date
+
+
+def calculate_infusion(date, frequency=None):
     """
     calculates next change of infusion set
     :param date: datetime of previous change of infusion set
+    :param frequency: hours between changes, defaults to INFUSION_SET_ALERT_FREQUENCY
     :return: time remains to next change
     """
-    infusion = timedelta(hours=settings.INFUSION_SET_ALERT_FREQUENCY)
-    infusion_alert_date = date + infusion
-    infusion_time_remains = infusion_alert_date - datetime.now(timezone.utc)
+    remaining = calculate_remaining_batch([date], frequency or settings.INFUSION_SET_ALERT_FREQUENCY)["remaining"]
+    return timedelta(microseconds=int(remaining[0]))
 
-    return infusion_time_remains
 
-
-def calculate_sensor(date):
+def calculate_sensor(date, frequency=None):
     """
     calculates next change of CGM sensor
     :param date:  datetime of previous change of CGM sensor
+    :param frequency: hours between changes, defaults to SENSOR_ALERT_FREQUENCY
     :return: time remains to next change
     """
-    sensor = timedelta(hours=settings.SENSOR_ALERT_FREQUENCY)
-    sensor_alert_date = date + sensor
-    sensor_time_remains = sensor_alert_date - datetime.now(timezone.utc)
+    remaining = calculate_remaining_batch([date], frequency or settings.SENSOR_ALERT_FREQUENCY)["remaining"]
+    return timedelta(microseconds=int(remaining[0]))
 
-    return sensor_time_remains
+
+def seconds_or_none(time_remains):
+    """
+    :param time_remains: timedelta or None
+    :return: whole seconds of timedelta or None
+    """
+    if time_remains is None:
+        return None
+    return int(time_remains.total_seconds())
 
 
-def get_sms_txt_infusion_set(time_remains):
+def get_reminder_instants(date, sensor_date, now=None):
+    """
+    calculates future instants worth notifying about (REMINDER_OFFSETS hours before next changes)
+    :param date: datetime of previous change of infusion set or None
+    :param sensor_date: datetime of previous change of CGM sensor or None
+    :param now: aware datetime, defaults to current time
+    :return: sorted list of (kind, change date, offset in hours, instant) tuples
+    """
+    now = now or datetime.now(timezone.utc)
+    instants = []
+
+    for kind, change_date, frequency in (("infusion", date, settings.INFUSION_SET_ALERT_FREQUENCY),
+                                         ("sensor", sensor_date, settings.SENSOR_ALERT_FREQUENCY)):
+        if change_date is None:
+            continue
+        due_date = change_date + timedelta(hours=frequency)
+        for offset in settings.REMINDER_OFFSETS:
+            instant = due_date - timedelta(hours=offset)
+            if instant > now:
+                instants.append((kind, change_date, offset, instant))
+
+    return sorted(instants, key=lambda reminder: reminder[3])
+
+
+def get_status(now=None):
+    """
+    builds compact status of infusion set and CGM sensor from cached dates (without Nightscout`s API call)
+    remaining time and data age are given in whole hours, so status changes at most once an hour
+
+    :param now: aware datetime of status, defaults to current time
+    :return: status dict and seconds remaining to its next visible change (None if it will not change)
+    """
+    now = now or datetime.now(timezone.utc)
+    status = {}
+    changes_in = []
+
+    for name, model, frequency in (("infusion", InfusionChanged, settings.INFUSION_SET_ALERT_FREQUENCY),
+                                   ("sensor", SensorChanged, settings.SENSOR_ALERT_FREQUENCY)):
+        try:
+            date = model.objects.get(patient=None).date
+        except model.DoesNotExist:
+            status[name] = None
+            continue
+        due_date = date + timedelta(hours=frequency)
+        remains = (due_date - now).total_seconds()
+        status[name] = {
+            "changed_at": date.isoformat(),
+            "due_at": due_date.isoformat(),
+            "remaining_hours": math.floor(remains / 3600),
+            "overdue": remains < 0,
+        }
+        changes_in.append(remains % 3600)
+
+    try:
+        age = (now - NightscoutSync.objects.get(patient=None).date).total_seconds()
+        status["data_age_hours"] = math.floor(age / 3600)
+        changes_in.append(3600 - age % 3600)
+    except NightscoutSync.DoesNotExist:
+        status["data_age_hours"] = None
+
+    if not changes_in:
+        return status, None
+    return status, max(math.ceil(min(changes_in)), 1)
+
+
+def get_sms_txt_infusion_set(time_remains, compact=False):
     """
      add info about next change of infusion set to sms`s text
     :param time_remains: timedelta to next change
+    :param compact: boolean, if True short text for sms is returned (see compose_sms)
     :return: part of text for sms notification
     """
     days = time_remains.days
+    hours = round(time_remains.seconds / 3600)
+    if compact:
+        if days < 0:
+            return _("Infusion set: change overdue.")
+        return _("Infusion set: change in {}d {}h.").format(days, hours)
     if days < 0:
         return _(".\n\n Your infusion set change has already passed")
-    hours = round(time_remains.seconds / 3600)
     text = _(".\n\n Your infusion set should be changed in {} days and {} hours.").format(days, hours)
 
     return text
 
 
-def get_sms_txt_sensor(time_remains):
+def get_sms_txt_sensor(time_remains, compact=False):
     """
     add info about next change of CGM sensor to sms`s text
     :param time_remains: timedelta to next change
+    :param compact: boolean, if True short text for sms is returned (see compose_sms)
     :return: part of text for sms notification
     """
     days = time_remains.days
+    hours = round(time_remains.seconds / 3600)
+    if compact:
+        if days < 0:
+            return _("CGM sensor: change overdue.")
+        return _("CGM sensor: change in {}d {}h.").format(days, hours)
     if days < 0:
         return _("\n\n Your CGM sensor change has already passed")
-    hours = round(time_remains.seconds / 3600)
     text = _("\n\n Your CGM sensor should be changed in {} days and {} hours.").format(days, hours)
 
     return text
@@ -0,0 +1,27 @@
+from django.conf import settings
+
+
+def set_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    receiver of connection_created signal, sets SQLITE_PRAGMAS on new SQLite connection
+    (WAL lets requests read while reminder writes, instead of "database is locked")
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute("PRAGMA {} = {}".format(pragma, value))
+
+
+class QueryCounter:
+    """
+    execute wrapper counting database queries
+    usage: with connection.execute_wrapper(counter): ...
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
@@ -2,6 +2,8 @@ from functools import wraps
 
 from django.conf import settings
 from django.http import HttpResponseForbidden
+from django.utils import translation
+from django.utils.crypto import constant_time_compare
 from django.utils.translation import LANGUAGE_SESSION_KEY
 
 
@@ -19,12 +21,36 @@ def secret_key_required(view_func):
     return _required
 
 
+def machine_key_required(view_func):
+    """
+    authorization decorator for machine-invoked endpoints
+    key is read from X-Reminder-Key header
+    (or from ?key= for schedulers which can`t set headers, e.g. atrigger.com)
+    activates LANGUAGE_CODE, because lean endpoints skip session and locale middleware
+    """
+
+    @wraps(view_func)
+    def _required(request, *args, **kwargs):
+        their_key = request.META.get("HTTP_X_REMINDER_KEY") or request.GET.get("key", "")
+        if not constant_time_compare(their_key, settings.SECRET_KEY):
+            return HttpResponseForbidden()
+        with translation.override(settings.LANGUAGE_CODE):
+            return view_func(request, *args, **kwargs)
+
+    return _required
+
+
 def set_language_to_LANGUAGE_CODE(view_func):
     """ setting language to LANGUAGE_CODE decorator """
 
     @wraps(view_func)
     def _set(request, *args, **kwargs):
-        request.session[LANGUAGE_SESSION_KEY] = settings.LANGUAGE_CODE
+        translation.activate(settings.LANGUAGE_CODE)
+        request.LANGUAGE_CODE = settings.LANGUAGE_CODE
+        session = getattr(request, "session", None)
+        # writing to the session makes it dirty (one more database write per request), so only stale values are fixed
+        if session is not None and session.get(LANGUAGE_SESSION_KEY, settings.LANGUAGE_CODE) != settings.LANGUAGE_CODE:
+            session[LANGUAGE_SESSION_KEY] = settings.LANGUAGE_CODE
         return view_func(request, *args, **kwargs)
 
     return _set
@@ -0,0 +1,144 @@
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+from django.shortcuts import reverse
+
+from .models import SmsDelivery
+
+logger = logging.getLogger(__name__)
+
+# order of Twilio`s message statuses, older status doesn`t replace newer one (callbacks may come out of order)
+STATUS_RANKS = {"accepted": 0, "queued": 1, "sending": 2, "sent": 3,
+                "delivered": 4, "undelivered": 4, "failed": 4, "read": 5}
+UNDELIVERED = ("undelivered", "failed")
+
+# callbacks buffered in memory of worker process, see record_status
+_lock = threading.Lock()
+_buffer = {}  # sid -> (to, status, error code)
+_timer = [None]  # pending background flush
+_exit_flush = [False]  # flush at exit of process is registered
+
+
+def get_public_url(path):
+    """
+    :param path: path with query string
+    :return: url of app on heroku.com (as seen by Twilio, app itself is behind https proxy)
+    """
+    return "https://{}.herokuapp.com{}".format(settings.APP_NAME, path)
+
+
+def get_status_callback_url():
+    """
+    :return: url of delivery-receipt endpoint given to Twilio with every message (None if DELIVERY_RECEIPTS is off)
+    """
+    if not settings.DELIVERY_RECEIPTS:
+        return None
+    return get_public_url(reverse("api-twilio-status"))
+
+
+def record_status(sid, to, status, error_code=None):
+    """
+    buffers status of message, buffer is saved when it has DELIVERY_BATCH_SIZE messages,
+    by background timer DELIVERY_FLUSH_INTERVAL seconds after first buffered status, and at exit of process
+    (so statuses are seen by other processes, e.g. run_reminder --retry-undelivered, after at most the interval)
+    :param sid: Twilio`s message SID
+    :param to: recipient`s phone number
+    :param status: Twilio`s status of message
+    :param error_code: Twilio`s error code or None
+    """
+    with _lock:
+        previous = _buffer.get(sid)
+        if previous is None or STATUS_RANKS.get(status, 0) >= STATUS_RANKS.get(previous[1], 0):
+            _buffer[sid] = (to, status, error_code)
+        due = len(_buffer) >= settings.DELIVERY_BATCH_SIZE
+        if not due and _timer[0] is None:
+            _timer[0] = threading.Timer(settings.DELIVERY_FLUSH_INTERVAL, flush_in_background)
+            _timer[0].daemon = True
+            _timer[0].start()
+            if not _exit_flush[0]:
+                atexit.register(flush_in_background)
+                _exit_flush[0] = True
+    if due:
+        flush_statuses()
+
+
+def flush_in_background():
+    """ flushes statuses outside of request (timer thread, exit of process), errors are logged """
+    try:
+        flush_statuses()
+    except Exception:
+        logger.exception("delivery statuses not saved", extra={"stage": "delivery"})
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()  # connection of timer thread
+
+
+def flush_statuses():
+    """
+    saves buffered statuses with one lookup, one bulk update and one bulk insert
+    :return: number of saved messages
+    """
+    with _lock:
+        statuses = dict(_buffer)
+        _buffer.clear()
+        timer, _timer[0] = _timer[0], None
+    if timer is not None and timer is not threading.current_thread():
+        timer.cancel()
+    if not statuses:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    existing = SmsDelivery.objects.in_bulk(list(statuses), field_name="sid")
+    changed = []
+    new = []
+    for sid, (to, status, error_code) in statuses.items():
+        delivery = existing.get(sid)
+        if delivery is None:
+            new.append(SmsDelivery(sid=sid, to=to, status=status, error_code=error_code, date=now, updated=now))
+        elif STATUS_RANKS.get(status, 0) >= STATUS_RANKS.get(delivery.status, 0):
+            delivery.status, delivery.error_code, delivery.updated = status, error_code, now
+            delivery.to = to or delivery.to
+            changed.append(delivery)
+    SmsDelivery.objects.bulk_update(changed, ["to", "status", "error_code", "updated"])
+    SmsDelivery.objects.bulk_create(new, ignore_conflicts=True)
+    return len(statuses)
+
+
+def get_delivery_rates(days=None):
+    """
+    statuses still buffered (for at most DELIVERY_FLUSH_INTERVAL seconds) aren`t counted,
+    so menu doesn`t save them in request
+    :param days: counted days, defaults to DELIVERY_STATISTICS_DAYS
+    :return: list of dicts with "to", "total", "delivered", "undelivered" and "rate" (None if nothing is final),
+             one for each recipient
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=days or settings.DELIVERY_STATISTICS_DAYS)
+    rows = SmsDelivery.objects.filter(date__gte=since).values("to").annotate(
+        total=Count("id"), delivered=Count("id", filter=Q(status="delivered")),
+        undelivered=Count("id", filter=Q(status__in=UNDELIVERED))).order_by("to")
+    rates = []
+    for row in rows:
+        final = row["delivered"] + row["undelivered"]
+        rates.append(dict(row, rate=row["delivered"] / final if final else None))
+    return rates
+
+
+def get_undelivered_recipients(hours=None, to_numbers=None):
+    """
+    :param hours: checked hours, defaults to DELIVERY_RETRY_HOURS
+    :param to_numbers: current recipients, defaults to TO_NUMBERS (removed numbers aren`t retried)
+    :return: recipients, whose latest message of last hours hasn`t been delivered
+    """
+    flush_statuses()
+    since = datetime.now(timezone.utc) - timedelta(hours=hours or settings.DELIVERY_RETRY_HOURS)
+    deliveries = SmsDelivery.objects.filter(date__gte=since,
+                                            to__in=settings.TO_NUMBERS if to_numbers is None else to_numbers)
+    latest = {}
+    for to, status in deliveries.order_by("date", "id").values_list("to", "status"):
+        latest[to] = status
+    return [to for to, status in latest.items() if status in UNDELIVERED]
@@ -0,0 +1,104 @@
+import csv
+import json
+from datetime import timedelta
+
+import requests
+from django.utils.dateparse import parse_datetime
+
+from .data_processing import save_history
+from .models import ChangeHistory
+from .simulation import CHANGE_NOTES
+from .tenancy import get_config, host_slot
+from .treatment_store import get_store_path, load_records, to_change_arrays
+from .vectorized import EPOCH
+
+EXPORT_FIELDS = ("kind", "date", "interval_hours", "treatment_id")
+CHUNK_SIZE = 2000  # rows fetched from database cursor at once
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def backfill_changes(patient=None, count=0):
+    """
+    fills history of changes made before it was recorded (it`s filled only from later fetches otherwise)
+    from TREATMENT_STORE and optionally from Nightscout`s API
+    :param patient: Patient (None - app`s own data)
+    :param count: number of newest treatments fetched from Nightscout (0 - only store is read)
+    :return: number of changes added to history
+    :raises requests.exceptions.RequestException: if Nightscout`s API can`t be read
+    """
+    history = []
+    for kind, dates in to_change_arrays(load_records(get_store_path(patient))).items():
+        history.extend(ChangeHistory(kind=kind, date=EPOCH + timedelta(microseconds=int(date)), patient=patient)
+                       for date in dates)
+
+    if count:
+        link = get_config(patient).nightscout_link
+        with host_slot(link):
+            response = requests.get(link + "/api/v1/treatments", params={"count": count})
+        response.raise_for_status()
+        kinds = {notes: kind for kind, notes in CHANGE_NOTES.items()}
+        for treatment in response.json():
+            date = parse_datetime(treatment.get("created_at") or "")
+            if treatment.get("notes") in kinds and date is not None:
+                history.append(ChangeHistory(kind=kinds[treatment["notes"]], date=date,
+                                             treatment_id=treatment.get("_id", ""), patient=patient))
+
+    # fetched changes go last, so they (with treatment_id) win over store`s ones of same date
+    return save_history(history, patient)
+
+
+class Echo:
+    """ pseudo-buffer for csv.writer, which returns written line instead of storing it """
+
+    def write(self, value):
+        return value
+
+
+def iter_changes(patient=None):
+    """
+    iterates over history of changes with server-side cursor (memory doesn`t grow with number of rows)
+    :param patient: Patient (None - app`s own data)
+    :return: generator of dicts with EXPORT_FIELDS, interval_hours is wear time since previous change of same kind
+    """
+    previous = {}
+    changes = ChangeHistory.objects.filter(patient=patient).order_by("kind", "date") \
+        .values_list("kind", "date", "treatment_id").iterator(chunk_size=CHUNK_SIZE)
+    for kind, date, treatment_id in changes:
+        interval = None
+        if kind in previous:
+            interval = round((date - previous[kind]).total_seconds() / 3600, 2)
+        previous[kind] = date
+        yield {"kind": kind, "date": date.isoformat(), "interval_hours": interval, "treatment_id": treatment_id}
+
+
+def iter_csv(rows):
+    """
+    :param rows: iterable of dicts with EXPORT_FIELDS
+    :return: generator of CSV lines (with header)
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(["" if row[field] is None else row[field] for field in EXPORT_FIELDS])
+
+
+def iter_ndjson(rows):
+    """
+    :param rows: iterable of dicts with EXPORT_FIELDS
+    :return: generator of JSON lines
+    """
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+def iter_export(export_format, patient=None):
+    """
+    :param export_format: "csv" or "ndjson"
+    :param patient: Patient (None - app`s own data)
+    :return: generator of exported lines
+    """
+    rows = iter_changes(patient)
+    return iter_csv(rows) if export_format == "csv" else iter_ndjson(rows)
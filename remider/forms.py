@@ -23,6 +23,14 @@ class ChangeEnvVariableForm(forms.Form):
     new_value = forms.CharField(required=True)
 
 
+class RecipientForm(forms.Form):
+    """ form for one recipient (phone number or IFTTT maker) of recipients` formset """
+    value = forms.CharField(required=False, label="")
+
+
+RecipientFormSet = forms.formset_factory(RecipientForm, extra=1, can_delete=True)
+
+
 class ChooseNotificationsWayForm(forms.Form):
     """ form for choosing notifications way """
     ifttt_notifications = forms.BooleanField(required=False, label=_("TRIGGER IFTTT (SEND WEBHOOKS)"))
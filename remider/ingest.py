@@ -0,0 +1,131 @@
+import json
+import logging
+
+from django.core.exceptions import RequestDataTooBig
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .data_processing import process_treatments, get_cached_dates
+from .treatment_store import append_treatments
+from .vectorized import EPOCH
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = " \t\r\n,[]"  # between treatments of JSON array or NDJSON lines
+
+
+class LimitedReader:
+    """ file-like wrapper of stream, which raises RequestDataTooBig when more than limit bytes are read """
+
+    def __init__(self, stream, limit):
+        """
+        :param stream: file-like object with read method (e.g. HttpRequest)
+        :param limit: maximal number of bytes
+        """
+        self.stream = stream
+        self.remaining = limit
+
+    def read(self, size):
+        chunk = self.stream.read(min(size, self.remaining + 1))
+        self.remaining -= len(chunk)
+        if self.remaining < 0:
+            raise RequestDataTooBig("body of request is too large")
+        return chunk
+
+
+def iter_json_objects(stream, chunk_size=CHUNK_SIZE):
+    """
+    parses stream of NDJSON lines or JSON array of objects chunk by chunk (body isn`t read into memory at once)
+    :param stream: file-like object with read method (e.g. HttpRequest)
+    :param chunk_size: bytes read at once
+    :return: generator of parsed objects
+    :raises ValueError: if stream isn`t valid JSON
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    tail = b""  # incomplete utf-8 character at the end of chunk
+    finished = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+        if position < len(buffer):
+            try:
+                obj, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if finished:
+                    raise
+            else:
+                # number or literal at the end of chunk may be incomplete, objects are closed by brace
+                if isinstance(obj, dict) or end < len(buffer) or finished:
+                    yield obj
+                    position = end
+                    continue
+        elif finished:
+            return
+
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            if tail:
+                raise ValueError("incomplete utf-8 character")
+            finished = True
+            continue
+        chunk, tail = tail + chunk, b""
+        try:
+            text = chunk.decode("utf-8")
+        except UnicodeDecodeError as error:
+            if error.reason != "unexpected end of data":
+                raise ValueError(error)
+            text, tail = chunk[:error.start].decode("utf-8"), chunk[error.start:]
+        buffer, position = buffer[position:] + text, 0
+
+
+def dedupe_treatments(treatments):
+    """
+    :param treatments: iterable of treatments (dicts)
+    :return: list of treatments unique by Nightscout`s _id (treatments without _id are kept), newest first
+             and number of duplicates
+    :raises ValueError: if treatment isn`t an object or its created_at isn`t a valid date
+    """
+    seen = set()
+    unique = []
+    duplicates = 0
+    for treatment in treatments:
+        if not isinstance(treatment, dict):
+            raise ValueError("treatment must be an object")
+        created_at = treatment.get("created_at")
+        date = parse_datetime(created_at) if isinstance(created_at, str) else None  # ValueError if out of range
+        if created_at is not None and date is None:
+            raise ValueError("invalid created_at of treatment: {!r}".format(created_at))
+        treatment_id = treatment.get("_id")
+        if treatment_id in seen:
+            duplicates += 1
+            continue
+        if treatment_id is not None:
+            seen.add(treatment_id)
+        unique.append((date or EPOCH, treatment))
+
+    unique.sort(key=lambda pair: pair[0], reverse=True)
+    return [treatment for date, treatment in unique], duplicates
+
+
+def ingest_treatments(stream, patient=None):
+    """
+    parses and saves treatments pushed by uploader in one transaction
+    :param stream: file-like object with NDJSON or JSON array of treatments
+    :param patient: Patient (None - app`s own data)
+    :return: list of ingested (unique) treatments, number of duplicates
+             and boolean, True if cached date of last change has moved
+    :raises ValueError: if stream isn`t valid
+    """
+    treatments, duplicates = dedupe_treatments(iter_json_objects(stream))
+    with transaction.atomic():
+        previous_dates = get_cached_dates(patient)
+        changed = process_treatments(treatments, patient, only_newer=True) != previous_dates
+    try:
+        append_treatments(treatments, patient)
+    except OSError:
+        logger.exception("treatment store not updated", extra={"stage": "ingest"})
+    return treatments, duplicates, changed
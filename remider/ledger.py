@@ -0,0 +1,94 @@
+import math
+import re
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import NotificationLedger
+
+
+def get_bucket(time_remains):
+    """
+    threshold bucket of remaining time, notification is repeated only when it moves to the next bucket:
+    the smallest of REMINDER_OFFSETS not below remaining hours, whole days further from change
+    and every started day after overdue change
+    :param time_remains: timedelta to next change
+    :return: bucket in hours
+    """
+    hours = math.ceil(time_remains.total_seconds() / 3600)
+    if hours < 0:
+        return hours // 24 * 24
+    offsets = [offset for offset in settings.REMINDER_OFFSETS if offset >= hours]
+    if offsets:
+        return min(offsets)
+    return math.ceil(hours / 24) * 24
+
+
+def get_problems_bucket(problems):
+    """
+    :param problems: list of CGM sensor`s problems (see update_cgm_session)
+    :return: checksum of set of problems, counts of gaps and jumps are left out (they grow during session)
+    """
+    kinds = sorted({re.sub(r"\d+", "", problem).strip() for problem in problems})
+    return zlib.crc32("\n".join(kinds).encode()) & 0x7fffffff  # fits in IntegerField
+
+
+def get_events(date, infusion_time_remains, sensor_date, sensor_time_remains, cgm_problems=None,
+               reservoir_forecast=None):
+    """
+    :param date: datetime of previous change of infusion set or None
+    :param infusion_time_remains: timedelta to next change of infusion set or None
+    :param sensor_date: datetime of previous change of CGM sensor or None
+    :param sensor_time_remains: timedelta to next change of CGM sensor or None
+    :param cgm_problems: list of CGM sensor`s problems or None (see update_cgm_session)
+    :param reservoir_forecast: result of forecast_reservoir or None
+    :return: list of (kind, change date, bucket) tuples, which notification is about
+    """
+    events = []
+    for kind, change_date, time_remains in (("infusion", date, infusion_time_remains),
+                                            ("sensor", sensor_date, sensor_time_remains)):
+        if change_date is not None and time_remains is not None:
+            events.append((kind, change_date, get_bucket(time_remains)))
+    if cgm_problems and sensor_date is not None:
+        events.append(("cgm", sensor_date, get_problems_bucket(cgm_problems)))
+    if reservoir_forecast is not None and reservoir_forecast["empty_in"] is not None:
+        empty_in = timedelta(microseconds=reservoir_forecast["empty_in"])
+        events.append(("reservoir", reservoir_forecast["changed"], get_bucket(empty_in)))
+    return events
+
+
+def get_pending_recipients(recipients, events):
+    """
+    checks all recipients with one query
+    :param recipients: list of phone numbers or IFTTT maker`s keys
+    :param events: list of (kind, change date, bucket) tuples
+    :return: recipients, who haven`t been notified about all of events (all recipients if there are no events)
+    """
+    if not settings.NOTIFICATION_DEDUPE or not events or not recipients:
+        return list(recipients)
+
+    query = Q()
+    for kind, change_date, bucket in events:
+        query |= Q(kind=kind, change_date=change_date, bucket=bucket)
+    sent = {}
+    for recipient, kind, change_date, bucket in NotificationLedger.objects.filter(query, recipient__in=recipients)\
+            .values_list("recipient", "kind", "change_date", "bucket"):
+        sent.setdefault(recipient, set()).add((kind, change_date, bucket))
+    return [recipient for recipient in recipients if not sent.get(recipient, set()).issuperset(events)]
+
+
+def record_notifications(recipients, events):
+    """
+    saves notified recipients and removes entries older than NOTIFICATION_LEDGER_DAYS
+    :param recipients: list of phone numbers or IFTTT maker`s keys, which have been notified
+    :param events: list of (kind, change date, bucket) tuples
+    """
+    if not settings.NOTIFICATION_DEDUPE or not events:
+        return
+    now = datetime.now(timezone.utc)
+    NotificationLedger.objects.bulk_create([
+        NotificationLedger(recipient=recipient, kind=kind, change_date=change_date, bucket=bucket, date=now)
+        for recipient in recipients for kind, change_date, bucket in events], ignore_conflicts=True)
+    NotificationLedger.objects.filter(date__lt=now - timedelta(days=settings.NOTIFICATION_LEDGER_DAYS)).delete()
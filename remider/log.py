@@ -0,0 +1,139 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import uuid
+from contextvars import ContextVar, copy_context
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+# id of request handled by current thread (X-Request-ID of Heroku`s router), None outside of requests
+request_id = ContextVar("request_id", default=None)
+
+# fields of records given with extra={...}
+FIELDS = ("stage", "recipient", "latency", "status")
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """ attaches id of current request to record (runs on thread which logs) """
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ formats record as one line of JSON, which can be aggregated by log drain """
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for field in FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if "latency" in data:
+            data["latency"] = round(data["latency"] * 1000, 1)  # ms
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """ QueueHandler, which drops records when queue is full (request thread never waits for log writing) """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        """ merges args and formats traceback on logging thread, so record can be pickled and args can change """
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """ QueueListener, which waits for free place for its sentinel, so it stops (writing all records) on full queue """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def setup_logging():
+    """
+    configures "remider" logger: records are put in queue by logging thread
+    and formatted and written to stdout by background listener (stopped and drained at exit)
+    :return: started QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    logger = logging.getLogger("remider")
+    logger.setLevel(settings.LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = DrainingQueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def map_in_context(executor, function, items):
+    """
+    like executor.map, but function runs in copy of caller`s context (worker threads don`t inherit request_id)
+    :param executor: concurrent.futures executor
+    :param function: function of one argument
+    :param items: iterable of arguments
+    :return: iterator of results
+    """
+    items = list(items)
+    contexts = [copy_context() for _ in items]  # one context can`t be entered by two threads at once
+    return executor.map(lambda context, item: context.run(function, item), contexts, items)
+
+
+def mask(recipient):
+    """
+    :param recipient: phone number or IFTTT maker`s key
+    :return: last characters of recipient, which are enough to tell recipients apart in logs
+    """
+    recipient = str(recipient)
+    return "*" * min(len(recipient) - 4, 4) + recipient[-4:]
+
+
+def get_request_id(request):
+    """
+    :param request: http request
+    :return: X-Request-ID header (set by Heroku`s router) or new random id
+    """
+    return request.META.get("HTTP_X_REQUEST_ID", "")[:200] or uuid.uuid4().hex
@@ -0,0 +1,45 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext as _
+
+from ...export import CONTENT_TYPES, backfill_changes, iter_export
+from ...models import Patient
+
+
+class Command(BaseCommand):
+    """
+    command for exporting history of changes (rows are streamed, memory doesn`t grow with history)
+    """
+    help = "writes history of infusion set and CGM sensor changes with wear intervals as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(CONTENT_TYPES), default="csv")
+        parser.add_argument("--patient", help="name of patient (if not given, app`s own history is exported)")
+        parser.add_argument("--output", help="path of output file (defaults to standard output)")
+        parser.add_argument("--backfill", type=int, nargs="?", const=0, metavar="COUNT",
+                            help="first fills history with changes from TREATMENT_STORE "
+                                 "and from COUNT newest treatments of Nightscout (if given)")
+
+    def handle(self, *args, **options):
+        patient = None
+        if options["patient"]:
+            try:
+                patient = Patient.objects.get(name=options["patient"])
+            except Patient.DoesNotExist:
+                raise CommandError(_("patient doesn`t exist"))
+
+        if options["backfill"] is not None:
+            try:
+                added = backfill_changes(patient, options["backfill"])
+            except requests.exceptions.RequestException as error:
+                raise CommandError(_("Nightscout`s API error: %s") % error)
+            self.stderr.write(_("{} changes added to history").format(added))
+
+        lines = iter_export(options["format"], patient)
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        with open(options["output"], "w", newline="") as file:
+            file.writelines(lines)
@@ -0,0 +1,124 @@
+import random
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.translation import ugettext as _
+
+from ...api_interactions import send_message
+from ...delivery import get_undelivered_recipients
+from ...pipeline import run_reminder_pipeline, run_patients_tick
+
+# bits of exit code set when stage fails
+STAGE_EXIT_CODES = (
+    ("fetch", 1),
+    ("infusion", 2),
+    ("sensor", 4),
+    ("notify", 8),
+    ("schedule", 16),
+    ("cgm", 32),
+)
+
+
+class Command(BaseCommand):
+    """
+    command for running reminder in-process (without HTTP call to our own website)
+    exit code is a sum of STAGE_EXIT_CODES of failed stages
+    """
+    help = "fetches data from Nightscout, calculates next changes and sends notification in-process"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quiet", action="store_true",
+                            help="don`t send notification nor schedule next trigger (like quiet checkup)")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="like --quiet, but nothing is saved (in database nor TREATMENT_STORE) "
+                                 "and notification text is printed")
+        parser.add_argument("--patients", action="store_true",
+                            help="process all due patients (tenants) concurrently instead of app`s own settings")
+        parser.add_argument("--retry-undelivered", action="store_true",
+                            help="only resend sms to recipients, whose last message hasn`t been delivered "
+                                 "(see DELIVERY_RECEIPTS)")
+        parser.add_argument("--repeat", type=int, default=1, help="number of runs")
+        parser.add_argument("--interval", type=float, default=0, help="seconds between runs")
+        parser.add_argument("--jitter", type=float, default=0, help="random seconds added to every interval")
+
+    def handle(self, *args, **options):
+        exit_code = 0
+        if options["retry_undelivered"]:
+            sys.exit(self.retry_undelivered())
+
+        for run in range(options["repeat"]):
+            if run:
+                time.sleep(options["interval"] + random.uniform(0, options["jitter"]))
+            if options["patients"]:
+                exit_code |= self.run_patients()
+                continue
+            self.stdout.write(self.style.HTTP_INFO(_("running reminder ...")))
+            result = self.run_once(options["quiet"], options["dry_run"])
+            exit_code |= self.report(result["stages"])
+            if options["dry_run"]:
+                self.stdout.write(result["sms_text"])
+                self.stdout.write(_("({} sms segments, {})").format(result["sms_segments"], result["sms_encoding"]))
+
+        if exit_code:
+            sys.exit(exit_code)
+
+    def run_once(self, quiet, dry_run):
+        """
+        runs reminder`s pipeline once
+        :param quiet: boolean, if True notification isn`t sent and trigger isn`t scheduled
+        :param dry_run: boolean, quiet run with database changes rolled back and treatment store untouched
+        :return: result of run_reminder_pipeline
+        """
+        if not dry_run:
+            return run_reminder_pipeline(send_notif=not quiet)
+
+        with transaction.atomic():
+            result = run_reminder_pipeline(send_notif=False, store=False)
+            transaction.set_rollback(True)
+        return result
+
+    def retry_undelivered(self):
+        """
+        sends current notification to recipients, whose last sms hasn`t been delivered
+        :return: exit code of notify stage
+        """
+        to_numbers = get_undelivered_recipients()
+        if not to_numbers:
+            self.stdout.write(_("all sms have been delivered"))
+            return 0
+        result = run_reminder_pipeline(send_notif=False, schedule=False)  # cached dates are used if fetching fails
+        stages = dict.fromkeys(dict(STAGE_EXIT_CODES))
+        stages["fetch"] = result["stages"]["fetch"]
+        stages["notify"] = send_message(result["sms_text"], to_numbers)
+        return self.report(stages)
+
+    def run_patients(self):
+        """
+        runs one tick of due patients
+        :return: exit code of stages failed for any patient
+        """
+        exit_code = 0
+        self.stdout.write(self.style.HTTP_INFO(_("running reminder for due patients ...")))
+        for name, stages in run_patients_tick().items():
+            self.stdout.write(self.style.HTTP_INFO(name))
+            exit_code |= self.report(stages)
+        return exit_code
+
+    def report(self, stages):
+        """
+        writes results of stages
+        :param stages: dict stage name -> boolean (None if skipped)
+        :return: exit code of failed stages
+        """
+        exit_code = 0
+        for stage, code in STAGE_EXIT_CODES:
+            if stages[stage] is None:
+                self.stdout.write("{}: {}".format(stage, _("skipped")))
+            elif stages[stage]:
+                self.stdout.write(self.style.SUCCESS("{}: {}".format(stage, _("OK"))))
+            else:
+                exit_code |= code
+                self.stdout.write(self.style.ERROR("{}: {}".format(stage, _("FAILED"))))
+        return exit_code
@@ -0,0 +1,92 @@
+import itertools
+import json
+import time
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_time
+from django.utils.translation import ugettext as _
+
+from ...data_processing import get_trigger_model
+from ...simulation import get_change_arrays, simulate_policy
+from ...treatment_store import get_store_path, load_records, to_change_arrays
+from ...vectorized import to_microseconds
+
+
+class Command(BaseCommand):
+    """
+    command for replaying reminder policies over history of treatments
+    """
+    help = "replays daily notifications over treatments history and reports alerts of every policy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="JSON file with treatments (if not given, they are fetched from Nightscout)")
+        parser.add_argument("--store", action="store_true",
+                            help="read treatments from local store (TREATMENT_STORE) instead of Nightscout")
+        parser.add_argument("--count", type=int, default=100000, help="number of fetched treatments")
+        parser.add_argument("--infusion-frequency", type=float, nargs="+",
+                            help="hours between infusion set changes (defaults to INFUSION_SET_ALERT_FREQUENCY)")
+        parser.add_argument("--sensor-frequency", type=float, nargs="+",
+                            help="hours between CGM sensor changes (defaults to SENSOR_ALERT_FREQUENCY)")
+        parser.add_argument("--trigger-time", nargs="+", help="UTC times of notification, e.g. 16:00")
+        parser.add_argument("--lead", type=float, nargs="+", default=[24],
+                            help="hours before due date, from which notification warns about change")
+
+    def handle(self, *args, **options):
+        if options["store"]:
+            if get_store_path() is None:
+                raise CommandError(_("TREATMENT_STORE isn`t set"))
+            start = time.perf_counter()
+            changes = to_change_arrays(load_records(get_store_path()))
+        else:
+            treatments = self.load_treatments(options["file"], options["count"])
+            start = time.perf_counter()
+            changes = get_change_arrays(treatments)
+        end = to_microseconds([datetime.now(timezone.utc)])[0]
+
+        trigger_times = [parse_time(value) for value in options["trigger_time"] or []]
+        if None in trigger_times:
+            raise CommandError(_("wrong trigger time, use HH:MM format"))
+        trigger_times = trigger_times or [get_trigger_model().time]
+        frequencies = {
+            "infusion": options["infusion_frequency"] or [settings.INFUSION_SET_ALERT_FREQUENCY],
+            "sensor": options["sensor_frequency"] or [settings.SENSOR_ALERT_FREQUENCY],
+        }
+
+        self.stdout.write("{:<9}{:>10}{:>7}{:>6}{:>10}{:>8}{:>8}{:>7}{:>6}{:>13}{:>10}".format(
+            "kind", "frequency", "time", "lead", "messages", "alerts", "missed", "early", "late", "mean offset",
+            "max late"))
+        for kind, kind_frequencies in frequencies.items():
+            for frequency, trigger_time, lead in itertools.product(kind_frequencies, trigger_times, options["lead"]):
+                stats = simulate_policy(changes[kind], frequency, trigger_time, lead, end)
+                self.stdout.write("{:<9}{:>10g}{:>7}{:>6g}{:>10}{:>8}{:>8}{:>7}{:>6}{:>13}{:>10}".format(
+                    kind, frequency, trigger_time.strftime("%H:%M"), lead, stats["messages"], stats["alerts"],
+                    stats["missed"], stats["early"], stats["late"], format_hours(stats["mean_offset"]),
+                    format_hours(stats["max_late"])))
+
+        self.stdout.write(self.style.SUCCESS(_("{} changes replayed in {:.3f} s").format(
+            sum(len(kind_changes) for kind_changes in changes.values()), time.perf_counter() - start)))
+
+    def load_treatments(self, path, count):
+        """
+        :param path: path to JSON file with treatments or None
+        :param count: number of treatments fetched from Nightscout (if path isn`t given)
+        :return: list of treatments
+        """
+        if path:
+            with open(path) as file:
+                return json.load(file)
+
+        response = requests.get(settings.NIGTSCOUT_LINK + "/api/v1/treatments", params={"count": count})
+        if response.status_code != 200:
+            raise CommandError(_("unsuccessful Nightscout`s API reading"))
+        return response.json()
+
+
+def format_hours(hours):
+    """
+    :return: hours formatted to one decimal place or "-" if None
+    """
+    return "-" if hours is None else "{:.1f}h".format(hours)
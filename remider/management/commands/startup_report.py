@@ -0,0 +1,39 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext as _
+
+from ...profiling import measure_startup
+
+
+class Command(BaseCommand):
+    """
+    command for measuring cold start of app (time user waits for sleeping dyno)
+    exits with code 1 if start takes longer than STARTUP_BUDGET
+    """
+    help = "measures import time of modules and app-ready time in fresh interpreter"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="number of slowest modules shown")
+        parser.add_argument("--depth", type=int, default=1, help="maximal depth of shown imports (0 - top level)")
+        parser.add_argument("--budget", type=float, default=settings.STARTUP_BUDGET, help="seconds")
+
+    def handle(self, *args, **options):
+        report = measure_startup()
+
+        modules = [(name, self_time, cumulative) for name, self_time, cumulative in report["modules"]
+                   if (len(name) - len(name.lstrip())) // 2 <= options["depth"]]
+        modules.sort(key=lambda module: module[2], reverse=True)
+        self.stdout.write("{:<60}{:>10}{:>12}".format("module", "self", "cumulative"))
+        for name, self_time, cumulative in modules[:options["top"]]:
+            self.stdout.write("{:<60}{:>8.1f}ms{:>10.1f}ms".format(name, self_time * 1000, cumulative * 1000))
+
+        total = report["setup"] + report["urls"]
+        self.stdout.write(_("django.setup: {:.1f}ms, URLconf and views: {:.1f}ms, total: {:.1f}ms").format(
+            report["setup"] * 1000, report["urls"] * 1000, total * 1000))
+        if total > options["budget"]:
+            self.stdout.write(self.style.ERROR(_("start takes longer than budget ({:.1f}ms)").format(
+                options["budget"] * 1000)))
+            sys.exit(1)
+        self.stdout.write(self.style.SUCCESS(_("start fits in budget ({:.1f}ms)").format(options["budget"] * 1000)))
@@ -11,5 +11,6 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.HTTP_INFO(_("waking up ...")))
-        requests.get("https://{1}.herokuapp.com/reminder/?key={0}".format(settings.SECRET_KEY, settings.APP_NAME))
+        requests.get("https://{}.herokuapp.com/api/reminder/".format(settings.APP_NAME),
+                     headers={"X-Reminder-Key": settings.SECRET_KEY})
         self.stdout.write(self.style.SUCCESS(_("website successfully woke up")))
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+from django.conf import settings
+
+# aggregates are kept in memory of worker process (every gunicorn worker has its own)
+_lock = threading.Lock()
+_tracing = threading.Lock()  # tracemalloc is global, so only one request is traced at a time
+_aggregates = {"views": {}, "stages": {}}
+_traced_peak = [0]  # peak of traced request before StageProfiler reset it
+_rss = deque(maxlen=settings.MEMORY_RSS_SAMPLES)
+
+
+def get_rss():
+    """
+    :return: resident set size of worker process in bytes (None if unknown)
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def sample_rss(now=None):
+    """
+    appends RSS of worker to ring buffer, at most once per MEMORY_RSS_INTERVAL seconds
+    :param now: timestamp, defaults to current time
+    """
+    now = time.time() if now is None else now
+    with _lock:
+        if _rss and now - _rss[-1][0] < settings.MEMORY_RSS_INTERVAL:
+            return
+        rss = get_rss()
+        if rss is not None:
+            _rss.append((now, rss))
+
+
+def record(kind, name, net, peak):
+    """
+    adds one measurement to aggregates
+    :param kind: "views" or "stages"
+    :param name: url name or name of pipeline`s stage
+    :param net: bytes allocated and not freed
+    :param peak: maximal traced bytes (None if unknown)
+    """
+    with _lock:
+        aggregate = _aggregates[kind].setdefault(name, {"count": 0, "net_sum": 0, "net_max": 0,
+                                                        "peak_count": 0, "peak_sum": 0, "peak_max": 0})
+        aggregate["count"] += 1
+        aggregate["net_sum"] += net
+        aggregate["net_max"] = max(aggregate["net_max"], net)
+        if peak is not None:
+            aggregate["peak_count"] += 1
+            aggregate["peak_sum"] += peak
+            aggregate["peak_max"] = max(aggregate["peak_max"], peak)
+
+
+def start_tracing():
+    """
+    starts tracemalloc for one sampled request (MEMORY_PROFILING_RATE)
+    :return: boolean, False if request isn`t traced (not sampled or other request is traced)
+    """
+    if not _tracing.acquire(blocking=False):
+        return False
+    if tracemalloc.is_tracing():  # started outside (e.g. PYTHONTRACEMALLOC), measurements would be mixed
+        _tracing.release()
+        return False
+    _traced_peak[0] = 0
+    tracemalloc.start()
+    return True
+
+
+def stop_tracing():
+    """
+    stops tracemalloc started by start_tracing (frees traces)
+    :return: net and peak bytes allocated while tracing
+    """
+    try:
+        net, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return net, max(peak, _traced_peak[0])
+    finally:
+        _tracing.release()
+
+
+class StageProfiler:
+    """
+    measures allocations between stages of reminder`s pipeline
+    does nothing if request isn`t traced
+    """
+
+    def __init__(self):
+        self.last = self.get_current()
+
+    @staticmethod
+    def get_current():
+        if not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):  # python 3.9+, peak of stage is unknown on older versions
+            _traced_peak[0] = max(_traced_peak[0], peak)
+            tracemalloc.reset_peak()
+        return current
+
+    def mark(self, stage):
+        """
+        records allocations since previous mark (or creation) as allocations of stage
+        :param stage: name of stage, which has just finished
+        """
+        if self.last is None or not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        record("stages", stage, current - self.last, peak - self.last if hasattr(tracemalloc, "reset_peak") else None)
+        self.last = self.get_current()
+
+
+def get_report():
+    """
+    :return: dict with "views" and "stages" (lists of (name, count, mean net, max net, mean peak, max peak) in bytes,
+             biggest peak first, mean peak is None if unknown) and "rss" (list of (timestamp, bytes), oldest first)
+    """
+    def summarize(aggregates):
+        rows = [(name, aggregate["count"], aggregate["net_sum"] / aggregate["count"], aggregate["net_max"],
+                 aggregate["peak_sum"] / aggregate["peak_count"] if aggregate["peak_count"] else None,
+                 aggregate["peak_max"]) for name, aggregate in aggregates.items()]
+        return sorted(rows, key=lambda row: (row[5], row[3]), reverse=True)
+
+    with _lock:
+        return {"views": summarize(_aggregates["views"]), "stages": summarize(_aggregates["stages"]),
+                "rss": list(_rss)}
+
+
+def reset():
+    """ clears aggregates and RSS samples """
+    with _lock:
+        for aggregates in _aggregates.values():
+            aggregates.clear()
+        _rss.clear()
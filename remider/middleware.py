@@ -0,0 +1,123 @@
+import logging
+import random
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connection
+from django.middleware.locale import LocaleMiddleware
+
+from .db import QueryCounter
+from .log import request_id, get_request_id
+from .memory_profiling import sample_rss, start_tracing, stop_tracing, record
+
+logger = logging.getLogger(__name__)
+
+
+def is_lean_request(request):
+    """
+    check if request goes to machine-invoked endpoint
+    :param request: http request
+    :return: boolean
+    """
+    return request.path_info.startswith(settings.LEAN_PATH_PREFIXES)
+
+
+class LeanPathMixin:
+    """
+    mixin for middleware which is useless for machine-invoked endpoints
+    passes requests to LEAN_PATH_PREFIXES straight to the next middleware
+    """
+
+    def __call__(self, request):
+        if is_lean_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class LeanSessionMiddleware(LeanPathMixin, SessionMiddleware):
+    """ SessionMiddleware skipped for machine-invoked endpoints """
+
+
+class LeanLocaleMiddleware(LeanPathMixin, LocaleMiddleware):
+    """ LocaleMiddleware skipped for machine-invoked endpoints """
+
+
+class LeanAuthenticationMiddleware(LeanPathMixin, AuthenticationMiddleware):
+    """ AuthenticationMiddleware skipped for machine-invoked endpoints """
+
+
+class LeanMessageMiddleware(LeanPathMixin, MessageMiddleware):
+    """ MessageMiddleware skipped for machine-invoked endpoints """
+
+
+class MemoryProfileMiddleware:
+    """
+    records allocations of sampled requests (MEMORY_PROFILING_RATE, 0 - disabled) aggregated by url name
+    and RSS of worker, see memory_view
+    content of streaming responses is allocated after middleware returns, so it isn`t counted
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.MEMORY_PROFILING_RATE
+        if not rate:
+            return self.get_response(request)
+
+        sample_rss()
+        if random.random() >= rate or not start_tracing():
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            net, peak = stop_tracing()
+            sample_rss()
+        name = getattr(request.resolver_match, "url_name", None) or request.path_info
+        record("views", name, net, peak)
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    counts database queries of requests and logs views, which exceed QUERY_BUDGETS (url name -> maximal queries)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGETS:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        name = getattr(request.resolver_match, "url_name", None)
+        budget = settings.QUERY_BUDGETS.get(name)
+        if budget is not None and counter.count > budget:
+            logger.warning("view %s made %s database queries (budget: %s)", name, counter.count, budget,
+                           extra={"stage": name})
+        return response
+
+
+class RequestIdMiddleware:
+    """
+    makes id of request (X-Request-ID of Heroku`s router or new one) available to log records
+    and returns it in X-Request-ID header
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.request_id = get_request_id(request)
+        token = request_id.set(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
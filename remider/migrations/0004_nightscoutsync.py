@@ -0,0 +1,20 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0003_triggertime'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NightscoutSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0004_nightscoutsync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TriggerSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=64)),
+                ('time', models.TimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0005_triggerseries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledReminder',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('change_date', models.DateTimeField()),
+                ('offset', models.IntegerField()),
+                ('date', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('kind', 'change_date', 'offset')},
+            },
+        ),
+    ]
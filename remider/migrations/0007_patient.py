@@ -0,0 +1,47 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:13
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0006_scheduledreminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Patient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('nightscout_link', models.URLField()),
+                ('infusion_set_alert_frequency', models.IntegerField(default=72)),
+                ('sensor_alert_frequency', models.IntegerField(default=144)),
+                ('to_numbers', models.TextField(blank=True, help_text='one phone number per line')),
+                ('ifttt_makers', models.TextField(blank=True, help_text='one IFTTT maker key per line')),
+                ('send_sms', models.BooleanField(default=False)),
+                ('trigger_ifttt', models.BooleanField(default=False)),
+                ('trigger_time', models.TimeField(default=datetime.time(16, 0), help_text='UTC')),
+                ('active', models.BooleanField(default=True)),
+                ('last_run', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='infusionchanged',
+            name='patient',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='remider.Patient'),
+        ),
+        migrations.AddField(
+            model_name='nightscoutsync',
+            name='patient',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='remider.Patient'),
+        ),
+        migrations.AddField(
+            model_name='sensorchanged',
+            name='patient',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='remider.Patient'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0007_patient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WearStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('last_change', models.DateTimeField(blank=True, null=True)),
+                ('count', models.IntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('m2', models.FloatField(default=0)),
+                ('early', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('histogram', models.TextField(default='[]')),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='remider.Patient')),
+            ],
+            options={
+                'unique_together': {('kind', 'patient')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0008_wearstatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CgmSession',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_change', models.DateTimeField()),
+                ('last_date', models.BigIntegerField(default=0)),
+                ('readings', models.IntegerField(default=0)),
+                ('gaps', models.IntegerField(default=0)),
+                ('missing_minutes', models.FloatField(default=0)),
+                ('outliers', models.IntegerField(default=0)),
+                ('noise_sum', models.FloatField(default=0)),
+                ('noise_count', models.IntegerField(default=0)),
+                ('tail', models.TextField(default='[]')),
+                ('patient', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='remider.Patient')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0009_cgmsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('date', models.DateTimeField()),
+                ('treatment_id', models.CharField(blank=True, max_length=64)),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='remider.Patient')),
+            ],
+            options={
+                'ordering': ('kind', 'date'),
+                'unique_together': {('kind', 'date', 'patient')},
+            },
+        ),
+    ]
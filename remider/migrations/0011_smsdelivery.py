@@ -0,0 +1,25 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0010_changehistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SmsDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sid', models.CharField(max_length=34, unique=True)),
+                ('to', models.CharField(max_length=32)),
+                ('status', models.CharField(max_length=16)),
+                ('error_code', models.IntegerField(blank=True, null=True)),
+                ('date', models.DateTimeField(db_index=True)),
+                ('updated', models.DateTimeField()),
+            ],
+        ),
+    ]
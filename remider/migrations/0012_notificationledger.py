@@ -0,0 +1,27 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0011_smsdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationLedger',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(max_length=128)),
+                ('kind', models.CharField(max_length=16)),
+                ('change_date', models.DateTimeField()),
+                ('bucket', models.IntegerField()),
+                ('date', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'unique_together': {('recipient', 'kind', 'change_date', 'bucket')},
+            },
+        ),
+    ]
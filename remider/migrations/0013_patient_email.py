@@ -0,0 +1,23 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0012_notificationledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='emails',
+            field=models.TextField(blank=True, help_text='one email address per line'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='send_email',
+            field=models.BooleanField(default=False),
+        ),
+    ]
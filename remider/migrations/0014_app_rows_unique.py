@@ -0,0 +1,42 @@
+# Generated by Django 2.2.3 on 2026-10-19 07:53
+
+from django.db import migrations, models
+
+# models with one row of app`s own data (patient IS NULL), unique index on patient doesn`t limit NULL rows
+APP_ROW_MODELS = ("infusionchanged", "sensorchanged", "nightscoutsync", "cgmsession")
+
+
+def remove_duplicated_app_rows(apps, schema_editor):
+    """ keeps the newest row without patient (rows duplicated by concurrent runs) """
+    for model_name in APP_ROW_MODELS:
+        model = apps.get_model("remider", model_name)
+        newest = model.objects.filter(patient=None).order_by("-id").first()
+        if newest is not None:
+            model.objects.filter(patient=None).exclude(id=newest.id).delete()
+
+    model = apps.get_model("remider", "wearstatistics")
+    for kind in model.objects.filter(patient=None).values_list("kind", flat=True).distinct():
+        newest = model.objects.filter(patient=None, kind=kind).order_by("-id").first()
+        model.objects.filter(patient=None, kind=kind).exclude(id=newest.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0013_patient_email'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_app_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wearstatistics',
+            constraint=models.UniqueConstraint(condition=models.Q(patient__isnull=True), fields=('kind',), name='remider_wearstatistics_app_kind'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX remider_{0}_app ON remider_{0} ((patient_id IS NULL)) WHERE patient_id IS NULL"
+            .format(model_name),
+            "DROP INDEX remider_{0}_app".format(model_name),
+        )
+        for model_name in APP_ROW_MODELS
+    ]
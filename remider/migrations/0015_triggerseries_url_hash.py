@@ -0,0 +1,18 @@
+# Generated by Django 2.2.3 on 2026-10-19 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('remider', '0014_app_rows_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='triggerseries',
+            name='url_hash',
+            field=models.CharField(default='', max_length=64),
+        ),
+    ]
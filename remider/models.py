@@ -1,14 +1,41 @@
+from datetime import time
+
 from django.db import models
 
 
+class Patient(models.Model):
+    """
+    model for saving patient (tenant) served by this app
+    app`s own settings (config variables) are used for rows without patient
+    """
+    name = models.CharField(max_length=100, unique=True)
+    nightscout_link = models.URLField()
+    infusion_set_alert_frequency = models.IntegerField(default=72)
+    sensor_alert_frequency = models.IntegerField(default=144)
+    to_numbers = models.TextField(blank=True, help_text="one phone number per line")
+    ifttt_makers = models.TextField(blank=True, help_text="one IFTTT maker key per line")
+    send_sms = models.BooleanField(default=False)
+    trigger_ifttt = models.BooleanField(default=False)
+    emails = models.TextField(blank=True, help_text="one email address per line")
+    send_email = models.BooleanField(default=False)
+    trigger_time = models.TimeField(default=time(16), help_text="UTC")
+    active = models.BooleanField(default=True)
+    last_run = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
 class InfusionChanged(models.Model):
     """ model for saving last change of insufion set in database """
     date = models.DateTimeField()
+    patient = models.OneToOneField(Patient, null=True, blank=True, on_delete=models.CASCADE)  # see migration 0014
 
 
 class SensorChanged(models.Model):
     """ model for saving last change of CGM sensor in database """
     date = models.DateTimeField()
+    patient = models.OneToOneField(Patient, null=True, blank=True, on_delete=models.CASCADE)  # see migration 0014
 
 
 class LastTriggerSet(models.Model):
@@ -20,3 +47,103 @@ class LastTriggerSet(models.Model):
 class TriggerTime(models.Model):
     """ model for saving waking up app time """
     time = models.TimeField()
+
+
+class TriggerSeries(models.Model):
+    """ model for saving recurring series of triggers registered on atrigger.com """
+    tag = models.CharField(max_length=64)
+    time = models.TimeField()
+    url_hash = models.CharField(max_length=64, default="")  # sha256 of url called by triggers (contains SECRET_KEY)
+
+
+class NightscoutSync(models.Model):
+    """ model for saving date of last successful Nightscout`s API reading """
+    date = models.DateTimeField()
+    patient = models.OneToOneField(Patient, null=True, blank=True, on_delete=models.CASCADE)  # see migration 0014
+
+
+class ScheduledReminder(models.Model):
+    """ model for saving reminders scheduled on atrigger.com for exact instants before next change """
+    kind = models.CharField(max_length=16)
+    change_date = models.DateTimeField()
+    offset = models.IntegerField()
+    date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("kind", "change_date", "offset")
+
+
+class WearStatistics(models.Model):
+    """
+    model for saving streaming statistics of intervals (in hours) between consecutive changes
+    updated in O(1) with every new change, never recomputed from history
+    """
+    kind = models.CharField(max_length=16)
+    patient = models.ForeignKey(Patient, null=True, blank=True, on_delete=models.CASCADE)
+    last_change = models.DateTimeField(null=True, blank=True)
+    count = models.IntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)  # sum of squared deviations from mean (Welford`s algorithm)
+    early = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+    histogram = models.TextField(default="[]")  # JSON list of counts in one hour bins (bounded quantile sketch)
+
+    class Meta:
+        unique_together = ("kind", "patient")
+        # unique_together doesn`t limit rows with NULL patient (app`s own statistics)
+        constraints = [models.UniqueConstraint(fields=["kind"], condition=models.Q(patient__isnull=True),
+                                               name="remider_wearstatistics_app_kind")]
+
+
+class CgmSession(models.Model):
+    """
+    model for saving rolling aggregates of CGM readings since last sensor change
+    only readings newer than last_date are fetched and reduced into aggregates
+    """
+    patient = models.OneToOneField(Patient, null=True, blank=True, on_delete=models.CASCADE)  # see migration 0014
+    sensor_change = models.DateTimeField()
+    last_date = models.BigIntegerField(default=0)  # milliseconds since epoch of newest reduced reading
+    readings = models.IntegerField(default=0)
+    gaps = models.IntegerField(default=0)
+    missing_minutes = models.FloatField(default=0)
+    outliers = models.IntegerField(default=0)
+    noise_sum = models.FloatField(default=0)  # sum of absolute second differences of readings
+    noise_count = models.IntegerField(default=0)
+    tail = models.TextField(default="[]")  # JSON list of last two readings [date, sgv] (continuity of windows)
+
+
+class SmsDelivery(models.Model):
+    """ model for saving delivery status of every sms (Twilio`s status callbacks, see remider.delivery) """
+    sid = models.CharField(max_length=34, unique=True)
+    to = models.CharField(max_length=32)
+    status = models.CharField(max_length=16)
+    error_code = models.IntegerField(null=True, blank=True)
+    date = models.DateTimeField(db_index=True)  # first status
+    updated = models.DateTimeField()
+
+
+class NotificationLedger(models.Model):
+    """
+    model for saving notifications already sent to recipients, repeated runs of reminder skip them
+    (see remider.ledger)
+    """
+    recipient = models.CharField(max_length=128)
+    kind = models.CharField(max_length=16)
+    change_date = models.DateTimeField()
+    bucket = models.IntegerField()  # threshold of remaining hours, see get_bucket
+    date = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("recipient", "kind", "change_date", "bucket")
+
+
+class ChangeHistory(models.Model):
+    """ model for saving every change of infusion set and CGM sensor (history exported for clinicians) """
+    kind = models.CharField(max_length=16)
+    date = models.DateTimeField()
+    treatment_id = models.CharField(max_length=64, blank=True)  # Nightscout`s _id
+    patient = models.ForeignKey(Patient, null=True, blank=True, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ("kind", "date", "patient")
+        ordering = ("kind", "date")
@@ -0,0 +1,206 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.utils.translation import ugettext as _
+
+from .api_interactions import schedule_trigger, schedule_event_reminders, notify
+from .cgm_monitoring import update_cgm_session, get_sms_txt_cgm
+from .data_processing import process_treatments, calculate_infusion, calculate_sensor, \
+    get_sms_txt_infusion_set, get_sms_txt_sensor, get_cached_dates
+from .ledger import get_events
+from .log import map_in_context
+from .memory_profiling import StageProfiler
+from .reservoir import get_insulin_arrays, forecast_reservoir, get_sms_txt_reservoir
+from .sms import compose_sms
+from .tenancy import get_config, get_due_patients, host_slot
+from .treatment_store import append_treatments, get_store_path, load_records, to_insulin_arrays
+from .wear_statistics import get_sms_txt_wear_habit
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("fetch", "infusion", "sensor", "notify", "schedule", "cgm")
+
+
+def run_reminder_pipeline(send_notif=True, schedule=None, patient=None, treatments=None, store=True):
+    """
+    get latest infusion set or CGM sensor change date from Nightscout`s API
+    saves it in database
+    calculates next change date
+    sends notification (optionally)
+    schedules next waking up and event reminders (optionally)
+
+    :param send_notif: boolean, if True sends notification
+    :param schedule: boolean, if True creates next trigger (and event reminders), defaults to send_notif
+                     patients are scheduled by run_patients_tick, so it`s ignored for them
+    :param patient: Patient to process (None - app`s own settings and data)
+    :param treatments: treatments already ingested (pushed by uploader), Nightscout`s API isn`t read then
+    :param store: boolean, if False fetched treatments aren`t appended to TREATMENT_STORE (e.g. dry run)
+    :return: dict with texts of notification, its uncompacted text (of IFTTT and email),
+             composed sms with its segments and encoding,
+             time remaining to next changes (None if unknown)
+             and results of stages ("stages": stage name -> boolean, None if stage has been skipped)
+    """
+    if schedule is None:
+        schedule = send_notif
+    config = get_config(patient)
+    stages = {"fetch": False, "infusion": False, "sensor": False, "notify": None, "schedule": None, "cgm": None}
+    profiler = StageProfiler()  # allocations of stages of traced requests, see MEMORY_PROFILING_RATE
+
+    if treatments is not None:  # pushed by uploader and already processed
+        stages["fetch"] = None
+        date, sensor_date = get_cached_dates(patient)
+    else:
+        start = time.monotonic()
+        try:
+            with host_slot(config.nightscout_link):
+                response = requests.get(config.nightscout_link + "/api/v1/treatments")
+            stages["fetch"] = response.status_code == 200
+        except requests.exceptions.RequestException as error:
+            logger.error("Nightscout`s API error: %s", error, extra={"stage": "fetch"})
+        latency = time.monotonic() - start
+
+        if stages["fetch"]:
+            treatments = response.json()
+            date, sensor_date = process_treatments(treatments, patient)
+            if store:
+                try:
+                    append_treatments(treatments, patient)
+                except OSError:
+                    logger.exception("treatment store not updated", extra={"stage": "fetch"})
+        else:
+            logger.warning("unsuccessful Nightscout`s API reading, cached data used",
+                           extra={"stage": "fetch", "latency": latency})
+            date, sensor_date = get_cached_dates(patient)
+    profiler.mark("fetch")
+
+    sms_parts = []  # texts of every part from the longest to the most compact, see compose_sms
+    infusion_time_remains = None
+    sensor_time_remains = None
+
+    try:
+        infusion_time_remains = calculate_infusion(date, config.infusion_set_alert_frequency)
+        shorter_texts = [get_sms_txt_infusion_set(infusion_time_remains),
+                         get_sms_txt_infusion_set(infusion_time_remains, compact=True)]
+        inf_text = shorter_texts[0] + get_sms_txt_wear_habit("infusion", patient)
+        sms_parts.append([inf_text] + shorter_texts)
+        stages["infusion"] = True
+
+    except TypeError:  # date is None
+        inf_text = _(".\n\nInfusion set: unsuccessful data reading")
+        sms_parts.append([inf_text])
+
+    except Exception:
+        logger.exception("infusion set data processing failed", extra={"stage": "infusion"})
+        inf_text = _(".\n\n Infusion set: unsuccessful data processing")
+        sms_parts.append([inf_text])
+    try:
+        sensor_time_remains = calculate_sensor(sensor_date, config.sensor_alert_frequency)
+        shorter_texts = [get_sms_txt_sensor(sensor_time_remains),
+                         get_sms_txt_sensor(sensor_time_remains, compact=True)]
+        sensor_text = shorter_texts[0] + get_sms_txt_wear_habit("sensor", patient)
+        sms_parts.append([sensor_text] + shorter_texts)
+        stages["sensor"] = True
+
+    except TypeError:  # sensor_date is None
+        sensor_text = _('\n\nCGM sensor: unsuccessful data reading')
+        sms_parts.append([sensor_text])
+
+    except Exception:
+        logger.exception("CGM sensor data processing failed", extra={"stage": "sensor"})
+        sensor_text = _("\n\nCGM sensor: unsuccessful data processing")
+        sms_parts.append([sensor_text])
+    profiler.mark("infusion and sensor")
+
+    cgm_text = ""
+    problems = None
+    if settings.CGM_MONITORING and sensor_date is not None:
+        try:
+            problems = update_cgm_session(config.nightscout_link, sensor_date, patient)
+            stages["cgm"] = problems is not None
+            cgm_text = get_sms_txt_cgm(problems)
+            sms_parts.append([cgm_text, get_sms_txt_cgm(problems, compact=True), ""])
+        except Exception:
+            stages["cgm"] = False
+            logger.exception("CGM monitoring failed", extra={"stage": "cgm"})
+        profiler.mark("cgm")
+
+    reservoir_text = ""
+    forecast = None
+    store_path = get_store_path(patient)
+    if settings.RESERVOIR_VOLUME and (treatments is not None or store_path is not None):
+        try:
+            # stored history is longer than one fetch and is read even if fetching failed
+            arrays = to_insulin_arrays(load_records(store_path)) if store_path else get_insulin_arrays(treatments)
+            forecast = forecast_reservoir(arrays, settings.RESERVOIR_VOLUME, settings.RESERVOIR_BASAL_RATE)
+            reservoir_text = get_sms_txt_reservoir(forecast)
+            sms_parts.append([reservoir_text, get_sms_txt_reservoir(forecast, compact=True), ""])
+        except Exception:
+            logger.exception("reservoir forecast failed", extra={"stage": "reservoir"})
+        profiler.mark("reservoir")
+
+    sms = compose_sms(sms_parts, settings.SMS_TARGET_SEGMENTS, settings.SMS_TRANSLITERATE)
+    sms_text = sms["text"]
+    full_text = compose_sms(sms_parts)["text"]  # segments cost nothing in webhooks and emails
+    if send_notif:
+        events = get_events(date, infusion_time_remains, sensor_date, sensor_time_remains, problems, forecast)
+        stages["notify"] = notify(sms_text, config, events, full_text)
+        profiler.mark("notify")
+    if schedule and patient is None:
+        stages["schedule"] = schedule_trigger() is not False  # None - trigger has already been created today
+        if settings.EVENT_REMINDERS:
+            stages["schedule"] = schedule_event_reminders(date, sensor_date) and stages["schedule"]
+        profiler.mark("schedule")
+
+    return {
+        "inf_text": inf_text,
+        "sensor_text": sensor_text,
+        "cgm_text": cgm_text,
+        "reservoir_text": reservoir_text,
+        "full_text": full_text,
+        "sms_text": sms_text,
+        "sms_segments": sms["segments"],
+        "sms_encoding": sms["encoding"],
+        "infusion_time_remains": infusion_time_remains,
+        "sensor_time_remains": sensor_time_remains,
+        "stages": stages,
+    }
+
+
+def run_patients_tick(now=None):
+    """
+    processes all due patients (see get_due_patients) concurrently
+    with at most TENANT_WORKERS threads and TENANT_HOST_CONNECTIONS connections per Nightscout`s host
+    :param now: aware datetime, defaults to current time
+    :return: dict patient name -> results of stages (see run_reminder_pipeline)
+    """
+    now = now or datetime.now(timezone.utc)
+    patients = list(get_due_patients(now))
+    if not patients:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=settings.TENANT_WORKERS) as executor:
+        results = map_in_context(executor, lambda patient: run_patient(patient, now), patients)
+        return {patient.name: stages for patient, stages in zip(patients, results)}
+
+
+def run_patient(patient, now):
+    """
+    runs reminder`s pipeline for one patient in worker thread
+    error of one patient doesn`t stop others, patient isn`t marked as processed and is retried next tick
+    :return: results of stages (all failed if pipeline has raised exception)
+    """
+    try:
+        stages = run_reminder_pipeline(patient=patient)["stages"]
+        patient.last_run = now.date()
+        patient.save(update_fields=["last_run"])
+        return stages
+    except Exception:
+        logger.exception("reminder of patient %s failed", patient.name)
+        return dict.fromkeys(STAGES, False)
+    finally:
+        connection.close()  # every worker thread opens its own connection
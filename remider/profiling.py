@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+
+# run in fresh interpreter, so nothing is imported yet
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import django
+django.setup()
+ready = time.perf_counter()
+from django.urls import resolve
+resolve("/")
+urls = time.perf_counter()
+sys.stderr.write("startup report: {} {}\\n".format(ready - start, urls - ready))
+"""
+
+
+def measure_startup():
+    """
+    measures cold start of app (django.setup and loading of URLconf with all views) in fresh interpreter
+    :return: dict with "setup", "urls" (seconds) and "modules" - list of (name, self, cumulative) import times
+             in seconds, in order of imports (name is indented with depth of import)
+    :raises subprocess.CalledProcessError: if app can`t start
+    """
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "infusionset_reminder.settings")
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT], env=env,
+                             cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+
+    report = {"setup": None, "urls": None, "modules": []}
+    for line in process.stderr.splitlines():
+        if line.startswith("startup report: "):
+            report["setup"], report["urls"] = (float(value) for value in line.split(": ")[1].split())
+        elif line.startswith("import time:") and "[us]" not in line:
+            self_time, cumulative, name = line[len("import time:"):].split("|")
+            report["modules"].append((name.rstrip()[1:], int(self_time) / 10 ** 6, int(cumulative) / 10 ** 6))
+    return report
+
+
+def get_imported_modules(report):
+    """
+    :param report: result of measure_startup
+    :return: set of names of modules imported at start
+    """
+    return {name.strip() for name, self_time, cumulative in report["modules"]}
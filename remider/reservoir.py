@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import ugettext as _
+
+from .vectorized import to_microseconds, EPOCH, MICROSECOND, HOUR, DAY
+
+ROLLING_DAYS = 3  # number of last full days used for daily rate estimate
+
+
+def get_insulin_arrays(treatments):
+    """
+    extracts reservoir changes, boluses and temp basals from Nightscout`s treatments
+    :param treatments: list of treatments (dicts) from Nightscout`s API
+    :return: dict of arrays (times in microseconds since epoch):
+             "changes" - reservoir changes (sorted),
+             "bolus_times", "boluses" - boluses in U,
+             "basal_times", "basal_rates", "basal_durations" - temp basals in U/h and minutes (sorted by time)
+    """
+    changes, bolus_times, boluses, basal_times, basal_rates, basal_durations = [], [], [], [], [], []
+    for treatment in treatments:
+        notes = treatment.get("notes")
+        if notes == "Reservoir changed":
+            changes.append(treatment["created_at"])
+        elif treatment.get("insulin"):
+            bolus_times.append(treatment["created_at"])
+            boluses.append(treatment["insulin"])
+        elif treatment.get("eventType") == "Temp Basal" and treatment.get("absolute") is not None:
+            basal_times.append(treatment["created_at"])
+            basal_rates.append(treatment["absolute"])
+            basal_durations.append(treatment.get("duration") or 0)
+
+    basal_times = to_microseconds([parse_datetime(date) for date in basal_times])
+    order = np.argsort(basal_times, kind="stable")
+    return {
+        "changes": np.sort(to_microseconds([parse_datetime(date) for date in changes])),
+        "bolus_times": to_microseconds([parse_datetime(date) for date in bolus_times]),
+        "boluses": np.array(boluses, dtype=np.float64),
+        "basal_times": basal_times[order],
+        "basal_rates": np.array(basal_rates, dtype=np.float64)[order],
+        "basal_durations": np.array(basal_durations, dtype=np.float64)[order],
+    }
+
+
+def delivered_between(arrays, starts, ends, basal_rate=0):
+    """
+    integrates insulin delivered in many windows at once
+    temp basals replace scheduled basal (basal_rate), the rest of window is delivered with basal_rate,
+    temp basal ends when the next one starts (pumps set a new one every few minutes)
+    :param arrays: result of get_insulin_arrays
+    :param starts: int64 array of windows` starts (microseconds since epoch)
+    :param ends: int64 array of windows` ends
+    :param basal_rate: scheduled basal in U/h
+    :return: float array of units delivered in every window
+    """
+    starts = np.asarray(starts)[:, None]
+    ends = np.asarray(ends)[:, None]
+
+    bolus_times = arrays["bolus_times"][None, :]
+    boluses = np.where((bolus_times >= starts) & (bolus_times < ends), arrays["boluses"][None, :], 0).sum(axis=1)
+
+    basal_starts = arrays["basal_times"]
+    basal_ends = basal_starts + (arrays["basal_durations"] * 60 * 10 ** 6).astype(np.int64)
+    basal_ends = np.minimum(basal_ends, np.append(basal_starts[1:], np.iinfo(np.int64).max))[None, :]
+    basal_starts = basal_starts[None, :]
+    covered = np.clip(np.minimum(basal_ends, ends) - np.maximum(basal_starts, starts), 0, None) / HOUR
+    temp_basals = (covered * arrays["basal_rates"][None, :]).sum(axis=1)
+
+    uncovered = np.clip((ends - starts)[:, 0] / HOUR - covered.sum(axis=1), 0, None)
+    return boluses + temp_basals + uncovered * basal_rate
+
+
+def forecast_reservoir(arrays, volume, basal_rate=0, now=None):
+    """
+    forecasts when reservoir runs dry
+    :param arrays: result of get_insulin_arrays
+    :param volume: units of insulin in filled reservoir
+    :param basal_rate: scheduled basal in U/h
+    :param now: aware datetime, defaults to current time
+    :return: dict with "delivered", "remaining" (U), "daily_rate" (U/day), "empty_in" (microseconds)
+             and "changed" (aware datetime of reservoir change) or None if reservoir change is unknown
+    """
+    now = ((now or datetime.now(timezone.utc)) - EPOCH) // MICROSECOND
+    changes = arrays["changes"][arrays["changes"] <= now]
+    if not len(changes):
+        return None
+    since = changes[-1]
+
+    # all windows at once: since last change and last full days (rolling daily rate)
+    full_days = min(int((now - since) // DAY), ROLLING_DAYS)
+    window_ends = np.array([now] + [now - day * DAY for day in range(full_days)], dtype=np.int64)
+    window_starts = np.array([since] + [end - DAY for end in window_ends[1:]], dtype=np.int64)
+    delivered = delivered_between(arrays, window_starts, window_ends, basal_rate)
+
+    if full_days:
+        daily_rate = float(delivered[1:].mean())
+    elif now > since:
+        daily_rate = float(delivered[0] * DAY / (now - since))
+    else:
+        daily_rate = 0.0
+
+    remaining = volume - float(delivered[0])
+    return {
+        "delivered": float(delivered[0]),
+        "remaining": remaining,
+        "daily_rate": daily_rate,
+        "empty_in": int(max(remaining, 0) / daily_rate * DAY) if daily_rate > 0 else None,
+        "changed": EPOCH + int(since) * MICROSECOND,
+    }
+
+
+def get_sms_txt_reservoir(forecast, compact=False):
+    """
+    add info about reservoir to sms`s text
+    :param forecast: result of forecast_reservoir or None
+    :param compact: boolean, if True short text for sms is returned (see compose_sms)
+    :return: part of text for sms notification (empty if forecast is unknown)
+    """
+    if forecast is None or forecast["empty_in"] is None:
+        return ""
+    days = forecast["empty_in"] // DAY
+    hours = round((forecast["empty_in"] % DAY) / HOUR)
+    if compact:
+        if forecast["remaining"] <= 0:
+            return _("Reservoir: empty.")
+        return _("Reservoir: ~{}U, empty in {}d {}h.").format(int(forecast["remaining"]), days, hours)
+    if forecast["remaining"] <= 0:
+        return _("\n\n Your reservoir is probably empty")
+    return _("\n\n Your reservoir (about {} U left) will be empty in {} days and {} hours.").format(
+        int(forecast["remaining"]), days, hours)
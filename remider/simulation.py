@@ -0,0 +1,68 @@
+import numpy as np
+from django.utils.dateparse import parse_datetime
+
+from .vectorized import to_microseconds, HOUR, DAY
+
+CHANGE_NOTES = {
+    "infusion": "Reservoir changed",
+    "sensor": "Sensor changed",
+}
+
+
+def get_change_arrays(treatments):
+    """
+    extracts changes of infusion set and CGM sensor from Nightscout`s treatments
+    :param treatments: list of treatments (dicts) from Nightscout`s API
+    :return: dict kind -> sorted int64 array of change times (microseconds since epoch)
+    """
+    dates = {kind: [] for kind in CHANGE_NOTES}
+    for treatment in treatments:
+        for kind, notes in CHANGE_NOTES.items():
+            if treatment.get("notes") == notes and treatment.get("created_at"):
+                dates[kind].append(parse_datetime(treatment["created_at"]))
+
+    return {kind: np.unique(to_microseconds(kind_dates)) for kind, kind_dates in dates.items()}
+
+
+def simulate_policy(changes, frequency, trigger_time, lead=24, end=None):
+    """
+    replays daily notifications at trigger_time over history of changes
+    notification warns about change (is an alert) if it`s sent less than lead hours before due date
+    :param changes: sorted int64 array of change times (microseconds since epoch)
+    :param frequency: hours between changes (policy`s alert frequency)
+    :param trigger_time: datetime.time of daily notification (UTC)
+    :param lead: hours before due date, from which notifications warn about change
+    :param end: microseconds since epoch of history end, defaults to last change
+    :return: dict with statistics of policy:
+             "messages" - all daily notifications, "alerts" - notifications warning about change,
+             "missed" - changes made after due date without any alert,
+             "early", "late" - alerts sent before / after due date,
+             "mean_offset", "max_late" - hours between due date and alert (negative - early)
+    """
+    if len(changes) == 0:
+        return {"messages": 0, "alerts": 0, "missed": 0, "early": 0, "late": 0, "mean_offset": None,
+                "max_late": None}
+
+    end = changes[-1] if end is None else end
+    trigger_offset = ((trigger_time.hour * 60 + trigger_time.minute) * 60 + trigger_time.second) * 10 ** 6
+    starts = changes
+    next_changes = np.append(changes[1:], end)
+    due = starts + int(round(frequency * HOUR))
+
+    # first daily trigger after change, which is at most lead hours before due date
+    window_starts = np.maximum(due - int(round(lead * HOUR)), starts)
+    alerts = -((trigger_offset - window_starts) // DAY) * DAY + trigger_offset
+    fired = alerts < next_changes
+    missed = ~fired & (next_changes > due)
+    offsets = (alerts[fired] - due[fired]) / HOUR
+
+    first_trigger = -((trigger_offset - changes[0]) // DAY) * DAY + trigger_offset
+    return {
+        "messages": int(max((end - first_trigger) // DAY + 1, 0)),
+        "alerts": int(fired.sum()),
+        "missed": int(missed.sum()),
+        "early": int((offsets < 0).sum()),
+        "late": int((offsets > 0).sum()),
+        "mean_offset": float(offsets.mean()) if len(offsets) else None,
+        "max_late": float(max(offsets.max(), 0)) if len(offsets) else None,
+    }
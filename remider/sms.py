@@ -0,0 +1,122 @@
+import unicodedata
+
+# GSM 03.38 basic character set (one septet) and extension table (escape + septet)
+GSM_BASIC = set("@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿"
+                "abcdefghijklmnopqrstuvwxyzäöñüà")
+GSM_EXTENSION = set("^{}\\[~]|€\f")
+
+# (single, per segment of concatenated sms) units of encodings
+SEGMENT_SIZES = {"GSM-7": (160, 153), "UCS-2": (70, 67)}
+
+# characters without GSM-7 equivalent, which don`t decompose to letter + diacritic
+TRANSLITERATIONS = {
+    "ł": "l", "Ł": "L",
+    "`": "'", "‘": "'", "’": "'", "„": '"', "“": '"', "”": '"',
+    "–": "-", "—": "-", "…": "...", "\u00a0": " ",
+}
+
+
+def get_encoding(text):
+    """
+    :param text: text of sms
+    :return: "GSM-7" if every character is in GSM 03.38 alphabet, "UCS-2" otherwise
+    """
+    if all(char in GSM_BASIC or char in GSM_EXTENSION for char in text):
+        return "GSM-7"
+    return "UCS-2"
+
+
+def get_units(char, encoding):
+    """
+    :return: septets (GSM-7) or UTF-16 code units (UCS-2) of character
+    """
+    if encoding == "GSM-7":
+        return 2 if char in GSM_EXTENSION else 1
+    return 2 if ord(char) > 0xFFFF else 1
+
+
+def count_segments(text, encoding=None):
+    """
+    counts parts of (concatenated) sms, characters encoded with two units aren`t split between parts
+    :param text: text of sms
+    :param encoding: "GSM-7" or "UCS-2", defaults to encoding of text
+    :return: number of segments
+    """
+    encoding = encoding or get_encoding(text)
+    single, concatenated = SEGMENT_SIZES[encoding]
+    units = [get_units(char, encoding) for char in text]
+    if sum(units) <= single:
+        return 1
+
+    segments = 1
+    filled = 0
+    for char_units in units:
+        if filled + char_units > concatenated:
+            segments += 1
+            filled = 0
+        filled += char_units
+    return segments
+
+
+def transliterate(text):
+    """
+    replaces characters outside of GSM-7 alphabet with closest GSM-7 ones (e.g. Polish diacritics),
+    characters without equivalent are kept
+    :param text: text of sms
+    :return: transliterated text
+    """
+    chars = []
+    for char in text:
+        if char in GSM_BASIC or char in GSM_EXTENSION:
+            chars.append(char)
+            continue
+        replacement = TRANSLITERATIONS.get(char)
+        if replacement is None:
+            replacement = "".join(decomposed for decomposed in unicodedata.normalize("NFKD", char)
+                                  if not unicodedata.combining(decomposed))
+            if not replacement or get_encoding(replacement) != "GSM-7":
+                replacement = char
+        chars.append(replacement)
+    return "".join(chars)
+
+
+def measure(text):
+    """
+    :param text: text of sms
+    :return: dict with text, "encoding" and "segments"
+    """
+    encoding = get_encoding(text)
+    return {"text": text, "encoding": encoding, "segments": count_segments(text, encoding)}
+
+
+def compose_sms(parts, target_segments=0, transliterate_text=False):
+    """
+    joins parts of notification (one line each) into sms, which fits in target_segments if possible:
+    least important parts are replaced with more compact texts first, then droppable parts are left out
+    (important parts are kept even if sms is longer)
+
+    :param parts: list of parts (the most important first), part is list of its texts from the longest
+                  to the most compact, "" as the last text means part can be left out
+    :param target_segments: maximal number of segments (0 - texts aren`t compacted)
+    :param transliterate_text: boolean, if True characters outside of GSM-7 are transliterated
+    :return: dict with "text", "encoding" and "segments"
+    """
+    chosen = [0] * len(parts)
+
+    def build():
+        # texts of notification start with ".\n\n", one line is enough in sms
+        text = "\n".join(" ".join(part[index].lstrip(".").split()) for part, index in zip(parts, chosen)
+                         if part[index].lstrip(".").strip())
+        return measure(transliterate(text) if transliterate_text else text)
+
+    sms = build()
+    if not target_segments:
+        return sms
+
+    for dropping in (False, True):
+        for index in reversed(range(len(parts))):
+            while sms["segments"] > target_segments and chosen[index] + 1 < len(parts[index]) \
+                    and (dropping or parts[index][chosen[index] + 1].strip()):
+                chosen[index] += 1
+                sms = build()
+    return sms
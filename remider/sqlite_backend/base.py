@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend, which starts transactions with BEGIN IMMEDIATE
+    write lock is taken (waiting up to busy_timeout) when transaction begins, so concurrent writers
+    (patients tick, ingest endpoint) queue instead of failing with "database is locked",
+    which SQLite raises at once when transaction started as reader tries to write
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
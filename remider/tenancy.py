@@ -0,0 +1,65 @@
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Patient
+
+PatientConfig = namedtuple("PatientConfig", ["nightscout_link", "infusion_set_alert_frequency",
+                                             "sensor_alert_frequency", "to_numbers", "ifttt_makers", "send_sms",
+                                             "trigger_ifttt", "emails", "send_email"], defaults=((), False))
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def get_config(patient=None):
+    """
+    :param patient: Patient or None (app`s own settings)
+    :return: PatientConfig with patient`s Nightscout link, thresholds and recipients
+    """
+    if patient is None:
+        return PatientConfig(settings.NIGTSCOUT_LINK, settings.INFUSION_SET_ALERT_FREQUENCY,
+                             settings.SENSOR_ALERT_FREQUENCY, settings.TO_NUMBERS, settings.IFTTT_MAKERS,
+                             settings.SEND_SMS, settings.TRIGGER_IFTTT, settings.EMAIL_RECIPIENTS, settings.SEND_EMAIL)
+
+    return PatientConfig(patient.nightscout_link, patient.infusion_set_alert_frequency,
+                         patient.sensor_alert_frequency, split_lines(patient.to_numbers),
+                         split_lines(patient.ifttt_makers), patient.send_sms, patient.trigger_ifttt,
+                         split_lines(patient.emails), patient.send_email)
+
+
+def split_lines(text):
+    """
+    :return: list of not empty, stripped lines of text
+    """
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def get_due_patients(now=None):
+    """
+    :param now: aware datetime, defaults to current time
+    :return: queryset of active patients, whose trigger time has passed today and who haven`t been processed today
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return Patient.objects.filter(active=True, trigger_time__lte=now.time()).filter(
+        Q(last_run__isnull=True) | Q(last_run__lt=now.date()))
+
+
+@contextmanager
+def host_slot(url):
+    """
+    limits number of concurrent connections to one host (TENANT_HOST_CONNECTIONS)
+    :param url: requested url
+    """
+    host = urlsplit(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(settings.TENANT_HOST_CONNECTIONS)
+        semaphore = _host_semaphores[host]
+    with semaphore:
+        yield
@@ -0,0 +1,196 @@
+import json
+import time as timer
+from datetime import datetime, time, timedelta, timezone
+from urllib.parse import parse_qs
+
+import responses
+from requests.exceptions import ConnectionError, ReadTimeout
+from urllib3.exceptions import ProtocolError
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from ..api_interactions import sync_trigger_series, create_trigger, schedule_event_reminders, send_messages, \
+    send_message, RateLimiter
+from ..models import TriggerSeries, TriggerTime, ScheduledReminder
+
+
+@override_settings(ATRIGGER_KEY="key", ATRIGGER_SECRET="secret", ATRIGGER_SERIES_COUNT=0)
+class ATriggerTests(TestCase):
+
+    @responses.activate
+    def test_create_trigger_once_a_day(self):
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/create", status=200)
+        self.assertTrue(create_trigger())
+        self.assertIsNone(create_trigger())
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIn("count=1", responses.calls[0].request.url)
+
+    @responses.activate
+    def test_sync_trigger_series(self):
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/create", status=200)
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/delete", status=200)
+
+        self.assertTrue(sync_trigger_series())
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIn("timeSlice=1day", responses.calls[0].request.url)
+        self.assertIn("count=0", responses.calls[0].request.url)
+        series = TriggerSeries.objects.get(id=1)
+        self.assertEqual(series.time, time(16))
+
+        self.assertTrue(sync_trigger_series())  # time unchanged, no call
+        self.assertEqual(len(responses.calls), 1)
+
+        TriggerTime.objects.filter(id=1).update(time=time(18))
+        self.assertTrue(sync_trigger_series())
+        self.assertEqual(len(responses.calls), 3)
+        self.assertIn("tasks/delete", responses.calls[1].request.url)
+        self.assertIn("tag_id={}".format(series.tag), responses.calls[1].request.url)
+        self.assertEqual(TriggerSeries.objects.count(), 1)
+        self.assertEqual(TriggerSeries.objects.get(id=1).time, time(18))
+
+        for changed in ({"SECRET_KEY": "rotated"}, {"EVENT_REMINDERS": True}):  # url of series has changed
+            with self.subTest(**changed), self.settings(**changed):
+                calls = len(responses.calls)
+                self.assertTrue(sync_trigger_series())
+                self.assertEqual(len(responses.calls), calls + 2)
+                self.assertIn("tasks/delete", responses.calls[calls].request.url)
+                self.assertTrue(sync_trigger_series())
+                self.assertEqual(len(responses.calls), calls + 2)
+
+    @responses.activate
+    def test_sync_trigger_series_failure(self):
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/create", status=403)
+        self.assertFalse(sync_trigger_series())
+        self.assertFalse(TriggerSeries.objects.exists())
+
+
+@override_settings(ATRIGGER_KEY="key", ATRIGGER_SECRET="secret", INFUSION_SET_ALERT_FREQUENCY=72,
+                   SENSOR_ALERT_FREQUENCY=144, REMINDER_OFFSETS=[24, 6, 0])
+class EventRemindersTests(TestCase):
+
+    @responses.activate
+    def test_schedule_event_reminders(self):
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/create", status=200)
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/delete", status=200)
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        date = now - timedelta(hours=60)  # 12 hours to change
+        sensor_date = now - timedelta(hours=10)
+
+        self.assertTrue(schedule_event_reminders(date, sensor_date))
+        self.assertEqual(len(responses.calls), 5)  # infusion: 6h and 0h, sensor: 24h, 6h and 0h
+        self.assertEqual(ScheduledReminder.objects.count(), 5)
+
+        self.assertTrue(schedule_event_reminders(date, sensor_date))
+        self.assertEqual(len(responses.calls), 5)
+
+        new_date = now - timedelta(hours=1)
+        self.assertTrue(schedule_event_reminders(new_date, sensor_date))
+        self.assertIn("tasks/delete", responses.calls[5].request.url)
+        self.assertIn("tag_id=infusion-{}".format(int(date.timestamp())), responses.calls[5].request.url)
+        self.assertEqual(len(responses.calls), 9)
+        self.assertFalse(ScheduledReminder.objects.filter(change_date=date).exists())
+        self.assertEqual(ScheduledReminder.objects.filter(kind="infusion").count(), 3)
+
+    @responses.activate
+    def test_reminders_of_unknown_change_kept(self):
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/create", status=200)
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/delete", status=200)
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.assertTrue(schedule_event_reminders(now - timedelta(hours=60), now - timedelta(hours=10)))
+        calls = len(responses.calls)
+
+        self.assertTrue(schedule_event_reminders(None, None))  # e.g. failed reading with empty cache
+        self.assertEqual(len(responses.calls), calls)
+        self.assertEqual(ScheduledReminder.objects.count(), 5)
+
+
+MESSAGES_URL = "https://api.twilio.com/2010-04-01/Accounts/AC123/Messages.json"
+NOTIFY_URL = "https://notify.twilio.com/v1/Services/IS123/Notifications"
+# fields of Twilio`s resources read by twilio library
+MESSAGE_FIELDS = ("account_sid", "api_version", "body", "date_created", "date_updated", "date_sent", "direction",
+                  "error_code", "error_message", "from", "messaging_service_sid", "num_media", "num_segments", "price",
+                  "price_unit", "sid", "status", "subresource_uris", "to", "uri")
+NOTIFICATION_FIELDS = ("sid", "account_sid", "service_sid", "date_created", "identities", "tags", "segments", "priority",
+                       "ttl", "title", "body", "sound", "action", "data", "apn", "gcm", "fcm", "sms",
+                       "facebook_messenger", "alexa")
+
+
+def twilio_resource(fields, **values):
+    """
+    :return: JSON of Twilio`s resource with given values (other fields are null)
+    """
+    return json.dumps(dict(dict.fromkeys(fields), **values))
+
+
+@override_settings(TWILIO_ACCOUNT_SID="AC123", TWILIO_AUTH_TOKEN="token", FROM_NUMBER="+48000000000",
+                   TWILIO_NOTIFY_SERVICE_SID="", TWILIO_MESSAGING_SERVICE_SID="", SMS_RATE=0, SMS_WORKERS=4)
+class SendMessagesTests(SimpleTestCase):
+    numbers = ["+48111111111", "+48222222222", "+48333333333"]
+
+    def message_callback(self, request):
+        to = parse_qs(request.body)["To"][0]
+        if to == "+48222222222":
+            return 400, {}, json.dumps({"code": 21211, "message": "invalid 'To' number", "status": 400})
+        return 201, {}, twilio_resource(MESSAGE_FIELDS, sid="SM" + to[-3:], status="queued", to=to)
+
+    @responses.activate
+    def test_one_request_per_number(self):
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        statuses = send_messages("text", self.numbers)
+        self.assertEqual(statuses, {"+48111111111": "queued", "+48222222222": "failed", "+48333333333": "queued"})
+        self.assertEqual(len(responses.calls), 3)
+        self.assertEqual(parse_qs(responses.calls[0].request.body)["From"], ["+48000000000"])
+        self.assertFalse(send_message("text", self.numbers))
+        self.assertTrue(send_message("text", ["+48111111111"]))
+
+    @override_settings(TWILIO_MESSAGING_SERVICE_SID="MG123")
+    @responses.activate
+    def test_messaging_service_sender(self):
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        send_messages("text", ["+48111111111"])
+        body = parse_qs(responses.calls[0].request.body)
+        self.assertEqual(body["MessagingServiceSid"], ["MG123"])
+        self.assertNotIn("From", body)
+
+    @override_settings(TWILIO_NOTIFY_SERVICE_SID="IS123")
+    @responses.activate
+    def test_bulk_request(self):
+        responses.add(responses.POST, NOTIFY_URL, status=201,
+                      body=twilio_resource(NOTIFICATION_FIELDS, sid="NT123"))
+        statuses = send_messages("text", self.numbers)
+        self.assertEqual(statuses, dict.fromkeys(self.numbers, "queued"))
+        self.assertEqual(len(responses.calls), 1)
+        bindings = [json.loads(binding) for binding in parse_qs(responses.calls[0].request.body)["ToBinding"]]
+        self.assertEqual([binding["address"] for binding in bindings], self.numbers)
+
+    @override_settings(TWILIO_NOTIFY_SERVICE_SID="IS123")
+    @responses.activate
+    def test_bulk_fallback(self):
+        responses.add(responses.POST, NOTIFY_URL, status=503, json={"code": 20503, "message": "unavailable"})
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        with self.assertLogs("remider.api_interactions", "ERROR"):
+            statuses = send_messages("text", self.numbers)
+        self.assertEqual(statuses["+48111111111"], "queued")
+        self.assertEqual(len(responses.calls), 4)
+
+    @override_settings(TWILIO_NOTIFY_SERVICE_SID="IS123")
+    @responses.activate
+    def test_bulk_fallback_only_if_rejected(self):
+        for error, resent in ((ConnectionError("connection refused"), True),
+                              (ConnectionError(ProtocolError("connection aborted")), False),
+                              (ReadTimeout("read timed out"), False)):
+            with self.subTest(error=error):
+                responses.reset()
+                responses.add(responses.POST, NOTIFY_URL, body=error)
+                responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+                with self.assertLogs("remider.api_interactions", "ERROR"):
+                    statuses = send_messages("text", self.numbers)
+                self.assertEqual(len(responses.calls), 4 if resent else 1)
+                self.assertEqual(statuses["+48111111111"], "queued" if resent else "failed")
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(50)
+        start = timer.monotonic()
+        for i in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(timer.monotonic() - start, 0.1)
+        self.assertLess(timer.monotonic() - start, 1)
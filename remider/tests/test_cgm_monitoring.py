@@ -0,0 +1,99 @@
+import time as timer
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import responses
+from django.test import TestCase, override_settings
+
+from ..cgm_monitoring import parse_sgv_lines, reduce_readings, update_cgm_session, get_sms_txt_cgm
+from ..models import CgmSession
+
+SENSOR_DATE = datetime(2019, 7, 20, tzinfo=timezone.utc)
+START = int(SENSOR_DATE.timestamp() * 1000)
+MINUTE = 60000
+
+
+def sgv_txt(dates, sgvs):
+    """
+    :return: body of Nightscout`s sgv.txt (newest readings first)
+    """
+    lines = []
+    for date, sgv in sorted(zip(dates, sgvs), reverse=True):
+        lines.append('"{}"\t{}\t{}\t"Flat"\t"xDrip"'.format(
+            datetime.fromtimestamp(date / 1000, timezone.utc).isoformat(), date, int(sgv)))
+    return "\n".join(lines)
+
+
+@override_settings(CGM_MAX_GAP_SHARE=0.15, CGM_MAX_NOISE=8, CGM_MAX_OUTLIER_SHARE=0.02, CGM_FETCH_COUNT=5000,
+                   LANGUAGE_CODE="en")
+class CgmMonitoringTests(TestCase):
+    url = "https://nightscout.com/api/v1/entries/sgv.txt"
+
+    def readings(self, start, count, every=5):
+        dates = START + np.arange(start, start + count * every, every) * MINUTE
+        return dates, 120 + 20 * np.sin(np.arange(count) / 20)
+
+    def test_parse_sgv_lines(self):
+        dates, sgvs = parse_sgv_lines(sgv_txt([START + 10 * MINUTE, START], [110, 100]).splitlines() +
+                                      ['"2019-07-20"\t{}\t100\t"Flat"'.format(START), "", "wrong line"])
+        self.assertEqual(list(dates), [START, START + 10 * MINUTE])
+        self.assertEqual(list(sgvs), [100, 110])
+
+    def test_reduce_readings(self):
+        dates = START + np.array([0, 5, 10, 40, 45, 50, 55]) * MINUTE
+        sgvs = np.array([100, 102, 104, 110, 150, 112, 114], dtype=np.float64)
+        window = reduce_readings(dates, sgvs)
+        self.assertEqual(window["readings"], 7)
+        self.assertEqual(window["gaps"], 1)
+        self.assertEqual(window["missing_minutes"], 25)
+        self.assertEqual(window["outliers"], 2)
+        self.assertEqual(window["noise_count"], 3)  # second differences across gap are skipped
+
+        # next window continues previous one
+        window = reduce_readings(START + np.array([60, 65]) * MINUTE, np.array([116, 118.]), window["tail"])
+        self.assertEqual(window["readings"], 2)
+        self.assertEqual(window["gaps"], 0)
+        self.assertEqual(window["noise_count"], 2)  # both over last readings of previous window
+
+    @responses.activate
+    def test_only_new_window_fetched(self):
+        dates, sgvs = self.readings(0, 288)
+        responses.add(responses.GET, self.url, body=sgv_txt(dates, sgvs))
+        self.assertEqual(update_cgm_session("https://nightscout.com", SENSOR_DATE), [])
+        self.assertIn("find%5Bdate%5D%5B%24gt%5D={}".format(START), responses.calls[0].request.url)
+
+        responses.replace(responses.GET, self.url, body=sgv_txt(*self.readings(288 * 5, 12)))
+        update_cgm_session("https://nightscout.com", SENSOR_DATE)
+        self.assertIn(str(dates[-1]), responses.calls[1].request.url)
+        session = CgmSession.objects.get()
+        self.assertEqual(session.readings, 300)
+        self.assertEqual(session.gaps, 0)
+
+        # new sensor - aggregates are reset
+        update_cgm_session("https://nightscout.com", SENSOR_DATE + timedelta(days=1))
+        self.assertEqual(CgmSession.objects.get().readings, 12)
+
+    @responses.activate
+    def test_degrading_sensor(self):
+        dates, sgvs = self.readings(0, 288)
+        keep = np.ones(len(dates), dtype=bool)
+        keep[100:160] = False  # five hours without signal
+        sgvs[200::2] += 30  # jumping readings at the end of session
+        responses.add(responses.GET, self.url, body=sgv_txt(dates[keep], sgvs[keep]))
+
+        problems = update_cgm_session("https://nightscout.com", SENSOR_DATE)
+        self.assertEqual(len(problems), 3)
+        self.assertIn("1 signal gaps", problems)
+        self.assertIn("CGM sensor may be degrading (1 signal gaps, noisy readings", get_sms_txt_cgm(problems))
+        self.assertEqual(get_sms_txt_cgm([]), "")
+
+    @responses.activate
+    def test_failed_reading(self):
+        responses.add(responses.GET, self.url, status=500)
+        self.assertIsNone(update_cgm_session("https://nightscout.com", SENSOR_DATE))
+
+    def test_sensor_session_in_milliseconds(self):
+        dates, sgvs = self.readings(0, 4000)
+        start = timer.perf_counter()
+        reduce_readings(*parse_sgv_lines(sgv_txt(dates, sgvs).splitlines()))
+        self.assertLess(timer.perf_counter() - start, 0.5)
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from unittest.mock import patch
+
+import responses
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..models import InfusionChanged, SensorChanged, SmsDelivery
+
+
+@override_settings(NIGTSCOUT_LINK="https://benc.com", SEND_SMS=False, TRIGGER_IFTTT=False)
+class RunReminderCommandTests(TestCase):
+    def setUp(self):
+        responses.start()
+        responses.add(responses.GET, "https://benc.com/api/v1/treatments",
+                      json=[{"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"},
+                            {"created_at": "2019-07-20T20:30:40+02:00", "notes": "Sensor changed"}], status=200)
+
+    def tearDown(self):
+        responses.stop()
+        responses.reset()
+
+    def test_quiet(self):
+        out = StringIO()
+        call_command("run_reminder", "--quiet", stdout=out)
+        self.assertIn("notify: skipped", out.getvalue())
+        self.assertTrue(InfusionChanged.objects.exists())
+        self.assertTrue(SensorChanged.objects.exists())
+
+    def test_dry_run(self):
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory, self.settings(TREATMENT_STORE=directory):
+            call_command("run_reminder", "--dry-run", stdout=out)
+            self.assertEqual(os.listdir(directory), [])
+        self.assertIn("fetch: OK", out.getvalue())
+        self.assertIn("Your infusion set", out.getvalue())
+        self.assertFalse(InfusionChanged.objects.exists())
+
+    def test_exit_code(self):
+        responses.replace(responses.GET, "https://benc.com/api/v1/treatments", status=500)
+        with self.assertRaises(SystemExit) as cm:
+            call_command("run_reminder", "--quiet", "--repeat", "2", stdout=StringIO())
+        self.assertEqual(cm.exception.code, 1 + 2 + 4)
+
+    @override_settings(TO_NUMBERS=["+48111111111"])
+    @patch("remider.management.commands.run_reminder.send_message", return_value=True)
+    def test_retry_undelivered(self, send_message):
+        now = datetime.now(timezone.utc)
+        for sid, to in (("SM1", "+48111111111"), ("SM2", "+48999999999")):  # second number has been removed
+            SmsDelivery.objects.create(sid=sid, to=to, status="failed", date=now, updated=now)
+        responses.replace(responses.GET, "https://benc.com/api/v1/treatments", status=500)
+        with self.assertRaises(SystemExit) as cm:
+            call_command("run_reminder", "--retry-undelivered", stdout=StringIO())
+        self.assertEqual(cm.exception.code, 1)  # resent with cached dates although fetching has failed
+        self.assertEqual(send_message.call_args[0][1], ["+48111111111"])
+
+
+class SimulateRemindersCommandTests(TestCase):
+
+    def test_simulate_from_file(self):
+        treatments = [{"created_at": "2019-07-{:02d}T20:30:40+02:00".format(day), "notes": "Reservoir changed"}
+                      for day in range(1, 30, 3)]
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as file:
+            json.dump(treatments, file)
+            file.flush()
+            out = StringIO()
+            call_command("simulate_reminders", "--file", file.name, "--infusion-frequency", "48", "72",
+                         "--trigger-time", "16:00", "08:00", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("kind"))
+        self.assertEqual(len([line for line in lines if line.startswith("infusion")]), 4)
+        self.assertEqual(len([line for line in lines if line.startswith("sensor")]), 2)
+        self.assertIn("10 changes replayed", lines[-1])
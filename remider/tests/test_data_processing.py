@@ -627,3 +627,30 @@ class DataProcessingTests(TestCase):
         self.assertEqual(text, ".\n\n Your infusion set change has already passed")
 
 
+
+    @override_settings(INFUSION_SET_ALERT_FREQUENCY=48, SENSOR_ALERT_FREQUENCY=24)
+    def test_get_status(self):
+        now = datetime.now(timezone.utc)
+        status, max_age = get_status(now)
+        self.assertEqual(status, {"infusion": None, "sensor": None, "data_age_hours": None})
+        self.assertIsNone(max_age)
+
+        InfusionChanged.objects.create(id=1, date=now - timedelta(hours=10, minutes=20))
+        SensorChanged.objects.create(id=1, date=now - timedelta(hours=30, minutes=15))
+        NightscoutSync.objects.create(id=1, date=now - timedelta(minutes=50))
+        status, max_age = get_status(now)
+        self.assertEqual(status["infusion"]["remaining_hours"], 37)
+        self.assertFalse(status["infusion"]["overdue"])
+        self.assertEqual(status["sensor"]["remaining_hours"], -7)
+        self.assertTrue(status["sensor"]["overdue"])
+        self.assertEqual(status["data_age_hours"], 0)
+        self.assertEqual(max_age, 10 * 60)
+
+    @override_settings(INFUSION_SET_ALERT_FREQUENCY=72, SENSOR_ALERT_FREQUENCY=144, REMINDER_OFFSETS=[24, 6, 0])
+    def test_get_reminder_instants(self):
+        now = datetime.now(timezone.utc)
+        date = now - timedelta(hours=60)
+        instants = get_reminder_instants(date, None, now)
+        self.assertEqual(instants, [("infusion", date, 6, now + timedelta(hours=6)),
+                                    ("infusion", date, 0, now + timedelta(hours=12))])
+        self.assertEqual(get_reminder_instants(None, None, now), [])
@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+import responses
+from django.conf import settings
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.shortcuts import reverse
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ..delivery import record_status, flush_statuses
+
+
+class SqlitePragmasTests(SimpleTestCase):
+    def test_wal_on_new_connection(self):
+        with tempfile.TemporaryDirectory() as directory:
+            connections = ConnectionHandler({"default": {"ENGINE": "django.db.backends.sqlite3",
+                                                         "NAME": os.path.join(directory, "db.sqlite3")}})
+            try:
+                with connections["default"].cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+                    cursor.execute("PRAGMA synchronous")
+                    self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+                    cursor.execute("PRAGMA busy_timeout")
+                    self.assertEqual(cursor.fetchone()[0], 5000)
+            finally:
+                connections["default"].close()
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey", NIGTSCOUT_LINK="https://benc.com", SEND_SMS=False,
+                   TRIGGER_IFTTT=False, TO_NUMBERS=["+48111111111"], IFTTT_MAKERS=["maker"])
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        responses.start()
+        responses.add(responses.GET, "https://benc.com/api/v1/treatments",
+                      json=[{"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"},
+                            {"created_at": "2019-07-20T20:30:40+02:00", "notes": "Sensor changed"}], status=200)
+        responses.add(responses.GET, "https://api.atrigger.com/v1/tasks/create", status=200)
+
+    def tearDown(self):
+        responses.stop()
+        responses.reset()
+
+    @override_settings(DELIVERY_FLUSH_INTERVAL=3600)
+    def test_views_fit_in_budgets(self):
+        self.client.get(reverse("reminder") + "?key=mycoolsecretkey")  # first run creates rows
+        for receipts in (False, True):
+            for name in ("reminder", "quiet", "menu", "manage_ph_numbers", "manage_ifttt_makers"):
+                with self.subTest(view=name, receipts=receipts), self.settings(DELIVERY_RECEIPTS=receipts):
+                    if receipts:
+                        record_status("SM1", "+48111111111", "delivered")  # buffered delivery receipt
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(reverse(name) + "?key=mycoolsecretkey")
+                    self.assertEqual(response.status_code, 200)
+                    self.assertLessEqual(len(queries), settings.QUERY_BUDGETS[name])
+        flush_statuses()
+
+    @override_settings(QUERY_BUDGETS={"menu": 0})
+    def test_view_over_budget_is_logged(self):
+        with self.assertLogs("remider.middleware", "WARNING") as logs:
+            self.client.get(reverse("menu") + "?key=mycoolsecretkey")
+            self.client.get(reverse("home"))
+        self.assertEqual(len(logs.records), 1)
+        self.assertTrue(logs.records[0].getMessage().startswith("view menu made"))
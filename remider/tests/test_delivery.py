@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+import responses
+from django.shortcuts import reverse
+from django.test import TestCase, TransactionTestCase, override_settings
+from twilio.request_validator import RequestValidator
+
+from .. import delivery
+from ..api_interactions import send_messages
+from ..data_processing import get_trigger_model
+from ..delivery import record_status, flush_statuses, get_delivery_rates, get_undelivered_recipients
+from ..models import SmsDelivery
+from .test_api_interactions import MESSAGES_URL, MESSAGE_FIELDS, twilio_resource
+
+
+def clear_buffer():
+    """ drops statuses buffered by previous tests and their pending background flush """
+    delivery._buffer.clear()
+    if delivery._timer[0] is not None:
+        delivery._timer[0].cancel()
+        delivery._timer[0] = None
+
+
+@override_settings(DELIVERY_BATCH_SIZE=3, DELIVERY_FLUSH_INTERVAL=3600)
+class DeliveryTests(TestCase):
+    def setUp(self):
+        clear_buffer()
+        self.addCleanup(clear_buffer)
+
+    def test_statuses_saved_in_batches(self):
+        record_status("SM1", "+48111111111", "queued")
+        record_status("SM1", "+48111111111", "sent")
+        record_status("SM2", "+48222222222", "queued")
+        self.assertFalse(SmsDelivery.objects.exists())
+
+        with self.assertNumQueries(2):  # lookup and one insert of whole batch
+            record_status("SM3", "+48333333333", "queued")
+        self.assertEqual(SmsDelivery.objects.get(sid="SM1").status, "sent")
+        self.assertEqual(SmsDelivery.objects.count(), 3)
+
+    def test_older_status_does_not_replace_newer_one(self):
+        record_status("SM1", "+48111111111", "delivered")
+        record_status("SM1", "+48111111111", "sent")
+        flush_statuses()
+        record_status("SM1", "", "sending")
+        flush_statuses()
+        record_status("SM1", "", "undelivered", 30003)
+        flush_statuses()
+        saved = SmsDelivery.objects.get(sid="SM1")
+        self.assertEqual((saved.to, saved.status, saved.error_code), ("+48111111111", "undelivered", 30003))
+
+    def test_delivery_rates(self):
+        for sid, to, status in (("SM1", "+48111111111", "delivered"), ("SM2", "+48111111111", "failed"),
+                                ("SM3", "+48111111111", "sent"), ("SM4", "+48222222222", "queued")):
+            record_status(sid, to, status)
+        SmsDelivery.objects.create(sid="SM0", to="+48111111111", status="failed",
+                                   date=datetime.now(timezone.utc) - timedelta(days=40),
+                                   updated=datetime.now(timezone.utc))
+        self.assertEqual(len(get_delivery_rates(days=30)), 1)  # buffered status of SM4 isn`t counted
+
+        flush_statuses()
+        rates = get_delivery_rates(days=30)
+        self.assertEqual(rates, [
+            {"to": "+48111111111", "total": 3, "delivered": 1, "undelivered": 1, "rate": 0.5},
+            {"to": "+48222222222", "total": 1, "delivered": 0, "undelivered": 0, "rate": None},
+        ])
+
+    def test_undelivered_recipients(self):
+        now = datetime.now(timezone.utc)
+        for sid, to, status, hours in (("SM1", "+48111111111", "failed", 2),
+                                       ("SM2", "+48111111111", "delivered", 1),
+                                       ("SM3", "+48222222222", "undelivered", 1),
+                                       ("SM4", "+48333333333", "failed", 20)):
+            SmsDelivery.objects.create(sid=sid, to=to, status=status, date=now - timedelta(hours=hours), updated=now)
+        to_numbers = ["+48111111111", "+48222222222", "+48333333333"]
+        self.assertEqual(get_undelivered_recipients(hours=12, to_numbers=to_numbers), ["+48222222222"])
+        with self.settings(TO_NUMBERS=["+48111111111"]):  # removed number isn`t retried
+            self.assertEqual(get_undelivered_recipients(hours=12), [])
+
+
+@override_settings(DELIVERY_BATCH_SIZE=50, DELIVERY_FLUSH_INTERVAL=0.5)
+class BackgroundFlushTests(TransactionTestCase):
+    def setUp(self):
+        clear_buffer()
+        self.addCleanup(clear_buffer)
+
+    def test_statuses_saved_without_next_callback(self):
+        record_status("SM1", "+48111111111", "failed")
+        record_status("SM2", "+48222222222", "delivered")
+        timer = delivery._timer[0]
+        self.assertFalse(SmsDelivery.objects.exists())
+        timer.join(5)
+        self.assertEqual(SmsDelivery.objects.count(), 2)  # seen by other processes, e.g. --retry-undelivered
+        self.assertIsNone(delivery._timer[0])
+
+    def test_flush_cancels_pending_timer(self):
+        record_status("SM1", "+48111111111", "failed")
+        timer = delivery._timer[0]
+        self.assertEqual(flush_statuses(), 1)
+        timer.join(5)
+        self.assertFalse(timer.is_alive())
+        self.assertEqual(SmsDelivery.objects.count(), 1)
+
+
+@override_settings(TWILIO_AUTH_TOKEN="token", APP_NAME="benc-test", DELIVERY_BATCH_SIZE=1)
+class StatusCallbackViewTests(TestCase):
+    url = "https://benc-test.herokuapp.com/api/twilio/status/"
+    data = {"MessageSid": "SM1", "MessageStatus": "delivered", "To": "+48111111111", "AccountSid": "AC123"}
+
+    def setUp(self):
+        clear_buffer()
+        self.addCleanup(clear_buffer)
+
+    def post(self, data, signature=None):
+        if signature is None:
+            signature = RequestValidator("token").compute_signature(self.url, data)
+        return self.client.post(reverse("api-twilio-status"), data, HTTP_X_TWILIO_SIGNATURE=signature)
+
+    def test_signed_callback_saved(self):
+        response = self.post(self.data)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(SmsDelivery.objects.get(sid="SM1").status, "delivered")
+
+        response = self.post(dict(self.data, MessageSid="SM2", MessageStatus="failed", ErrorCode="30005"))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(SmsDelivery.objects.get(sid="SM2").error_code, 30005)
+
+    def test_invalid_signature(self):
+        self.assertEqual(self.post(self.data, signature="forged").status_code, 403)
+        self.assertEqual(self.client.get(reverse("api-twilio-status")).status_code, 405)
+        self.assertFalse(SmsDelivery.objects.exists())
+
+    def test_missing_fields(self):
+        self.assertEqual(self.post({"To": "+48111111111"}).status_code, 400)
+
+    @override_settings(SECRET_KEY="mycoolsecretkey", DELIVERY_RECEIPTS=True)
+    def test_menu_shows_delivery_rates(self):
+        get_trigger_model()  # row created by first run of menu isn`t counted in its budget
+        self.post(self.data)
+        response = self.client.get(reverse("menu") + "?key=mycoolsecretkey")
+        self.assertEqual(response.context["delivery_rates"][0]["rate"], 1)
+        self.assertContains(response, 'id="delivery_rates"')
+
+        with self.settings(DELIVERY_RECEIPTS=False):  # statistics aren`t queried if no receipts are requested
+            response = self.client.get(reverse("menu") + "?key=mycoolsecretkey")
+        self.assertNotContains(response, 'id="delivery_rates"')
+
+
+@override_settings(TWILIO_ACCOUNT_SID="AC123", TWILIO_AUTH_TOKEN="token", FROM_NUMBER="+48000000000",
+                   TWILIO_NOTIFY_SERVICE_SID="", TWILIO_MESSAGING_SERVICE_SID="", SMS_RATE=0, SMS_WORKERS=1,
+                   APP_NAME="benc-test", DELIVERY_BATCH_SIZE=50, DELIVERY_FLUSH_INTERVAL=3600)
+class SentMessagesTests(TestCase):
+    def setUp(self):
+        clear_buffer()
+        self.addCleanup(clear_buffer)
+
+    @staticmethod
+    def message_callback(request):
+        to = parse_qs(request.body)["To"][0]
+        return 201, {}, twilio_resource(MESSAGE_FIELDS, sid="SM" + to[-3:], status="queued", to=to)
+
+    @override_settings(DELIVERY_RECEIPTS=True)
+    @responses.activate
+    def test_status_callback_requested(self):
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        send_messages("text", ["+48111111111", "+48222222222"])
+        body = parse_qs(responses.calls[0].request.body)
+        self.assertEqual(body["StatusCallback"], ["https://benc-test.herokuapp.com/api/twilio/status/"])
+        self.assertEqual(flush_statuses(), 2)
+        self.assertEqual(SmsDelivery.objects.get(sid="SM222").status, "queued")
+
+    @override_settings(DELIVERY_RECEIPTS=False)
+    @responses.activate
+    def test_receipts_off(self):
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        send_messages("text", ["+48111111111"])
+        self.assertNotIn("StatusCallback", parse_qs(responses.calls[0].request.body))
+        self.assertEqual(flush_statuses(), 0)
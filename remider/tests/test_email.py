@@ -0,0 +1,147 @@
+import socket
+import socketserver
+import threading
+from datetime import datetime, timezone
+
+from django.test import TestCase, override_settings
+
+from .. import api_interactions
+from ..api_interactions import send_emails, send_email, notify, close_smtp_connection
+from ..tenancy import PatientConfig
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    """ local SMTP server recording sessions, commands and messages (replies to RCPT can be scripted) """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SmtpHandler)
+        self.sessions = 0
+        self.commands = []
+        self.messages = []  # (recipients, data)
+        self.rcpt_replies = []  # replies to next RCPT commands, "250 OK" when empty
+        self.drop_after = None  # number of messages after which connection is dropped
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        server.sessions += 1
+        self.reply("220 stub ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            server.commands.append(verb)
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                reply = server.rcpt_replies.pop(0) if server.rcpt_replies else "250 OK"
+                if reply.startswith("250"):
+                    recipients.append(command.split(":", 1)[1].strip("<> "))
+                self.reply(reply)
+            elif verb == "DATA":
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                    data.append(data_line)
+                server.messages.append((recipients, b"".join(data).decode()))
+                self.reply("250 OK")
+                if len(server.messages) == server.drop_after:
+                    return
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 command not implemented")
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend", EMAIL_HOST="127.0.0.1",
+                   EMAIL_HOST_USER="", EMAIL_HOST_PASSWORD="", EMAIL_USE_TLS=False, EMAIL_TIMEOUT=5,
+                   EMAIL_RETRIES=2, EMAIL_RETRY_DELAY=0, EMAIL_SUBJECT="Sugarbot",
+                   DEFAULT_FROM_EMAIL="bot@benc.com", NOTIFICATION_DEDUPE=True)
+class SmtpEmailTests(TestCase):
+    recipients = ["mum@benc.com", "dad@benc.com", "nurse@benc.com"]
+
+    def setUp(self):
+        self.server = SmtpStub()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        port = override_settings(EMAIL_PORT=self.server.server_address[1])
+        port.enable()
+        self.addCleanup(port.disable)
+        api_interactions._smtp_connection[0] = None
+
+    def tearDown(self):
+        close_smtp_connection()
+        api_interactions._smtp_connection[0] = None
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_one_session_for_all_recipients(self):
+        self.assertEqual(send_emails("text", self.recipients), dict.fromkeys(self.recipients, True))
+        self.assertTrue(send_email("text", ["mum@benc.com"]))  # connection is kept open between notifications
+        self.assertEqual(self.server.sessions, 1)
+        self.assertEqual(self.server.commands.count("NOOP"), 1)  # reused connection is checked once per batch
+        self.assertEqual([recipients for recipients, _ in self.server.messages],
+                         [[recipient] for recipient in self.recipients + ["mum@benc.com"]])
+        self.assertIn("Subject: Sugarbot", self.server.messages[0][1])
+        self.assertIn("text", self.server.messages[0][1])
+
+    def test_transient_refusal_retried_on_same_connection(self):
+        self.server.rcpt_replies = ["451 try again later"]
+        self.assertTrue(send_email("text", ["mum@benc.com"]))
+        self.assertEqual(self.server.sessions, 1)
+        self.assertEqual(self.server.commands.count("MAIL"), 2)
+        self.assertIn("RSET", self.server.commands)
+
+    def test_permanent_refusal_not_retried(self):
+        self.server.rcpt_replies = ["250 OK", "550 no such user"]
+        with self.assertLogs("remider.api_interactions", "ERROR") as logs:
+            statuses = send_emails("text", self.recipients)
+        self.assertEqual(statuses, {"mum@benc.com": True, "dad@benc.com": False, "nurse@benc.com": True})
+        self.assertEqual(logs.records[0].status, 550)
+        self.assertEqual(self.server.commands.count("MAIL"), 3)
+        self.assertEqual(self.server.sessions, 1)
+
+    def test_dropped_connection_reopened(self):
+        self.server.drop_after = 1
+        self.assertEqual(send_emails("text", self.recipients[:2]), dict.fromkeys(self.recipients[:2], True))
+        self.assertEqual(self.server.sessions, 2)
+        self.assertEqual(len(self.server.messages), 2)
+
+    @override_settings(EMAIL_RETRIES=0)
+    def test_stale_connection_reopened(self):
+        self.server.drop_after = 1  # server closes connection while it`s idle
+        self.assertTrue(send_email("text", ["mum@benc.com"]))
+        self.assertTrue(send_email("text", ["dad@benc.com"]))
+        self.assertEqual(self.server.sessions, 2)
+        self.assertEqual(len(self.server.messages), 2)
+
+    def test_unreachable_server(self):
+        with socket.socket() as closed:
+            closed.bind(("127.0.0.1", 0))
+            port = closed.getsockname()[1]
+        with self.settings(EMAIL_PORT=port), self.assertLogs("remider.api_interactions", "ERROR"):
+            self.assertFalse(send_email("text", ["mum@benc.com"]))
+        self.assertEqual(self.server.sessions, 0)
+
+    def test_notify_by_email(self):
+        config = PatientConfig("https://benc.com", 72, 144, [], [], False, False, self.recipients[:2], True)
+        events = [("infusion", datetime(2019, 7, 1, tzinfo=timezone.utc), 24)]
+        self.assertTrue(notify("text", config, events))
+        self.assertTrue(notify("text", config, events))
+        self.assertEqual(len(self.server.messages), 2)
@@ -0,0 +1,90 @@
+import tempfile
+from io import StringIO
+
+import responses
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+
+from ..data_processing import process_treatments
+from ..export import iter_changes
+from ..models import ChangeHistory, Patient
+from ..treatment_store import append_treatments
+
+TREATMENTS = [
+    {"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed", "_id": "a"},
+    {"created_at": "2019-07-20T20:30:40+02:00", "notes": "Sensor changed", "_id": "b"},
+    {"created_at": "2019-07-18T20:30:40+02:00", "notes": "Reservoir changed", "_id": "c"},
+    {"created_at": "2019-07-18T08:00:00+02:00", "notes": "carb 12g 1.3U"},
+    {"created_at": "2019-07-10T20:30:40+02:00", "notes": "Sensor changed", "_id": "d"},
+]
+
+
+class ChangeHistoryTests(TestCase):
+    def test_history_without_duplicates(self):
+        process_treatments(TREATMENTS)
+        process_treatments(TREATMENTS[:2])
+        self.assertEqual(ChangeHistory.objects.filter(patient=None).count(), 4)
+
+        patient = Patient.objects.create(name="jan", nightscout_link="https://jan.com")
+        process_treatments(TREATMENTS, patient)
+        process_treatments(TREATMENTS, patient)
+        self.assertEqual(ChangeHistory.objects.filter(patient=patient).count(), 4)
+
+    def test_intervals(self):
+        process_treatments(TREATMENTS)
+        rows = list(iter_changes())
+        self.assertEqual([(row["kind"], row["interval_hours"]) for row in rows],
+                         [("infusion", None), ("infusion", 72), ("sensor", None), ("sensor", 240)])
+        self.assertEqual(rows[1]["treatment_id"], "a")
+
+
+class ExportChangesCommandTests(TestCase):
+    def setUp(self):
+        process_treatments(TREATMENTS)
+
+    def test_stdout(self):
+        out = StringIO()
+        call_command("export_changes", "--format", "ndjson", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+    def test_file(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".csv") as file:
+            call_command("export_changes", "--output", file.name)
+            self.assertEqual(len(file.read().splitlines()), 5)
+
+
+@override_settings(NIGTSCOUT_LINK="https://benc.com")
+class BackfillTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(TREATMENT_STORE=self.directory.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_from_store(self):
+        append_treatments(TREATMENTS)
+        process_treatments(TREATMENTS[:1])  # recorded after deployment
+        call_command("export_changes", "--backfill", stdout=StringIO(), stderr=StringIO())
+        call_command("export_changes", "--backfill", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(ChangeHistory.objects.filter(patient=None).count(), 4)
+        self.assertEqual([row["interval_hours"] for row in iter_changes()], [None, 72, None, 240])
+
+    @responses.activate
+    def test_from_nightscout(self):
+        responses.add(responses.GET, "https://benc.com/api/v1/treatments", json=TREATMENTS)
+        append_treatments(TREATMENTS[2:])
+        err = StringIO()
+        call_command("export_changes", "--backfill", "1000", stdout=StringIO(), stderr=err)
+        self.assertIn("count=1000", responses.calls[0].request.url)
+        self.assertIn("4", err.getvalue())
+        self.assertEqual(sorted(ChangeHistory.objects.values_list("treatment_id", flat=True)), ["a", "b", "c", "d"])
+
+    @responses.activate
+    def test_nightscout_error(self):
+        responses.add(responses.GET, "https://benc.com/api/v1/treatments", status=500)
+        with self.assertRaises(CommandError):
+            call_command("export_changes", "--backfill", "1000", stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(ChangeHistory.objects.exists())
@@ -11,7 +11,7 @@ from django.conf import settings
 class IFTTTTests(HerokuFunctionalTest):
 
     def get_inputs_list(self):
-        return self.wait_for_finding(lambda: self.browser.find_elements_by_id("id_new_value"))
+        return self.wait_for_finding(lambda: self.browser.find_elements_by_css_selector("input[id$='-value']"))
 
     def get_input(self, id):
         return self.get_inputs_list()[id]
@@ -27,31 +27,22 @@ class IFTTTTests(HerokuFunctionalTest):
                     raise e
                 time.sleep(0.5)
 
+    def save(self):
+        self.wait_for_finding(lambda: self.browser.find_element_by_name("save_button").click())
+
     def postInput(self, indx, new_value):
         input = self.get_input(indx)
         input.send_keys(new_value)
-        self.wait_for_finding(lambda: self.browser.find_elements_by_css_selector(".btn-primary")[indx].click())
+        self.save()
 
     def changeInput(self, indx, new_value):
         input = self.get_input(indx)
         input.clear()
         input.send_keys(new_value)
-        self.wait_for_finding(lambda: self.browser.find_elements_by_css_selector(".btn-primary")[indx].click())
 
-    def fix_local_variables(self, new_value, chanaged=False, indx=None):
+    def fix_local_variables(self, values):
         if self.live_server_url.startswith("http://localhost"):
-            if not chanaged:
-                settings.IFTTT_MAKERS.append(new_value)
-            else:
-                settings.IFTTT_MAKERS[indx] = new_value
-
-    def delete(self, expected):
-        self.wait_for_finding(lambda: self.browser.find_element_by_css_selector(".btn-danger")).click()
-        self.wait_and_assertUrlNow("manage_ifttt_makers",
-                                   extras="&delinfo=1&delid={}".format(len(settings.IFTTT_MAKERS)))
-        alert = self.wait_for_finding(lambda: self.browser.find_element_by_css_selector(".alert"))
-        self.assertIn("alert-danger", alert.get_attribute("class"))
-        self.assertEqual(settings.IFTTT_MAKERS.pop(-1), expected)
+            settings.IFTTT_MAKERS[:] = values
 
     @override_settings(SECRET_KEY="mycoolsecretkey", LANGUAGE_CODE='en', app_name="benc-test", DEBUG=True,
                        IFTTT_MAKERS=[], )
@@ -61,41 +52,29 @@ class IFTTTTests(HerokuFunctionalTest):
         self.wait_and_assertUrlNow("manage_ifttt_makers")
         self.check_alert()
         self.assertInputsLen(2)
-        self.fix_local_variables("maker one")
+        self.fix_local_variables(["maker one"])
 
         self.postInput(1, "maker two")
         self.wait_and_assertUrlNow("manage_ifttt_makers")
         self.check_alert()
         self.assertInputsLen(3)
-        self.fix_local_variables("maker two")
-
-        self.postInput(2, "maker three")
-        self.wait_and_assertUrlNow("manage_ifttt_makers")
-        self.check_alert()
-        self.assertInputsLen(4)
-        self.fix_local_variables("maker three")
+        self.fix_local_variables(["maker one", "maker two"])
 
+        # add, change and delete in one submission
         self.changeInput(0, "changed maker one")
+        self.get_input(2).send_keys("maker three")
+        self.wait_for_finding(lambda: self.browser.find_element_by_id("id_form-1-DELETE")).click()
+        self.save()
         self.wait_and_assertUrlNow("manage_ifttt_makers")
         self.check_alert()
-        self.assertInputsLen(4)
-        self.fix_local_variables("changed maker one", chanaged=True, indx=0)
-
-        self.delete("maker three")
         self.assertInputsLen(3)
+        self.assertEqual(self.get_input(0).get_attribute("value"), "changed maker one")
+        self.assertEqual(self.get_input(1).get_attribute("value"), "maker three")
+        self.fix_local_variables(["changed maker one", "maker three"])
 
-        self.delete("maker two")
-        self.assertInputsLen(2)
-
-        self.wait_and_assertUrlNow("manage_ifttt_makers", extras="&delinfo=1&delid=2")
-        self.postInput(1, "new maker two")
-        self.wait_and_assertUrlNow("manage_ifttt_makers", extras="&delinfo=1&delid=2")
-        self.wait_for_finding(lambda: self.check_alert())
-        self.assertInputsLen(3)
-        self.fix_local_variables("new maker two")
-
-        self.changeInput(1, "cool maker")
-        self.wait_and_assertUrlNow("manage_ifttt_makers", extras="&delinfo=1&delid=2")
+        self.wait_for_finding(lambda: self.browser.find_element_by_id("id_form-1-DELETE")).click()
+        self.save()
+        self.wait_and_assertUrlNow("manage_ifttt_makers")
         self.check_alert()
-        self.assertInputsLen(3)
-        self.fix_local_variables("cool maker", chanaged=True, indx=1)
+        self.assertInputsLen(2)
+        self.fix_local_variables(["changed maker one"])
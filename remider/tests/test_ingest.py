@@ -0,0 +1,67 @@
+import io
+import json
+
+from django.core.exceptions import RequestDataTooBig
+from django.test import TestCase
+
+from ..data_processing import process_treatments
+from ..ingest import iter_json_objects, dedupe_treatments, ingest_treatments, LimitedReader
+from ..models import InfusionChanged, SensorChanged, ChangeHistory
+
+TREATMENTS = [
+    {"_id": "a", "created_at": "2019-07-22T08:33:35+02:00", "notes": "zażółć gęślą jaźń", "insulin": 1.5},
+    {"_id": "b", "created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"},
+    {"_id": "c", "created_at": "2019-07-20T20:30:40+02:00", "notes": "Sensor changed"},
+]
+
+
+class IngestTests(TestCase):
+    def parse(self, body, chunk_size):
+        return list(iter_json_objects(io.BytesIO(body.encode()), chunk_size))
+
+    def test_json_array_and_ndjson(self):
+        array = json.dumps(TREATMENTS, ensure_ascii=False)
+        ndjson = "\n".join(json.dumps(treatment, ensure_ascii=False) for treatment in TREATMENTS) + "\n"
+        for body in (array, ndjson):
+            for chunk_size in (1, 7, 1024):  # chunks split objects and multibyte characters
+                self.assertEqual(self.parse(body, chunk_size), TREATMENTS)
+        self.assertEqual(self.parse("[]", 1), [])
+        self.assertEqual(self.parse("", 1), [])
+
+    def test_invalid_body(self):
+        with self.assertRaises(ValueError):
+            self.parse('[{"_id": "a"}, {"_id": ', 4)
+        with self.assertRaises(ValueError):
+            list(iter_json_objects(io.BytesIO(b'[{"notes": "\xff"}]')))
+        with self.assertRaises(ValueError):
+            dedupe_treatments([1, 2])
+        for created_at in ("yesterday", "2019-13-01T10:00:00Z", 1563733840):
+            with self.subTest(created_at=created_at), self.assertRaises(ValueError):
+                dedupe_treatments([{"created_at": created_at, "notes": "Reservoir changed"}])
+
+    def test_dedupe(self):
+        treatments, duplicates = dedupe_treatments(list(reversed(TREATMENTS)) + TREATMENTS[:1] + [{"notes": "x"}])
+        self.assertEqual(duplicates, 1)
+        self.assertEqual([treatment.get("_id") for treatment in treatments], ["a", "b", "c", None])
+
+    def test_ingest_in_one_transaction(self):
+        body = "\n".join(json.dumps(treatment) for treatment in TREATMENTS + TREATMENTS[1:2])
+        treatments, duplicates, changed = ingest_treatments(io.BytesIO(body.encode()))
+        self.assertEqual((len(treatments), duplicates, changed), (3, 1, True))
+        self.assertEqual(InfusionChanged.objects.get().date.day, 21)
+        self.assertEqual(SensorChanged.objects.get().date.day, 20)
+        self.assertEqual(ChangeHistory.objects.count(), 2)
+
+    def test_older_pushed_changes_dont_replace_newer(self):
+        process_treatments(TREATMENTS)
+        old = [{"_id": "d", "created_at": "2019-07-18T20:30:40+02:00", "notes": "Reservoir changed"}]
+        self.assertFalse(ingest_treatments(io.BytesIO(json.dumps(old).encode()))[2])
+        self.assertEqual(InfusionChanged.objects.get().date.day, 21)
+        self.assertEqual(ChangeHistory.objects.filter(kind="infusion").count(), 2)
+
+    def test_body_size_limited(self):
+        body = json.dumps(TREATMENTS).encode()
+        with self.assertRaises(RequestDataTooBig):
+            ingest_treatments(LimitedReader(io.BytesIO(body), len(body) - 1))
+        self.assertFalse(InfusionChanged.objects.exists())
+        self.assertEqual(len(ingest_treatments(LimitedReader(io.BytesIO(body), len(body)))[0]), 3)
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+import responses
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from ..api_interactions import notify
+from ..ledger import get_bucket, get_events, get_pending_recipients, record_notifications, get_problems_bucket
+from ..models import NotificationLedger
+from ..tenancy import PatientConfig
+from .test_api_interactions import MESSAGES_URL, MESSAGE_FIELDS, twilio_resource
+
+IFTTT_URL = "https://maker.ifttt.com/trigger/sugarbot-notification/with/key/{}"
+
+
+@override_settings(REMINDER_OFFSETS=[24, 6, 0])
+class BucketTests(SimpleTestCase):
+    def test_bucket(self):
+        self.assertEqual(get_bucket(timedelta(hours=70)), 72)
+        self.assertEqual(get_bucket(timedelta(hours=48)), 48)
+        self.assertEqual(get_bucket(timedelta(hours=30)), 48)
+        self.assertEqual(get_bucket(timedelta(hours=20)), 24)
+        self.assertEqual(get_bucket(timedelta(hours=5, minutes=30)), 6)
+        self.assertEqual(get_bucket(timedelta(minutes=-30)), 0)
+        self.assertEqual(get_bucket(timedelta(hours=-5)), -24)
+        self.assertEqual(get_bucket(timedelta(hours=-30)), -48)
+
+    def test_events_of_known_changes(self):
+        date = datetime(2019, 7, 1, tzinfo=timezone.utc)
+        self.assertEqual(get_events(date, timedelta(hours=20), None, None), [("infusion", date, 24)])
+
+    def test_events_of_cgm_and_reservoir(self):
+        date = datetime(2019, 7, 1, tzinfo=timezone.utc)
+        forecast = {"remaining": 10, "empty_in": 5 * 3600 * 10 ** 6, "changed": date - timedelta(days=1)}
+        events = get_events(None, None, date, timedelta(hours=50), ["3 signal gaps"], forecast)
+        self.assertEqual(events, [("sensor", date, 72), ("cgm", date, get_problems_bucket(["3 signal gaps"])),
+                                  ("reservoir", date - timedelta(days=1), 6)])
+        self.assertEqual(get_events(None, None, date, None, [], dict(forecast, empty_in=None)), [])
+
+    def test_problems_bucket(self):
+        self.assertEqual(get_problems_bucket(["3 signal gaps", "noisy readings"]),
+                         get_problems_bucket(["noisy readings", "5 signal gaps"]))  # growing counts don`t matter
+        self.assertNotEqual(get_problems_bucket(["3 signal gaps"]),
+                            get_problems_bucket(["3 signal gaps", "noisy readings"]))
+
+
+@override_settings(NOTIFICATION_DEDUPE=True, REMINDER_OFFSETS=[24, 6, 0])
+class LedgerTests(TestCase):
+    date = datetime(2019, 7, 1, tzinfo=timezone.utc)
+    events = [("infusion", date, 24), ("sensor", date, 72)]
+
+    def test_pending_recipients_in_one_query(self):
+        record_notifications(["+48111111111"], self.events)
+        record_notifications(["+48222222222"], self.events[:1])
+        with self.assertNumQueries(1):
+            pending = get_pending_recipients(["+48111111111", "+48222222222", "maker"], self.events)
+        self.assertEqual(pending, ["+48222222222", "maker"])
+        self.assertEqual(get_pending_recipients(["+48111111111"], [("infusion", self.date, 6)]), ["+48111111111"])
+        self.assertEqual(get_pending_recipients(["+48111111111"], []), ["+48111111111"])
+
+    def test_new_warning_not_deduplicated(self):
+        record_notifications(["+48111111111"], self.events)
+        cgm_event = ("cgm", self.date, get_problems_bucket(["noisy readings"]))
+        self.assertEqual(get_pending_recipients(["+48111111111"], self.events + [cgm_event]), ["+48111111111"])
+        record_notifications(["+48111111111"], self.events + [cgm_event])
+        self.assertEqual(get_pending_recipients(["+48111111111"], self.events + [cgm_event]), [])
+
+    @override_settings(NOTIFICATION_DEDUPE=False)
+    def test_dedupe_off(self):
+        record_notifications(["+48111111111"], self.events)
+        self.assertFalse(NotificationLedger.objects.exists())
+        self.assertEqual(get_pending_recipients(["+48111111111"], self.events), ["+48111111111"])
+
+    @override_settings(NOTIFICATION_LEDGER_DAYS=30)
+    def test_old_entries_removed(self):
+        NotificationLedger.objects.create(recipient="+48111111111", kind="infusion", change_date=self.date, bucket=0,
+                                          date=datetime.now(timezone.utc) - timedelta(days=31))
+        record_notifications(["+48111111111"], self.events)
+        self.assertEqual(NotificationLedger.objects.count(), 2)
+
+
+@override_settings(NOTIFICATION_DEDUPE=True, TWILIO_ACCOUNT_SID="AC123", TWILIO_AUTH_TOKEN="token",
+                   FROM_NUMBER="+48000000000", TWILIO_NOTIFY_SERVICE_SID="", TWILIO_MESSAGING_SERVICE_SID="",
+                   SMS_RATE=0, SMS_WORKERS=1, DELIVERY_RECEIPTS=False)
+class NotifyTests(TestCase):
+    date = datetime(2019, 7, 1, tzinfo=timezone.utc)
+    config = PatientConfig("https://benc.com", 72, 144, ["+48111111111", "+48222222222"], ["maker1", "maker2"],
+                           True, True)
+
+    @staticmethod
+    def message_callback(request):
+        to = parse_qs(request.body)["To"][0]
+        if to == "+48222222222":
+            return 400, {}, '{"code": 21211, "message": "invalid number", "status": 400}'
+        return 201, {}, twilio_resource(MESSAGE_FIELDS, sid="SM" + to[-3:], status="queued", to=to)
+
+    def sent_to(self):
+        return [parse_qs(call.request.body)["To"][0] if "twilio" in call.request.url else call.request.url[-6:]
+                for call in responses.calls]
+
+    @responses.activate
+    def test_repeated_notification_skipped(self):
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        responses.add(responses.POST, IFTTT_URL.format("maker1"), status=200)
+        responses.add(responses.POST, IFTTT_URL.format("maker2"), status=401)
+        events = [("infusion", self.date, 24)]
+
+        self.assertFalse(notify("text", self.config, events))
+        self.assertEqual(sorted(self.sent_to()), ["+48111111111", "+48222222222", "maker1", "maker2"])
+
+        responses.calls.reset()
+        self.assertFalse(notify("text", self.config, events))  # only failed recipients are retried
+        self.assertEqual(sorted(self.sent_to()), ["+48222222222", "maker2"])
+
+        responses.calls.reset()
+        self.assertFalse(notify("text", self.config, [("infusion", self.date, 6)]))
+        self.assertEqual(len(responses.calls), 4)
+
+    @responses.activate
+    def test_full_text_sent_by_webhook(self):
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        responses.add(responses.POST, IFTTT_URL.format("maker1"), status=200)
+        config = self.config._replace(to_numbers=["+48111111111"], ifttt_makers=["maker1"])
+        self.assertTrue(notify("short text", config, full_text="full text"))
+        self.assertEqual(parse_qs(responses.calls[0].request.body)["Body"], ["short text"])
+        self.assertEqual(parse_qs(responses.calls[1].request.body)["value1"], ["full text"])
+
+    @responses.activate
+    def test_notification_without_events_always_sent(self):
+        responses.add_callback(responses.POST, MESSAGES_URL, callback=self.message_callback)
+        config = self.config._replace(to_numbers=["+48111111111"], trigger_ifttt=False)
+        self.assertTrue(notify("text", config))
+        self.assertTrue(notify("text", config))
+        self.assertEqual(len(responses.calls), 2)
+        self.assertFalse(NotificationLedger.objects.exists())
@@ -0,0 +1,110 @@
+import json
+import logging
+import queue
+from io import StringIO
+
+import responses
+from django.shortcuts import reverse
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from ..api_interactions import send_webhook_IFTTT, send_messages
+from ..log import DroppingQueueHandler, DrainingQueueListener, JsonFormatter, RequestIdFilter, mask, request_id
+from .test_api_interactions import MESSAGES_URL
+
+
+class LogPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.queue = queue.Queue(2)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.handler.addFilter(RequestIdFilter())
+        self.logger = logging.getLogger("remider.tests.log")
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_structured_records_written_by_listener(self):
+        stream = StringIO()
+        output = logging.StreamHandler(stream)
+        output.setFormatter(JsonFormatter())
+        listener = DrainingQueueListener(self.queue, output)
+        listener.start()
+
+        token = request_id.set("abc")
+        try:
+            self.logger.error("unsuccessful %s", "notification",
+                              extra={"stage": "notify", "recipient": mask("+48123456789"), "latency": 0.25})
+        finally:
+            request_id.reset(token)
+        try:
+            raise ValueError("wrong")
+        except ValueError:
+            self.logger.exception("failed")
+        listener.stop()
+
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(first["message"], "unsuccessful notification")
+        self.assertEqual(first["request_id"], "abc")
+        self.assertEqual(first["stage"], "notify")
+        self.assertEqual(first["recipient"], "****6789")
+        self.assertEqual(first["latency"], 250)
+        self.assertEqual(first["level"], "ERROR")
+        self.assertIsNone(second["request_id"])
+        self.assertIn("ValueError: wrong", second["exc_info"])
+
+    def test_full_queue_drops_records(self):
+        for i in range(3):
+            self.logger.warning("record %s", i)
+        self.assertEqual(self.queue.qsize(), 2)
+        self.assertEqual(self.handler.dropped, 1)
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey", QUERY_BUDGETS={"menu": 0})
+class RequestIdTests(TestCase):
+    def test_request_id_in_header_and_records(self):
+        log_queue = queue.Queue()
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(RequestIdFilter())
+        logger = logging.getLogger("remider.middleware")
+        logger.addHandler(handler)
+        try:
+            response = self.client.get(reverse("menu") + "?key=mycoolsecretkey", HTTP_X_REQUEST_ID="router-id")
+        finally:
+            logger.removeHandler(handler)
+
+        self.assertEqual(response["X-Request-ID"], "router-id")
+        self.assertEqual(log_queue.get_nowait().request_id, "router-id")
+        self.assertEqual(len(self.client.get(reverse("home"))["X-Request-ID"]), 32)
+        self.assertIsNone(request_id.get())
+
+
+class NotificationLogTests(SimpleTestCase):
+    @override_settings(TWILIO_ACCOUNT_SID="AC123", TWILIO_AUTH_TOKEN="token", FROM_NUMBER="+48000000000",
+                       TWILIO_NOTIFY_SERVICE_SID="", TWILIO_MESSAGING_SERVICE_SID="", SMS_RATE=0, SMS_WORKERS=2,
+                       DELIVERY_RECEIPTS=False)
+    @responses.activate
+    def test_request_id_of_concurrent_sms(self):
+        responses.add(responses.POST, MESSAGES_URL, status=400, json={"code": 21211, "message": "invalid"})
+        log_queue = queue.Queue()
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(RequestIdFilter())
+        logger = logging.getLogger("remider.api_interactions")
+        logger.addHandler(handler)
+        token = request_id.set("router-id")
+        try:
+            send_messages("text", ["+48111111111", "+48222222222"])
+        finally:
+            request_id.reset(token)
+            logger.removeHandler(handler)
+        self.assertEqual([log_queue.get_nowait().request_id for _ in range(2)], ["router-id"] * 2)
+
+    @responses.activate
+    def test_unsuccessful_webhook(self):
+        responses.add(responses.POST, "https://maker.ifttt.com/trigger/sugarbot-notification/with/key/secretmaker",
+                      status=401)
+        with self.assertLogs("remider.api_interactions", "ERROR") as logs:
+            self.assertFalse(send_webhook_IFTTT("text", makers=["secretmaker"]))
+        self.assertEqual(logs.records[0].recipient, "****aker")
+        self.assertEqual(logs.records[0].status, 401)
+        self.assertEqual(logs.records[0].stage, "notify")
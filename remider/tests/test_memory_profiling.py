@@ -0,0 +1,93 @@
+import tracemalloc
+
+import responses
+
+from django.shortcuts import reverse
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from ..memory_profiling import StageProfiler, get_report, record, reset, sample_rss, start_tracing, stop_tracing
+
+
+class MemoryProfilingTests(SimpleTestCase):
+    def setUp(self):
+        reset()
+
+    def test_record_and_report(self):
+        record("views", "export", 100, 1000)
+        record("views", "export", -50, 3000)
+        record("views", "home", 10, 10)
+        record("stages", "fetch", 20, None)
+
+        report = get_report()
+        self.assertEqual(report["views"], [("export", 2, 25, 100, 2000, 3000), ("home", 1, 10, 10, 10, 10)])
+        self.assertEqual(report["stages"], [("fetch", 1, 20, 20, None, 0)])
+
+    def test_stage_profiler(self):
+        StageProfiler().mark("fetch")  # not traced
+        self.assertEqual(get_report()["stages"], [])
+
+        self.assertTrue(start_tracing())
+        self.assertFalse(start_tracing())  # only one request at a time
+        try:
+            profiler = StageProfiler()
+            data = [bytearray(10 ** 6)]
+            profiler.mark("fetch")
+            del data[:]
+            profiler.mark("infusion and sensor")
+        finally:
+            net, peak = stop_tracing()
+        self.assertFalse(tracemalloc.is_tracing())
+
+        stages = dict((row[0], row) for row in get_report()["stages"])
+        self.assertGreater(stages["fetch"][2], 10 ** 6)
+        self.assertLess(stages["infusion and sensor"][2], -10 ** 6 + 10 ** 5)
+        self.assertGreater(peak, 10 ** 6)  # peak of request isn`t lost by resets of stages
+
+    @override_settings(MEMORY_RSS_INTERVAL=10)
+    def test_rss_interval(self):
+        sample_rss(100)
+        sample_rss(105)
+        sample_rss(110)
+        self.assertEqual([timestamp for timestamp, rss in get_report()["rss"]], [100, 110])
+        self.assertGreater(get_report()["rss"][0][1], 0)
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey", MEMORY_RSS_INTERVAL=0)
+class MemoryViewTests(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_requires_key(self):
+        response = self.client.get(reverse("memory"))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(MEMORY_PROFILING_RATE=0)
+    def test_disabled(self):
+        self.client.get(reverse("home"))
+        self.assertEqual(get_report(), {"views": [], "stages": [], "rss": []})
+
+    @override_settings(MEMORY_PROFILING_RATE=1)
+    def test_views_aggregated_by_url_name(self):
+        self.client.get(reverse("home"))
+        self.client.get(reverse("home"))
+        self.client.get(reverse("export") + "?key=mycoolsecretkey")
+
+        response = self.client.get(reverse("memory") + "?key=mycoolsecretkey")
+        self.assertTemplateUsed(response, "remider/memory.html")
+        views = dict((row[0], row) for row in response.context["views"])
+        self.assertEqual(views["home"][1], 2)
+        self.assertEqual(views["export"][1], 1)
+        self.assertGreater(views["home"][5], 0)
+        self.assertTrue(response.context["rss"])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    @override_settings(MEMORY_PROFILING_RATE=1, NIGTSCOUT_LINK="https://benc.com", TREATMENT_STORE="")
+    @responses.activate
+    def test_stages_of_reminder(self):
+        responses.add(responses.GET, "https://benc.com/api/v1/treatments",
+                      json=[{"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"}], status=200)
+        self.client.get(reverse("quiet") + "?key=mycoolsecretkey")
+
+        report = get_report()
+        self.assertEqual([row[0] for row in report["views"]], ["quiet"])
+        self.assertEqual({row[0] for row in report["stages"]}, {"fetch", "infusion and sensor"})
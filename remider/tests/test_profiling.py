@@ -0,0 +1,26 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from ..profiling import measure_startup, get_imported_modules
+
+
+class StartupBudgetTests(SimpleTestCase):
+    def test_cold_start_fits_in_budget(self):
+        report = measure_startup()
+        self.assertLess(report["setup"] + report["urls"], settings.STARTUP_BUDGET)
+
+        modules = get_imported_modules(report)
+        self.assertIn("remider.views", modules)
+        self.assertNotIn("twilio.rest", modules)  # imported on first sms
+
+    def test_startup_report_command(self):
+        out = StringIO()
+        with self.assertRaises(SystemExit) as cm:
+            call_command("startup_report", "--top", "5", "--budget", "0", stdout=out)
+        self.assertEqual(cm.exception.code, 1)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("module"))
+        self.assertIn("django.setup", lines[6])
@@ -0,0 +1,81 @@
+import time as timer
+from datetime import datetime, timedelta, timezone
+
+from django.test import SimpleTestCase
+
+from ..reservoir import get_insulin_arrays, delivered_between, forecast_reservoir, get_sms_txt_reservoir
+from ..vectorized import to_microseconds, HOUR, DAY
+
+
+class ReservoirTests(SimpleTestCase):
+    start = datetime(2019, 7, 20, tzinfo=timezone.utc)
+
+    def treatment(self, hours, **fields):
+        fields["created_at"] = (self.start + timedelta(hours=hours)).isoformat()
+        return fields
+
+    def test_get_insulin_arrays(self):
+        arrays = get_insulin_arrays([
+            self.treatment(30, eventType="Meal Bolus", insulin=2.5, notes="carb 25g 2.5U"),
+            self.treatment(20, eventType="Temp Basal", absolute=0.8, duration=30),
+            self.treatment(10, eventType="Note", notes="Reservoir changed"),
+            self.treatment(5, eventType="Note", notes="Sensor changed"),
+            self.treatment(0, eventType="Note", notes="Reservoir changed"),
+        ])
+        self.assertEqual(len(arrays["changes"]), 2)
+        self.assertLess(arrays["changes"][0], arrays["changes"][1])
+        self.assertEqual(list(arrays["boluses"]), [2.5])
+        self.assertEqual(list(arrays["basal_rates"]), [0.8])
+        self.assertEqual(list(arrays["basal_durations"]), [30])
+
+    def test_delivered_between(self):
+        arrays = get_insulin_arrays([
+            self.treatment(1, eventType="Meal Bolus", insulin=4),
+            self.treatment(2, eventType="Temp Basal", absolute=2, duration=120),
+        ])
+        starts, ends = to_microseconds([self.start, self.start + timedelta(hours=3)]), \
+            to_microseconds([self.start + timedelta(hours=3), self.start + timedelta(hours=10)])
+        # 4U bolus + 1h of temp basal + 2h of scheduled basal; 1h of temp basal + 6h of scheduled basal
+        self.assertEqual(list(delivered_between(arrays, starts, ends, basal_rate=1)), [4 + 2 + 2, 2 + 6])
+
+    def test_overlapping_temp_basals(self):
+        # pump sets a new 30-minute temp basal every 5 minutes, each one replaces the previous
+        arrays = get_insulin_arrays([self.treatment(minutes / 60, eventType="Temp Basal", absolute=1, duration=30)
+                                     for minutes in reversed(range(0, 12 * 60, 5))])
+        delivered = delivered_between(arrays, to_microseconds([self.start]),
+                                      to_microseconds([self.start + timedelta(hours=12)]), basal_rate=3)
+        self.assertAlmostEqual(delivered[0], 12)  # not 12 * 6, scheduled basal isn`t used
+
+    def test_forecast_reservoir(self):
+        treatments = [self.treatment(0, eventType="Note", notes="Reservoir changed")]
+        treatments += [self.treatment(hours, eventType="Meal Bolus", insulin=6) for hours in range(4, 72, 8)]
+        arrays = get_insulin_arrays(treatments)
+
+        forecast = forecast_reservoir(arrays, 200, basal_rate=1, now=self.start + timedelta(hours=72))
+        self.assertEqual(forecast["delivered"], 9 * 6 + 72)
+        self.assertEqual(forecast["daily_rate"], 3 * 6 + 24)
+        self.assertEqual(forecast["remaining"], 200 - 126)
+        self.assertEqual(forecast["empty_in"], 74 * DAY // 42)
+        self.assertEqual(forecast["changed"], self.start)
+
+        # less than one day of data - extrapolated (bolus at now isn`t counted yet)
+        forecast = forecast_reservoir(arrays, 200, basal_rate=1, now=self.start + timedelta(hours=12))
+        self.assertEqual(forecast["daily_rate"], (6 + 12) * 2)
+
+        self.assertIsNone(forecast_reservoir(arrays, 200, now=self.start - timedelta(hours=1)))
+
+    def test_get_sms_txt_reservoir(self):
+        self.assertEqual(get_sms_txt_reservoir(None), "")
+        text = get_sms_txt_reservoir({"remaining": 74, "empty_in": DAY + 18 * HOUR})
+        self.assertIn("74 U", text)
+        self.assertIn("1 days and 18 hours", text)
+        self.assertIn("empty", get_sms_txt_reservoir({"remaining": -3, "empty_in": 0}))
+
+    def test_month_of_treatments_in_milliseconds(self):
+        treatments = [self.treatment(0, eventType="Note", notes="Reservoir changed")]
+        for minutes in range(0, 30 * 24 * 60, 5):
+            treatments.append(self.treatment(minutes / 60, eventType="Temp Basal", absolute=0.9, duration=5))
+        arrays = get_insulin_arrays(treatments)
+        start = timer.perf_counter()
+        forecast_reservoir(arrays, 300, basal_rate=1, now=self.start + timedelta(days=30))
+        self.assertLess(timer.perf_counter() - start, 0.5)
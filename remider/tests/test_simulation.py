@@ -0,0 +1,64 @@
+import time as timer
+from datetime import datetime, time, timedelta, timezone
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..simulation import get_change_arrays, simulate_policy
+from ..vectorized import to_microseconds, HOUR
+
+
+class SimulationTests(SimpleTestCase):
+    start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+
+    def changes(self, hours, count):
+        return to_microseconds([self.start + timedelta(hours=hours * i) for i in range(count)])
+
+    def test_get_change_arrays(self):
+        changes = get_change_arrays([
+            {"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"},
+            {"created_at": "2019-07-22T08:33:35+02:00", "notes": "carb 12g 1.3U"},
+            {"created_at": "2019-07-18T20:30:40+02:00", "notes": "Reservoir changed"},
+            {"created_at": "2019-07-20T10:00:00+02:00", "notes": "Sensor changed"},
+            {"notes": "Sensor changed"},
+        ])
+        self.assertEqual(len(changes["infusion"]), 2)
+        self.assertLess(changes["infusion"][0], changes["infusion"][1])
+        self.assertEqual(len(changes["sensor"]), 1)
+
+    def test_alerts_before_due_date(self):
+        changes = self.changes(72, 10)
+        stats = simulate_policy(changes, 72, time(16), lead=24)
+        self.assertEqual(stats["alerts"], 9)  # last change has no next one
+        self.assertEqual(stats["missed"], 0)
+        self.assertEqual(stats["early"], 9)
+        self.assertEqual(stats["mean_offset"], -8)
+        self.assertEqual(stats["messages"], 27)
+
+    def test_late_and_missed_alerts(self):
+        stats = simulate_policy(self.changes(72, 10), 72, time(16), lead=6)
+        self.assertEqual(stats["alerts"], 0)
+        self.assertEqual(stats["missed"], 0)  # every change made exactly on time
+
+        stats = simulate_policy(self.changes(96, 10), 72, time(16), lead=6)
+        self.assertEqual(stats["alerts"], 9)
+        self.assertEqual(stats["late"], 9)
+        self.assertEqual(stats["max_late"], 16)
+
+        stats = simulate_policy(self.changes(84, 10), 72, time(16), lead=6)
+        self.assertEqual(stats["missed"] + stats["alerts"], 9)
+        self.assertGreater(stats["missed"], 0)
+
+    def test_open_last_interval(self):
+        changes = self.changes(72, 1)
+        end = changes[-1] + 100 * HOUR
+        stats = simulate_policy(changes, 72, time(16), end=end)
+        self.assertEqual(stats["alerts"], 1)
+        self.assertEqual(simulate_policy(np.array([], dtype=np.int64), 72, time(16))["alerts"], 0)
+
+    def test_years_of_history_under_second(self):
+        changes = self.changes(70, 20 * 365 * 24 // 70)
+        start = timer.perf_counter()
+        for frequency in range(48, 97, 12):
+            simulate_policy(changes, frequency, time(16))
+        self.assertLess(timer.perf_counter() - start, 1)
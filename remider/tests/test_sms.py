@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import translation
+
+from ..data_processing import get_sms_txt_infusion_set, get_sms_txt_sensor, process_treatments
+from ..pipeline import run_reminder_pipeline
+from ..sms import get_encoding, count_segments, transliterate, compose_sms
+
+
+class SegmentsTests(SimpleTestCase):
+    def test_encoding(self):
+        self.assertEqual(get_encoding("Your infusion set: 2 days [€]"), "GSM-7")
+        self.assertEqual(get_encoding("Zmień zestaw"), "UCS-2")
+        self.assertEqual(get_encoding("Nightscout`s"), "UCS-2")
+
+    def test_gsm_segments(self):
+        self.assertEqual(count_segments("a" * 160), 1)
+        self.assertEqual(count_segments("a" * 161), 2)
+        self.assertEqual(count_segments("a" * 306), 2)
+        self.assertEqual(count_segments("a" * 307), 3)
+        self.assertEqual(count_segments("€" * 80), 1)  # extension characters take two septets
+        self.assertEqual(count_segments("a" * 152 + "€" + "a" * 8), 2)
+        self.assertEqual(count_segments("a" * 152 + "€" + "a" * 152), 3)  # escape isn`t split from character
+
+    def test_ucs2_segments(self):
+        self.assertEqual(count_segments("ą" * 70), 1)
+        self.assertEqual(count_segments("ą" * 71), 2)
+        self.assertEqual(count_segments("ą" * 134), 2)
+        self.assertEqual(count_segments("ą" * 135), 3)
+
+    def test_transliterate(self):
+        self.assertEqual(transliterate("Zażółć gęślą jaźń – Łódź"), "Zazolc gesla jazn - Lodz")
+        self.assertEqual(transliterate("Müller é"), "Müller é")  # already in GSM-7
+        self.assertEqual(transliterate("💉"), "💉")
+
+
+class ComposeSmsTests(SimpleTestCase):
+    parts = [
+        ["Your infusion set should be changed in 1 days and 14 hours. You usually change after 70h.",
+         "Your infusion set should be changed in 1 days and 14 hours.", "Infusion set: change in 1d 14h."],
+        ["Your CGM sensor should be changed in 3 days and 2 hours.", "CGM sensor: change in 3d 2h."],
+        ["Your reservoir (about 80 U left) will be empty in 2 days and 1 hours.", "Reservoir: ~80U, empty in 2d 1h.",
+         ""],
+    ]
+
+    def test_without_target(self):
+        sms = compose_sms([[".\n\n Line one"], ["\n\n Line two"], [""]])
+        self.assertEqual(sms, {"text": "Line one\nLine two", "encoding": "GSM-7", "segments": 1})
+        self.assertEqual(compose_sms(self.parts)["segments"], 2)
+
+    def test_least_important_parts_compacted_first(self):
+        sms = compose_sms(self.parts, target_segments=1)
+        self.assertEqual(sms["segments"], 1)
+        self.assertEqual(sms["text"], self.parts[0][0] + "\nCGM sensor: change in 3d 2h.\nReservoir: ~80U, empty in 2d 1h.")
+
+    def test_droppable_parts_left_out_last(self):
+        parts = [["a" * 150], ["b" * 10, ""]]
+        self.assertEqual(compose_sms(parts, target_segments=1)["text"], "a" * 150)
+        parts = [["a" * 170], ["b" * 10, ""]]  # important part is kept even if it doesn`t fit
+        sms = compose_sms(parts, target_segments=1)
+        self.assertEqual((sms["text"], sms["segments"]), ("a" * 170, 2))
+
+    def test_polish_reminder_fits_in_one_segment(self):
+        with translation.override("pl"):
+            parts = [[get_sms_txt_infusion_set(timedelta(days=1, hours=14)),
+                      get_sms_txt_infusion_set(timedelta(days=1, hours=14), compact=True)],
+                     [get_sms_txt_sensor(timedelta(days=3, hours=2)),
+                      get_sms_txt_sensor(timedelta(days=3, hours=2), compact=True)]]
+        self.assertEqual(compose_sms(parts)["encoding"], "UCS-2")
+        self.assertEqual(compose_sms(parts, transliterate_text=True)["encoding"], "GSM-7")
+
+        sms = compose_sms(parts, target_segments=1)
+        self.assertEqual(sms["segments"], 1)
+        self.assertEqual(sms["text"], "Zestaw infuzyjny: zmiana za 1d 14h.\nSensor CGM: zmiana za 3d 2h.")
+
+
+@override_settings(SMS_TARGET_SEGMENTS=1, SMS_TRANSLITERATE=False, CGM_MONITORING=False, RESERVOIR_VOLUME=0)
+class PipelineTextsTests(TestCase):
+    @patch("remider.pipeline.notify")
+    def test_only_sms_is_compacted(self, notify):
+        now = datetime.now(timezone.utc)
+        treatments = [{"created_at": (now - timedelta(hours=30)).isoformat(), "notes": "Reservoir changed"},
+                      {"created_at": (now - timedelta(days=4)).isoformat(), "notes": "Sensor changed"}]
+        process_treatments(treatments)
+        with translation.override("pl"):  # UCS-2, full texts don`t fit in one segment
+            result = run_reminder_pipeline(schedule=False, treatments=treatments)
+        sms_text, config, events, full_text = notify.call_args[0]
+        self.assertEqual((sms_text, full_text), (result["sms_text"], result["full_text"]))
+        self.assertEqual(result["sms_segments"], 1)
+        self.assertGreater(len(full_text), len(sms_text))
+        self.assertIn(" ".join(result["inf_text"].lstrip(".").split()), full_text)
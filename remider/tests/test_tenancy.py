@@ -0,0 +1,127 @@
+import json
+import threading
+import time as timer
+from datetime import datetime, time, timedelta, timezone
+from urllib.parse import urlsplit
+
+import responses
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .. import tenancy
+from ..models import Patient, InfusionChanged, SensorChanged, WearStatistics
+from ..pipeline import run_patients_tick, STAGES
+from ..tenancy import get_config, get_due_patients
+
+
+class TenancyTests(TestCase):
+
+    @override_settings(NIGTSCOUT_LINK="https://benc.com", TO_NUMBERS=["+48111"])
+    def test_get_config(self):
+        config = get_config()
+        self.assertEqual(config.nightscout_link, "https://benc.com")
+        self.assertEqual(config.to_numbers, ["+48111"])
+
+        patient = Patient(name="ala", nightscout_link="https://ala.com", infusion_set_alert_frequency=48,
+                          to_numbers="+48222\n\n +48333 \n")
+        config = get_config(patient)
+        self.assertEqual(config.nightscout_link, "https://ala.com")
+        self.assertEqual(config.infusion_set_alert_frequency, 48)
+        self.assertEqual(config.to_numbers, ["+48222", "+48333"])
+        self.assertEqual(config.ifttt_makers, [])
+
+    def test_get_due_patients(self):
+        now = datetime(2019, 7, 22, 17, tzinfo=timezone.utc)
+        Patient.objects.create(name="due", nightscout_link="https://a.com", trigger_time=time(16))
+        Patient.objects.create(name="later", nightscout_link="https://a.com", trigger_time=time(18))
+        Patient.objects.create(name="done", nightscout_link="https://a.com", trigger_time=time(16),
+                               last_run=now.date())
+        Patient.objects.create(name="yesterday", nightscout_link="https://a.com", trigger_time=time(16),
+                               last_run=now.date() - timedelta(days=1))
+        Patient.objects.create(name="inactive", nightscout_link="https://a.com", trigger_time=time(16),
+                               active=False)
+        self.assertEqual(sorted(get_due_patients(now).values_list("name", flat=True)), ["due", "yesterday"])
+
+
+@override_settings(TENANT_WORKERS=4, TENANT_HOST_CONNECTIONS=2)
+class PatientsTickTests(TransactionTestCase):
+
+    def setUp(self):
+        tenancy._host_semaphores.clear()
+        self.lock = threading.Lock()
+        self.running = {}  # host -> number of concurrent requests
+        self.most = {}  # host -> the highest number of concurrent requests
+        self.most_overall = 0
+
+    def treatments_callback(self, treatments):
+        def callback(request):
+            host = urlsplit(request.url).netloc
+            with self.lock:
+                self.running[host] = self.running.get(host, 0) + 1
+                self.most[host] = max(self.most.get(host, 0), self.running[host])
+                self.most_overall = max(self.most_overall, sum(self.running.values()))
+            timer.sleep(0.05)
+            with self.lock:
+                self.running[host] -= 1
+            return 200, {}, json.dumps(treatments)
+        return callback
+
+    @responses.activate
+    def test_run_patients_tick(self):
+        responses.add_callback(responses.GET, "https://a.com/api/v1/treatments", callback=self.treatments_callback(
+            [{"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"}]))
+        responses.add_callback(responses.GET, "https://b.com/api/v1/treatments", callback=self.treatments_callback(
+            [{"created_at": "2019-07-20T20:30:40+02:00", "notes": "Sensor changed"}]))
+        now = datetime.now(timezone.utc).replace(hour=23)
+        first = Patient.objects.create(name="first", nightscout_link="https://a.com")
+        second = Patient.objects.create(name="second", nightscout_link="https://b.com")
+        for index in range(4):
+            Patient.objects.create(name="a{}".format(index), nightscout_link="https://a.com")
+
+        results = run_patients_tick(now)
+        self.assertEqual(set(results), {"first", "second", "a0", "a1", "a2", "a3"})
+        self.assertTrue(results["first"]["infusion"])
+        self.assertFalse(results["first"]["sensor"])
+        self.assertTrue(results["second"]["sensor"])
+        self.assertTrue(all(results["a{}".format(index)]["infusion"] for index in range(4)))
+        self.assertEqual(InfusionChanged.objects.get(patient=first).date,
+                         datetime(2019, 7, 21, 18, 30, 40, tzinfo=timezone.utc))
+        self.assertEqual(InfusionChanged.objects.count(), 5)
+        self.assertFalse(InfusionChanged.objects.filter(patient=second).exists())
+        self.assertTrue(SensorChanged.objects.filter(patient=second).exists())
+        self.assertFalse(InfusionChanged.objects.filter(patient=None).exists())
+
+        self.assertEqual(self.most["a.com"], 2)  # TENANT_HOST_CONNECTIONS
+        self.assertGreater(self.most_overall, 2)
+        self.assertLessEqual(self.most_overall, 4)  # TENANT_WORKERS
+
+        self.assertEqual(run_patients_tick(now), {})  # already processed today
+
+    @responses.activate
+    def test_failed_patient_does_not_stop_tick(self):
+        responses.add(responses.GET, "https://a.com/api/v1/treatments",
+                      json=[{"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"}], status=200)
+        responses.add(responses.GET, "https://broken.com/api/v1/treatments", body="not json", status=200)
+        now = datetime.now(timezone.utc).replace(hour=23)
+        Patient.objects.create(name="broken", nightscout_link="https://broken.com")
+        Patient.objects.create(name="ok", nightscout_link="https://a.com")
+
+        with self.assertLogs("remider.pipeline", "ERROR"):
+            results = run_patients_tick(now)
+        self.assertEqual(results["broken"], dict.fromkeys(STAGES, False))
+        self.assertTrue(results["ok"]["infusion"])
+        self.assertEqual(list(get_due_patients(now).values_list("name", flat=True)), ["broken"])  # retried next tick
+
+
+class AppRowsTests(TestCase):
+    def test_one_row_without_patient(self):
+        now = datetime.now(timezone.utc)
+        InfusionChanged.objects.create(date=now)
+        patient = Patient.objects.create(name="ala", nightscout_link="https://ala.com")
+        InfusionChanged.objects.create(date=now, patient=patient)
+        WearStatistics.objects.create(kind="infusion")
+        WearStatistics.objects.create(kind="sensor")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            InfusionChanged.objects.create(date=now)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            WearStatistics.objects.create(kind="infusion")
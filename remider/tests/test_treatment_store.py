@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+
+import numpy as np
+import responses
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..pipeline import run_reminder_pipeline
+from ..reservoir import get_insulin_arrays
+from ..simulation import get_change_arrays
+from ..treatment_store import RECORD, to_records, append_treatments, load_records, get_store_path, \
+    to_change_arrays, to_insulin_arrays, store_lock, fcntl
+
+TREATMENTS = [
+    {"created_at": "2019-07-22T08:33:35+02:00", "eventType": "Meal Bolus", "insulin": 1.3, "notes": "carb 12g"},
+    {"created_at": "2019-07-22T06:00:00+02:00", "eventType": "Temp Basal", "absolute": 0.5, "duration": 30},
+    {"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"},
+    {"created_at": "2019-07-21T10:00:00+02:00", "eventType": "Note", "notes": "nothing"},
+    {"created_at": "2019-07-20T20:30:40+02:00", "notes": "Sensor changed"},
+]
+
+
+class TreatmentStoreTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(TREATMENT_STORE=self.directory.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_to_records(self):
+        records = to_records(TREATMENTS)
+        self.assertEqual(records.dtype.itemsize, 17)
+        self.assertEqual(len(records), 4)  # note isn`t used by reminder
+        self.assertTrue((np.diff(records["date"]) > 0).all())
+
+    def test_append_only_new_treatments(self):
+        self.assertEqual(append_treatments(TREATMENTS[2:]), 2)
+        self.assertEqual(append_treatments(TREATMENTS), 2)
+        self.assertEqual(append_treatments(TREATMENTS), 0)
+
+        records = load_records(get_store_path())
+        self.assertIsInstance(records, np.memmap)
+        self.assertEqual(os.path.getsize(get_store_path()), 4 * RECORD.itemsize)
+        self.assertEqual(list(records["date"]), list(to_records(TREATMENTS)["date"]))
+
+    def test_late_and_duplicated_treatments_merged(self):
+        late = {"created_at": "2019-07-21T12:00:00+02:00", "eventType": "Correction Bolus", "insulin": 0.5}
+        twin = dict(TREATMENTS[0], insulin=2)  # the same time as the newest stored one
+        self.assertEqual(append_treatments(TREATMENTS[:2]), 2)
+        self.assertEqual(append_treatments([late, twin, twin, TREATMENTS[1]]), 2)
+        self.assertEqual(append_treatments([late, TREATMENTS[2]]), 1)
+
+        records = load_records(get_store_path())
+        self.assertEqual(len(records), 5)
+        self.assertTrue((np.diff(records["date"]) >= 0).all())
+        self.assertEqual(sorted(records["amount"][records["code"] == 3]), [0.5, 1.3, 2])
+        self.assertFalse(os.path.exists(get_store_path() + ".tmp"))
+
+    @unittest.skipIf(fcntl is None, "fcntl is not available")
+    def test_store_locked_against_other_processes(self):
+        path = get_store_path()
+        with store_lock(path), open(path + ".lock", "a") as other:  # separate open file, like other process
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with open(path + ".lock", "a") as other:
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_arrays_like_from_treatments(self):
+        append_treatments(TREATMENTS)
+        records = load_records(get_store_path())
+
+        changes = to_change_arrays(records)
+        for kind, kind_changes in get_change_arrays(TREATMENTS).items():
+            self.assertEqual(list(changes[kind]), list(kind_changes))
+
+        arrays = to_insulin_arrays(records)
+        for name, values in get_insulin_arrays(TREATMENTS).items():
+            np.testing.assert_allclose(arrays[name], values, rtol=1e-6)
+
+    def test_missing_store(self):
+        self.assertEqual(len(load_records(get_store_path())), 0)
+        with override_settings(TREATMENT_STORE=""):
+            self.assertIsNone(append_treatments(TREATMENTS))
+
+    @responses.activate
+    @override_settings(NIGTSCOUT_LINK="https://benc.com", RESERVOIR_VOLUME=200, RESERVOIR_BASAL_RATE=1,
+                       LANGUAGE_CODE="en")
+    def test_pipeline_reads_warm_store(self):
+        responses.add(responses.GET, "https://benc.com/api/v1/treatments", json=TREATMENTS)
+        run_reminder_pipeline(send_notif=False, schedule=False)
+        self.assertEqual(len(load_records(get_store_path())), 4)
+
+        responses.replace(responses.GET, "https://benc.com/api/v1/treatments", status=500)
+        result = run_reminder_pipeline(send_notif=False, schedule=False)
+        self.assertIn("reservoir", result["reservoir_text"])
+
+    def test_simulate_from_store(self):
+        append_treatments(TREATMENTS)
+        out = StringIO()
+        call_command("simulate_reminders", "--store", stdout=out)
+        self.assertIn("2 changes replayed", out.getvalue())
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from ..data_processing import get_sms_txt_infusion_set
+from ..vectorized import calculate_remaining_batch, to_microseconds
+
+
+class VectorizedTests(SimpleTestCase):
+
+    def test_to_microseconds(self):
+        date = datetime(2019, 7, 21, 18, 30, 40, 5, tzinfo=timezone.utc)
+        expected = int(date.timestamp()) * 10 ** 6 + 5
+        self.assertEqual(to_microseconds([date])[0], expected)
+        self.assertEqual(to_microseconds(np.array(["2019-07-21T18:30:40.000005"], dtype="datetime64[us]"))[0],
+                         expected)
+        with self.assertRaises(TypeError):
+            to_microseconds([None])
+
+    def test_calculate_remaining_batch(self):
+        now = datetime(2019, 7, 22, 12, tzinfo=timezone.utc)
+        dates = [now - timedelta(hours=10), now - timedelta(hours=80), now - timedelta(hours=22, minutes=30)]
+        batch = calculate_remaining_batch(dates, [48, 72, 24], now)
+
+        self.assertEqual(batch["remaining"].tolist(), [38 * 3600 * 10 ** 6, -8 * 3600 * 10 ** 6, 90 * 60 * 10 ** 6])
+        self.assertEqual(batch["overdue"].tolist(), [False, True, False])
+        for indx, remaining in enumerate(batch["remaining"]):
+            time_remains = timedelta(microseconds=int(remaining))
+            self.assertEqual(batch["days"][indx], time_remains.days)
+            self.assertEqual(batch["hours"][indx], round(time_remains.seconds / 3600))
+
+    def test_one_frequency_for_all(self):
+        now = datetime(2019, 7, 22, 12, tzinfo=timezone.utc)
+        batch = calculate_remaining_batch([now, now - timedelta(hours=1)], 72, now)
+        self.assertEqual(batch["days"].tolist(), [3, 2])
+        self.assertEqual(batch["hours"].tolist(), [0, 23])
+        self.assertEqual(get_sms_txt_infusion_set(timedelta(microseconds=int(batch["remaining"][1]))),
+                         ".\n\n Your infusion set should be changed in 2 days and 23 hours.")
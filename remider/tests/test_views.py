@@ -1,7 +1,16 @@
+import datetime
+import json
+from unittest.mock import patch
+
+import responses
+from django.contrib.sessions.models import Session
 from django.test import TestCase, override_settings
 from django.shortcuts import reverse
 from django.conf import settings
+from django.utils.translation import LANGUAGE_SESSION_KEY
 
+from ..data_processing import process_treatments
+from ..models import InfusionChanged, NightscoutSync
 from ..forms import GetSecretForm, TriggerTimeForm, ChangeEnvVariableForm, ChooseLanguageForm, \
     ChooseNotificationsWayForm
 
@@ -12,6 +21,21 @@ class HomeViewTests(TestCase):
         self.assertTemplateUsed(response, "remider/home.html")
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(LANGUAGE_CODE="pl")
+    def test_language_without_session_write(self):
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response["Content-Language"], "pl")
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    @override_settings(LANGUAGE_CODE="pl")
+    def test_stale_session_language_is_fixed(self):
+        session = self.client.session
+        session[LANGUAGE_SESSION_KEY] = "en"
+        session.save()
+        self.client.get(reverse("home"))
+        self.assertEqual(self.client.session[LANGUAGE_SESSION_KEY], "pl")
+
 
 class AuthViewTests(TestCase):
     def test_template_loading(self):
@@ -83,3 +107,225 @@ class NotificationCenterViewTests(TestCase):
         self.assertIsInstance(response.context['form'], ChooseNotificationsWayForm)
         self.assertContains(response, 'type="checkbox"')
         self.assertContains(response, 'type="submit"')
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey", NIGTSCOUT_LINK="https://benc.com", SEND_SMS=False,
+                   TRIGGER_IFTTT=False)
+class ReminderApiViewTests(TestCase):
+    def setUp(self):
+        responses.start()
+        responses.add(responses.GET, "https://benc.com/api/v1/treatments",
+                      json=[{"created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"}], status=200)
+
+    def tearDown(self):
+        responses.stop()
+        responses.reset()
+
+    def test_requires_key(self):
+        response = self.client.get(reverse("api-reminder"), {"quiet": "1"})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse("api-reminder"), {"quiet": "1"}, HTTP_X_REMINDER_KEY="wrongkey")
+        self.assertEqual(response.status_code, 403)
+
+    def test_header_key_and_empty_response(self):
+        response = self.client.get(reverse("api-reminder"), {"quiet": "1"}, HTTP_X_REMINDER_KEY="mycoolsecretkey")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.content, b"")
+
+    def test_query_key(self):
+        response = self.client.get(reverse("api-reminder"), {"quiet": "1", "key": "mycoolsecretkey"})
+        self.assertEqual(response.status_code, 204)
+
+    def test_compact_json(self):
+        response = self.client.get(reverse("api-reminder"), {"quiet": "1"}, HTTP_X_REMINDER_KEY="mycoolsecretkey",
+                                   HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIsInstance(data["infusion"], int)
+        self.assertIsNone(data["sensor"])
+
+    def test_skips_session(self):
+        response = self.client.get(reverse("api-reminder"), {"quiet": "1"}, HTTP_X_REMINDER_KEY="mycoolsecretkey")
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+        self.assertNotIn("Vary", response)
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey", INFUSION_SET_ALERT_FREQUENCY=72)
+class StatusApiViewTests(TestCase):
+    def setUp(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        InfusionChanged.objects.create(id=1, date=now - datetime.timedelta(hours=10, minutes=30))
+        NightscoutSync.objects.create(id=1, date=now)
+
+    def test_requires_key(self):
+        response = self.client.get(reverse("api-status"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_status(self):
+        response = self.client.get(reverse("api-status"), HTTP_X_REMINDER_KEY="mycoolsecretkey")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["infusion"]["remaining_hours"], 61)
+        self.assertFalse(data["infusion"]["overdue"])
+        self.assertIsNone(data["sensor"])
+        self.assertEqual(data["data_age_hours"], 0)
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertIn("max-age=", response["Cache-Control"])
+        max_age = int(response["Cache-Control"].split("max-age=")[1].split(",")[0])
+        self.assertLessEqual(max_age, 1800)
+
+    def test_not_modified(self):
+        response = self.client.get(reverse("api-status"), HTTP_X_REMINDER_KEY="mycoolsecretkey")
+        etag = response["ETag"]
+        response = self.client.get(reverse("api-status"), HTTP_X_REMINDER_KEY="mycoolsecretkey",
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        InfusionChanged.objects.filter(id=1).update(date=datetime.datetime.now(datetime.timezone.utc))
+        response = self.client.get(reverse("api-status"), HTTP_X_REMINDER_KEY="mycoolsecretkey",
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey")
+class ExportViewTests(TestCase):
+    def setUp(self):
+        process_treatments([{"created_at": "2019-07-{:02d}T20:30:40+02:00".format(day), "notes": "Reservoir changed",
+                             "_id": str(day)} for day in (10, 7, 4)])
+
+    def test_requires_key(self):
+        response = self.client.get(reverse("export"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_csv(self):
+        response = self.client.get(reverse("export") + "?key=mycoolsecretkey")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "kind,date,interval_hours,treatment_id")
+        self.assertEqual(lines[1], "infusion,2019-07-04T18:30:40+00:00,,4")
+        self.assertEqual(lines[3], "infusion,2019-07-10T18:30:40+00:00,72.0,10")
+
+    def test_ndjson(self):
+        response = self.client.get(reverse("export") + "?key=mycoolsecretkey&format=ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["interval_hours"] for row in rows], [None, 72, 72])
+
+    def test_wrong_format_and_patient(self):
+        response = self.client.get(reverse("export") + "?key=mycoolsecretkey&format=xml")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("export") + "?key=mycoolsecretkey&patient=nobody")
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey", SEND_SMS=False, TRIGGER_IFTTT=False)
+class TreatmentsApiViewTests(TestCase):
+    body = json.dumps([{"_id": "a", "created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"},
+                       {"_id": "a", "created_at": "2019-07-21T20:30:40+02:00", "notes": "Reservoir changed"}])
+
+    def post(self, path, body, **extra):
+        return self.client.post(path, body, content_type="application/x-ndjson", HTTP_X_REMINDER_KEY="mycoolsecretkey",
+                                **extra)
+
+    def test_requires_key_and_post(self):
+        response = self.client.post(reverse("api-treatments"), self.body, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse("api-treatments"), HTTP_X_REMINDER_KEY="mycoolsecretkey")
+        self.assertEqual(response.status_code, 405)
+
+    def test_ingest(self):
+        response = self.post(reverse("api-treatments"), self.body)
+        self.assertEqual(response.json(), {"ingested": 1, "duplicates": 1, "notified": False})
+        self.assertTrue(InfusionChanged.objects.exists())
+
+    @responses.activate
+    def test_notify_without_polling(self):
+        response = self.post(reverse("api-treatments") + "?notify=1", self.body)
+        self.assertEqual(len(responses.calls), 0)
+        self.assertTrue(response.json()["notified"])
+        self.assertIn("infusion", response.json())
+        self.assertIsNone(response.json()["sensor"])
+
+    @patch("remider.views.run_reminder_pipeline")
+    def test_notify_only_when_change_moved(self, pipeline):
+        pipeline.return_value = {"infusion_time_remains": None, "sensor_time_remains": None}
+        self.post(reverse("api-treatments") + "?notify=1", self.body)
+        response = self.post(reverse("api-treatments") + "?notify=1", self.body)  # repeated push of same change
+        self.assertEqual(pipeline.call_count, 1)
+        self.assertEqual(response.json(), {"ingested": 1, "duplicates": 1, "notified": False})
+
+    @override_settings(INGEST_MAX_BODY_SIZE=100)
+    def test_too_large_body(self):
+        response = self.post(reverse("api-treatments"), self.body)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(InfusionChanged.objects.exists())
+
+    def test_invalid_body(self):
+        response = self.post(reverse("api-treatments"), '[{"_id": ')
+        self.assertEqual(response.status_code, 400)
+        response = self.post(reverse("api-treatments"), '{"created_at": "yesterday", "notes": "Reservoir changed"}')
+        self.assertEqual(response.status_code, 400)
+        response = self.post(reverse("api-treatments"), self.body, CONTENT_LENGTH="many")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(InfusionChanged.objects.exists())
+
+
+@override_settings(SECRET_KEY="mycoolsecretkey", app_name="benc-test", LANGUAGE_CODE="en")
+class ManageRecipientsViewTests(TestCase):
+    heroku_url = "https://api.heroku.com/apps/{}/config-vars".format(settings.APP_NAME)
+
+    def formset_data(self, values, deleted=(), initial=3, **extra):
+        data = {"form-TOTAL_FORMS": str(len(values)), "form-INITIAL_FORMS": str(initial)}
+        for i, value in enumerate(values):
+            data["form-{}-value".format(i)] = value
+            if i in deleted:
+                data["form-{}-DELETE".format(i)] = "on"
+        data.update(extra)
+        return data
+
+    @override_settings(IFTTT_MAKERS=["one", "two", "three"])
+    def test_formset_with_recipients(self):
+        response = self.client.get(reverse("manage_ifttt_makers") + "?key=mycoolsecretkey")
+        self.assertTemplateUsed(response, "remider/manage_ifttt.html")
+        formset = response.context["formset"]
+        self.assertEqual(len(formset), 4)  # one empty form for new maker
+        self.assertEqual(formset[1].fields["value"].label, "IFTTT MAKER 2.")
+        self.assertIsNone(response.context["sender_form"])
+
+    @responses.activate
+    @override_settings(IFTTT_MAKERS=["one", "two", "three"])
+    def test_add_change_and_delete_in_one_request(self):
+        responses.add(responses.PATCH, self.heroku_url, status=200)
+        response = self.client.post(reverse("manage_ifttt_makers") + "?key=mycoolsecretkey",
+                                    self.formset_data(["one", "changed two", "three", "four"], deleted=(0,)))
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(json.loads(responses.calls[0].request.body), {
+            "IFTTT_MAKER_1": "changed two", "IFTTT_MAKER_2": "three", "IFTTT_MAKER_3": "four"})
+        self.assertEqual(response.context["info"][0], True)
+        self.assertEqual([form.initial.get("value") for form in response.context["formset"]],
+                         ["changed two", "three", "four", None])
+
+    @responses.activate
+    @override_settings(IFTTT_MAKERS=["one", "two", "three"])
+    def test_deleted_tail_and_failed_change(self):
+        responses.add(responses.PATCH, self.heroku_url, status=500)
+        response = self.client.post(reverse("manage_ifttt_makers") + "?key=mycoolsecretkey",
+                                    self.formset_data(["one", "two", "three", ""], deleted=(1, 2)))
+        self.assertEqual(json.loads(responses.calls[0].request.body), {"IFTTT_MAKER_2": None, "IFTTT_MAKER_3": None})
+        self.assertEqual(response.context["info"], (False, "unsuccess"))
+        self.assertEqual(len(response.context["formset"]), 4)
+
+    @responses.activate
+    @override_settings(TO_NUMBERS=["+48111"], FROM_NUMBER="+48000")
+    def test_phone_numbers_with_sender(self):
+        responses.add(responses.PATCH, self.heroku_url, status=200)
+        self.client.post(reverse("manage_ph_numbers") + "?key=mycoolsecretkey",
+                         self.formset_data(["+48111", ""], initial=1, **{"sender-new_value": "+48999"}))
+        self.assertEqual(json.loads(responses.calls[0].request.body), {"from_number": "+48999"})
+
+        response = self.client.post(reverse("manage_ph_numbers") + "?key=mycoolsecretkey",
+                                    self.formset_data(["+48111", ""], initial=1, **{"sender-new_value": "+48000"}))
+        self.assertEqual(len(responses.calls), 1)  # nothing changed, heroku isn`t called
+        self.assertIsNone(response.context["info"])
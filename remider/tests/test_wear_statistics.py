@@ -0,0 +1,78 @@
+import json
+import statistics as stats
+from datetime import datetime, timedelta, timezone
+
+from django.shortcuts import reverse
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from .. import wear_statistics
+from ..models import WearStatistics
+from ..wear_statistics import observe_change, get_wear_statistics, get_sms_txt_wear_habit, get_percentile
+
+
+@override_settings(INFUSION_SET_ALERT_FREQUENCY=72, WEAR_TOLERANCE=6, LANGUAGE_CODE="en")
+class WearStatisticsTests(TestCase):
+    intervals = [68, 70, 66, 80, 72, 50]
+
+    def observe_all(self):
+        date = datetime(2019, 7, 1, tzinfo=timezone.utc)
+        observe_change("infusion", date)
+        for hours in self.intervals:
+            date += timedelta(hours=hours)
+            observe_change("infusion", date)
+        return date
+
+    def test_streaming_aggregates(self):
+        self.observe_all()
+        statistics = WearStatistics.objects.get(kind="infusion")
+        self.assertEqual(statistics.count, len(self.intervals))
+        self.assertAlmostEqual(statistics.mean, stats.mean(self.intervals))
+        summary = get_wear_statistics()[0]
+        self.assertAlmostEqual(summary["std"], stats.stdev(self.intervals))
+        self.assertEqual(summary["median"], 68.5)
+        self.assertEqual(statistics.early, 1)
+        self.assertEqual(statistics.late, 1)
+
+    def test_old_changes_ignored(self):
+        date = self.observe_all()
+        observe_change("infusion", date)
+        observe_change("infusion", date - timedelta(hours=100))
+        self.assertEqual(WearStatistics.objects.get(kind="infusion").count, len(self.intervals))
+
+    def test_concurrent_observers_count_every_interval_once(self):
+        date = datetime(2019, 7, 1, tzinfo=timezone.utc)
+        observe_change("infusion", date)
+        get_config = wear_statistics.get_config
+        concurrent = []
+
+        def observe_concurrently(patient):
+            if not concurrent:  # other worker observes the same change after this one has read the row
+                concurrent.append(True)
+                observe_change("infusion", date + timedelta(hours=70))
+            return get_config(patient)
+
+        with patch("remider.wear_statistics.get_config", side_effect=observe_concurrently):
+            observe_change("infusion", date + timedelta(hours=140))
+            observe_change("infusion", date + timedelta(hours=70))  # the same change observed again
+        statistics = WearStatistics.objects.get(kind="infusion")
+        self.assertEqual((statistics.count, statistics.mean), (2, 70))
+        self.assertEqual(sum(json.loads(statistics.histogram)), 2)
+
+    def test_percentile(self):
+        statistics = WearStatistics(kind="sensor")
+        self.assertIsNone(get_percentile(statistics, 50))
+
+    def test_sms_text(self):
+        self.assertEqual(get_sms_txt_wear_habit("infusion"), "")
+        self.observe_all()
+        self.assertEqual(get_sms_txt_wear_habit("infusion"), " You usually change after 68h.")
+        self.assertEqual(get_sms_txt_wear_habit("sensor"), "")
+
+    @override_settings(SECRET_KEY="mycoolsecretkey")
+    def test_menu(self):
+        self.observe_all()
+        response = self.client.get(reverse("menu") + "?key=mycoolsecretkey")
+        self.assertEqual(response.context["wear_statistics"][0]["count"], len(self.intervals))
+        self.assertContains(response, 'id="wear_statistics"')
@@ -0,0 +1,170 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, store is locked only against threads of process
+    fcntl = None
+
+import numpy as np
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .simulation import CHANGE_NOTES
+from .vectorized import to_microseconds
+
+# one treatment is 17 bytes on disk and in memory (list of dicts takes about 1 KB per treatment)
+RECORD = np.dtype([("date", "<i8"), ("code", "u1"), ("amount", "<f4"), ("duration", "<f4")])
+
+RESERVOIR_CHANGED = 1
+SENSOR_CHANGED = 2
+BOLUS = 3
+TEMP_BASAL = 4
+CHANGE_CODES = {"infusion": RESERVOIR_CHANGED, "sensor": SENSOR_CHANGED}
+
+_append_lock = threading.Lock()
+
+
+def get_store_path(patient=None):
+    """
+    :param patient: Patient (None - app`s own data)
+    :return: path of patient`s store file (None if TREATMENT_STORE isn`t set)
+    """
+    if not settings.TREATMENT_STORE:
+        return None
+    name = "treatments.bin" if patient is None else "treatments-{}.bin".format(patient.pk)
+    return os.path.join(settings.TREATMENT_STORE, name)
+
+
+def to_records(treatments):
+    """
+    converts Nightscout`s treatments to records (treatments not used by reminder are skipped)
+    :param treatments: list of treatments (dicts) from Nightscout`s API
+    :return: array of RECORD sorted by date
+    """
+    dates, codes, amounts, durations = [], [], [], []
+    for treatment in treatments:
+        notes = treatment.get("notes")
+        if not treatment.get("created_at"):
+            continue
+        if notes == CHANGE_NOTES["infusion"]:
+            code, amount, duration = RESERVOIR_CHANGED, 0, 0
+        elif notes == CHANGE_NOTES["sensor"]:
+            code, amount, duration = SENSOR_CHANGED, 0, 0
+        elif treatment.get("insulin"):
+            code, amount, duration = BOLUS, treatment["insulin"], 0
+        elif treatment.get("eventType") == "Temp Basal" and treatment.get("absolute") is not None:
+            code, amount, duration = TEMP_BASAL, treatment["absolute"], treatment.get("duration") or 0
+        else:
+            continue
+        dates.append(parse_datetime(treatment["created_at"]))
+        codes.append(code)
+        amounts.append(amount)
+        durations.append(duration)
+
+    records = np.empty(len(dates), dtype=RECORD)
+    records["date"] = to_microseconds(dates)
+    records["code"] = codes
+    records["amount"] = amounts
+    records["duration"] = durations
+    return records[np.argsort(records["date"], kind="stable")]
+
+
+def load_records(path):
+    """
+    memory-maps store (records aren`t copied nor parsed)
+    :param path: path of store file
+    :return: read-only array of RECORD (empty if store doesn`t exist)
+    """
+    if path is None or not os.path.exists(path) or not os.path.getsize(path):
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", shape=(os.path.getsize(path) // RECORD.itemsize,))
+
+
+@contextmanager
+def store_lock(path):
+    """
+    locks store against other writers: threads of this process and other processes (gunicorn workers, commands)
+    :param path: path of store file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _append_lock, open(path + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when file is closed
+        yield
+
+
+def get_keys(records):
+    """
+    :param records: array of RECORD
+    :return: list of bytes of every record (identical treatments have equal keys)
+    """
+    data = records.tobytes()
+    return [data[index:index + RECORD.itemsize] for index in range(0, len(data), RECORD.itemsize)]
+
+
+def append_treatments(treatments, patient=None):
+    """
+    merges treatments into store, already stored ones (the same date, kind, amount and duration) are skipped
+    treatments not older than newest stored one are appended, older ones (backfilled or pushed out of order)
+    are merged into sorted store, which is rewritten (readers keep mapping of previous file)
+    :param treatments: list of treatments (dicts) from Nightscout`s API
+    :param patient: Patient (None - app`s own data)
+    :return: number of added records (None if store is disabled)
+    """
+    path = get_store_path(patient)
+    if path is None:
+        return None
+
+    records = to_records(treatments)
+    if not len(records):
+        return 0
+    with store_lock(path):
+        stored = load_records(path)
+        # only stored records not older than the oldest new one can be equal to new ones
+        known = set(get_keys(stored[np.searchsorted(stored["date"], records["date"][0]):]))
+        fresh = np.zeros(len(records), dtype=bool)
+        for index, key in enumerate(get_keys(records)):
+            fresh[index] = key not in known
+            known.add(key)
+        records = records[fresh]
+
+        if not len(records):
+            return 0
+        if not len(stored) or records["date"][0] >= stored["date"][-1]:
+            with open(path, "ab") as file:
+                file.write(records.tobytes())
+        else:
+            merged = np.concatenate([stored, records])
+            merged = merged[np.argsort(merged["date"], kind="stable")]
+            with open(path + ".tmp", "wb") as file:
+                file.write(merged.tobytes())
+            del stored
+            os.replace(path + ".tmp", path)
+    return len(records)
+
+
+def to_change_arrays(records):
+    """
+    :param records: array of RECORD
+    :return: dict kind -> sorted int64 array of change times (like simulation.get_change_arrays)
+    """
+    return {kind: np.unique(records["date"][records["code"] == code]) for kind, code in CHANGE_CODES.items()}
+
+
+def to_insulin_arrays(records):
+    """
+    :param records: array of RECORD
+    :return: dict of arrays like reservoir.get_insulin_arrays
+    """
+    boluses = records[records["code"] == BOLUS]
+    basals = records[records["code"] == TEMP_BASAL]
+    return {
+        "changes": np.unique(records["date"][records["code"] == RESERVOIR_CHANGED]),
+        "bolus_times": np.array(boluses["date"]),
+        "boluses": boluses["amount"].astype(np.float64),
+        "basal_times": np.array(basals["date"]),  # store is sorted by date
+        "basal_rates": basals["amount"].astype(np.float64),
+        "basal_durations": basals["duration"].astype(np.float64),
+    }
@@ -3,7 +3,8 @@ from django.views.generic import TemplateView
 
 from .decorators import secret_key_required, set_language_to_LANGUAGE_CODE
 from .views import reminder_and_notifier_view, file_view, auth_view, upload_view, ManagePhoneNumbersView, \
-    number_delete_view, MenuView, quiet_checkup_view, NotificationsCenterView, ManageIFTTTMakersView, ifttt_delete_view
+    MenuView, quiet_checkup_view, NotificationsCenterView, ManageIFTTTMakersView, reminder_api_view, status_api_view, \
+    export_view, treatments_api_view, memory_view, twilio_status_api_view
 
 urlpatterns = [
     re_path(r"^$", set_language_to_LANGUAGE_CODE(TemplateView.as_view(template_name="remider/home.html")), name="home"),
@@ -14,12 +15,16 @@ urlpatterns = [
     re_path(r"^upload/$", upload_view, name="upload"),
     re_path(r"^phonenumbers/$", secret_key_required(set_language_to_LANGUAGE_CODE(ManagePhoneNumbersView.as_view())),
             name="manage_ph_numbers"),
-    re_path(r"^deletephonenumber/(?P<number_id>[0-9]+)/$", number_delete_view, name="del-ph"),
     re_path(r"^reminder/quiet/$", quiet_checkup_view, name="quiet"),
     re_path(r"^notifications-center/$",
             secret_key_required(set_language_to_LANGUAGE_CODE(NotificationsCenterView.as_view())), name="notif-center"),
     re_path(r"^iftttmakers/$", secret_key_required(set_language_to_LANGUAGE_CODE(ManageIFTTTMakersView.as_view())),
             name='manage_ifttt_makers'),
-    re_path(r"^deletemaker/(?P<maker_id>[0-9]+)/$", ifttt_delete_view, name="del-ifttt"),
+    re_path(r"^api/reminder/$", reminder_api_view, name="api-reminder"),
+    re_path(r"^api/status/$", status_api_view, name="api-status"),
+    re_path(r"^api/treatments/$", treatments_api_view, name="api-treatments"),
+    re_path(r"^api/twilio/status/$", twilio_status_api_view, name="api-twilio-status"),
+    re_path(r"^export/$", export_view, name="export"),
+    re_path(r"^memory/$", memory_view, name="memory"),
 
 ]
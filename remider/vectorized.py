@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+HOUR = 3600 * 10 ** 6  # in microseconds
+DAY = 24 * HOUR
+
+
+def to_microseconds(dates):
+    """
+    converts dates to array of microseconds since epoch
+    :param dates: array of datetime64 or sequence of aware datetimes
+    :return: int64 array
+    """
+    if isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype("datetime64[us]").astype(np.int64)
+    return np.fromiter(((date - EPOCH) // MICROSECOND for date in dates), dtype=np.int64)
+
+
+def calculate_remaining_batch(dates, frequencies, now=None):
+    """
+    calculates time remaining to next changes of many devices at once
+    :param dates: array of datetime64 or sequence of aware datetimes of previous changes
+    :param frequencies: hours between changes (one number or sequence of numbers)
+    :param now: aware datetime, defaults to current time
+    :return: dict of arrays:
+             "remaining" - microseconds to next change (int64)
+             "days", "hours" - remaining days and hours, as written in sms texts
+             "overdue" - True if change has already passed
+    """
+    now = now or datetime.now(timezone.utc)
+    due = to_microseconds(dates) + np.round(np.asarray(frequencies, dtype=np.float64) * HOUR).astype(np.int64)
+    remaining = due - (now - EPOCH) // MICROSECOND
+
+    days = np.floor_divide(remaining, DAY)
+    seconds = (remaining - days * DAY) // 10 ** 6
+    return {
+        "remaining": remaining,
+        "days": days,
+        "hours": np.round(seconds / 3600).astype(np.int64),
+        "overdue": days < 0,
+    }
@@ -1,20 +1,33 @@
-import sys
+import hashlib
+import json
 import os.path
+from datetime import datetime, timezone
 
-import requests
 from django.conf import settings
-from django.http import FileResponse
-from django.shortcuts import render, redirect, reverse
-from django.utils.translation import ugettext as _
+from django.core.exceptions import RequestDataTooBig, ValidationError
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest, \
+    HttpResponseForbidden
+from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.translation import ugettext as _, ugettext_lazy
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe, require_POST
 from django.views.generic import TemplateView, FormView
 
-from .api_interactions import change_config_var, create_trigger, notify
-from .data_processing import process_nightscouts_api_response, calculate_infusion, calculate_sensor, \
-    get_sms_txt_infusion_set, get_sms_txt_sensor, get_trigger_model
-from .decorators import secret_key_required, set_language_to_LANGUAGE_CODE
+from .api_interactions import change_config_var, change_config_vars, sync_trigger_series
+from .data_processing import get_trigger_model, seconds_or_none, get_status
+from .decorators import secret_key_required, set_language_to_LANGUAGE_CODE, machine_key_required
+from .delivery import get_public_url, record_status, get_delivery_rates
+from .export import CONTENT_TYPES, iter_export
+from .ingest import ingest_treatments, LimitedReader
+from .memory_profiling import get_report
 from .forms import ChangeEnvVariableForm, ChooseNotificationsWayForm, GetSecretForm, FileUploudForm, ChooseLanguageForm, \
-    TriggerTimeForm
+    TriggerTimeForm, RecipientFormSet
+from .models import Patient
+from .pipeline import run_reminder_pipeline
 from .storage import OverwriteStorage
+from .wear_statistics import get_wear_statistics
 
 
 @secret_key_required
@@ -36,49 +49,152 @@ def reminder_and_notifier_view(request, send_notif=True):
     calculates next change date
     sends notification via sms
     """
+    result = run_reminder_pipeline(send_notif)
 
-    response = requests.get(settings.NIGTSCOUT_LINK + "/api/v1/treatments")
-    date, sensor_date = process_nightscouts_api_response(response)
+    return render(request, "remider/debug.html",
+                  {
+                      "inf_text": result["inf_text"][1:],
+                      "sensor_text": result["sensor_text"],
+                      "reservoir_text": result["reservoir_text"],
+                      "SECRET_KEY": settings.SECRET_KEY,
+                  })
 
-    sms_text = ""
 
+@csrf_exempt
+@machine_key_required
+def reminder_api_view(request):
+    """
+    lean variant of reminder_and_notifier_view for schedulers (atrigger.com, wake_up command)
+    skips session, auth and messages middleware (see LEAN_PATH_PREFIXES)
+    ?quiet=1 works like quiet_checkup_view
+    ?sync=1 only synchronizes data and schedules next triggers (see EVENT_REMINDERS)
+    :return: 204 or compact JSON (if client accepts application/json)
+    """
+    if request.GET.get("sync", "0") == "1":
+        result = run_reminder_pipeline(send_notif=False, schedule=True)
+    else:
+        result = run_reminder_pipeline(request.GET.get("quiet", "0") != "1")
+
+    if "application/json" in request.META.get("HTTP_ACCEPT", ""):
+        return JsonResponse({
+            "infusion": seconds_or_none(result["infusion_time_remains"]),
+            "sensor": seconds_or_none(result["sensor_time_remains"]),
+        })
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+@require_POST
+@machine_key_required
+def treatments_api_view(request):
+    """
+    ingest endpoint for treatments pushed by uploaders (bridges, Nightscout plugins)
+    body is NDJSON or JSON array of treatments (at most INGEST_MAX_BODY_SIZE bytes), parsed while it`s read
+    treatments are deduplicated by _id and change dates are updated in one transaction
+    ?notify=1 runs reminder (with notification, without scheduling) right after ingestion,
+    without reading Nightscout`s API, if date of last change has moved (uploaders push every few minutes)
+    :return: JSON with numbers of ingested and duplicated treatments and "notified" boolean
+    """
     try:
-        infusion_time_remains = calculate_infusion(date)
-        inf_text = get_sms_txt_infusion_set(infusion_time_remains)
-        sms_text += inf_text
-
-    except TypeError:  # date is None
-        inf_text = _(".\n\nInfusion set: unsuccessful data reading")
-        sms_text += inf_text
-
-    except Exception as error:
-        print(error)
-        sys.stdout.flush()
-        inf_text = _(".\n\n Infusion set: unsuccessful data processing")
-        sms_text += inf_text
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except (ValueError, TypeError):
+        return HttpResponseBadRequest("invalid Content-Length")
+    if content_length > settings.INGEST_MAX_BODY_SIZE:
+        return HttpResponse(status=413)
     try:
-        sensor_time_remains = calculate_sensor(sensor_date)
-        sensor_text = get_sms_txt_sensor(sensor_time_remains)
-        sms_text += sensor_text
+        treatments, duplicates, changed = ingest_treatments(LimitedReader(request, settings.INGEST_MAX_BODY_SIZE))
+    except RequestDataTooBig:
+        return HttpResponse(status=413)
+    except ValidationError as error:  # value rejected by model field
+        return HttpResponseBadRequest("; ".join(error.messages))
+    except (ValueError, TypeError) as error:
+        return HttpResponseBadRequest(str(error))
+
+    data = {"ingested": len(treatments), "duplicates": duplicates, "notified": False}
+    if request.GET.get("notify", "0") == "1" and changed:
+        data["notified"] = True
+        result = run_reminder_pipeline(schedule=False, treatments=treatments)
+        data["infusion"] = seconds_or_none(result["infusion_time_remains"])
+        data["sensor"] = seconds_or_none(result["sensor_time_remains"])
+    return JsonResponse(data)
+
+
+@require_safe
+@machine_key_required
+def status_api_view(request):
+    """
+    compact JSON status for pollers (watch faces, home automation)
+    built from cached dates only, without Nightscout`s API call
+    carries strong ETag (answers If-None-Match with 304)
+    and Cache-Control max-age set to time remaining to next visible change
+    """
+    status, max_age = get_status()
+    content = json.dumps(status, separators=(",", ":"), sort_keys=True)
 
-    except TypeError:  # sensor_date is None
-        sensor_text = _('\n\nCGM sensor: unsuccessful data reading')
-        sms_text += sensor_text
+    response = HttpResponse(content, content_type="application/json")
+    response["ETag"] = quote_etag(hashlib.sha1(content.encode()).hexdigest())
+    patch_cache_control(response, private=True, max_age=max_age or 0)
 
-    except Exception as error:
-        print(error)
-        sys.stdout.flush()
-        sensor_text = _("\n\nCGM sensor: unsuccessful data processing")
-        sms_text += sensor_text
+    return get_conditional_response(request, etag=response["ETag"], response=response)
 
-    if send_notif:
-        notify(sms_text)
-        create_trigger()
 
-    return render(request, "remider/debug.html",
+@csrf_exempt
+@require_POST
+def twilio_status_api_view(request):
+    """
+    delivery receipt of sms (Twilio`s status callback), request is signed by Twilio (X-Twilio-Signature)
+    statuses are buffered and saved in batches or after DELIVERY_FLUSH_INTERVAL seconds (see record_status)
+    """
+    from twilio.request_validator import RequestValidator
+
+    validator = RequestValidator(settings.TWILIO_AUTH_TOKEN)
+    if not validator.validate(get_public_url(request.get_full_path()), request.POST.dict(),
+                              request.META.get("HTTP_X_TWILIO_SIGNATURE", "")):
+        return HttpResponseForbidden()
+    if not request.POST.get("MessageSid") or not request.POST.get("MessageStatus"):
+        return HttpResponseBadRequest()
+
+    error_code = request.POST.get("ErrorCode")
+    record_status(request.POST["MessageSid"], request.POST.get("To", ""), request.POST["MessageStatus"],
+                  int(error_code) if error_code and error_code.isdigit() else None)
+    return HttpResponse(status=204)
+
+
+@require_safe
+@secret_key_required
+def export_view(request):
+    """
+    streams history of infusion set and CGM sensor changes with wear intervals
+    as CSV (?format=csv, default) or NDJSON (?format=ndjson), optionally of one patient (?patient=<name>)
+    rows are read with database cursor and written one by one, so memory doesn`t grow with history
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in CONTENT_TYPES:
+        return HttpResponseBadRequest(_("unknown format, use csv or ndjson"))
+    patient = None
+    if request.GET.get("patient"):
+        patient = get_object_or_404(Patient, name=request.GET["patient"])
+
+    response = StreamingHttpResponse(iter_export(export_format, patient), content_type=CONTENT_TYPES[export_format])
+    response["Content-Disposition"] = 'attachment; filename="changes.{}"'.format(export_format)
+    return response
+
+
+@secret_key_required
+@set_language_to_LANGUAGE_CODE
+def memory_view(request):
+    """
+    shows allocations of traced requests aggregated by url name and by stage of reminder`s pipeline
+    and RSS of worker over time (see MEMORY_PROFILING_RATE)
+    """
+    report = get_report()
+    rss = [(datetime.fromtimestamp(timestamp, timezone.utc), rss) for timestamp, rss in report["rss"]]
+    return render(request, "remider/memory.html",
                   {
-                      "inf_text": inf_text[1:],
-                      "sensor_text": sensor_text,
+                      "views": report["views"],
+                      "stages": report["stages"],
+                      "rss": rss,
+                      "rate": settings.MEMORY_PROFILING_RATE,
                       "SECRET_KEY": settings.SECRET_KEY,
                   })
 
@@ -162,9 +278,13 @@ class MenuView(TemplateView):
             language_form, self.info2 = self.save_changeenvvarform(language_form, "LANGUAGE_CODE", "language")
         if time_form.is_valid() and "time_button" in post_data:
             time_form.save()
+            if settings.ATRIGGER_SCHEDULE == "series":
+                sync_trigger_series()
         contex = self.get_context_data(forms_list=self.forms_list, SECRET_KEY=settings.SECRET_KEY, info=self.info,
                                        info2=self.info2,
-                                       language_form=language_form, time_form=time_form, )
+                                       language_form=language_form, time_form=time_form,
+                                       wear_statistics=get_wear_statistics(),
+                                       delivery_rates=get_delivery_rates() if settings.DELIVERY_RECEIPTS else [], )
         return self.render_to_response(contex)
 
     def get(self, request, *args, **kwargs):
@@ -189,7 +309,9 @@ class MenuView(TemplateView):
 
         contex = self.get_context_data(forms_list=self.forms_list, SECRET_KEY=settings.SECRET_KEY, info=self.info,
                                        info2=self.info2,
-                                       language_form=language_form, time_form=time_form, )
+                                       language_form=language_form, time_form=time_form,
+                                       wear_statistics=get_wear_statistics(),
+                                       delivery_rates=get_delivery_rates() if settings.DELIVERY_RECEIPTS else [], )
         return self.render_to_response(contex)
 
     def create_changeenvvarform(self, button_name, label, default, post_data=()):
@@ -243,193 +365,111 @@ def upload_view(request, location=os.path.join(settings.STATIC_ROOT, "uplouded")
     return render(request, 'remider/upload.html', {'form': form, "SECRET_KEY": settings.SECRET_KEY, })
 
 
-class ManagePhoneNumbersView(TemplateView):
+class ManageRecipientsView(TemplateView):
     """
-    allows user to change, add or delete his phone numbers
+    generic view for adding, changing and deleting recipients (config variables prefix1, prefix2, ...)
+    all changes of formset are saved with one request to heroku.com
+    state lives in request (view instance), so it`s safe for threaded workers
     """
-    template_name = "remider/manage_ph.html"
-    forms_list = []
-    to_numbers_forms_list = {}
-    info = (False, "")
+    prefix = ""  # prefix of config variables` names
+    settings_name = ""  # name of list in settings
+    item_label = ""  # label of recipient`s field, followed by its number
+    sender = None  # optional (config variable, settings name, label) saved together with recipients
 
-    def post(self, request, *args, **kwargs):
+    def get(self, request, *args, **kwargs):
         """
         GET method
         handles http`s GET request
-        loads forms
-        shows info about successful change
+        loads formset (one form for every recipient and one empty form for new recipient)
         """
-        self.to_numbers_forms_list = {}
-        self.forms_list = []
-        post_data = request.POST
-        from_number_form = self.create_changeenvvarform('from_number_button', _("NUMBER OF SENDER"),
-                                                        settings.FROM_NUMBER,
-                                                        post_data)
-
-        for i, number in enumerate(settings.TO_NUMBERS):
-            label = "to_number_" + str(i + 1)
-            button_name = label + "_button"
-            label_tag = _("DESTINATION NUMBER ") + str(i + 1) + "."
-            form = self.create_changeenvvarform(button_name, label_tag, number, post_data)
-            self.to_numbers_forms_list[label] = form
-        next_number_id = len(settings.TO_NUMBERS) + 1
-        new_number_form = self.create_changeenvvarform('new_number_button',
-                                                       _("DESTINATION NUMBER ") + str(next_number_id) + ".", "",
-                                                       post_data)
-
-        if from_number_form.is_valid() and 'from_number_button' in post_data:
-            from_number_form, self.info = self.save_changeenvvarform(from_number_form, "from_number", )
-
-        for i, number in enumerate(settings.TO_NUMBERS):
-            label = "to_number_" + str(i + 1)
-            button_name = label + "_button"
-            form = self.to_numbers_forms_list[label]
-            if form.is_valid() and button_name in post_data:
-                form, self.info = self.save_changeenvvarform(form, label)
-                break
-
-        if new_number_form.is_valid() and 'new_number_button' in post_data:
-            new_number_form, self.info = self.save_changeenvvarform(new_number_form, "to_number_" + str(next_number_id))
-        contex = self.get_context_data(forms_list=self.forms_list, info=self.info, delinfo=(False, "normal"),
-                                       SECRET_KEY=settings.SECRET_KEY, last_id=self.get_del_id())
-
-        return self.render_to_response(contex)
+        recipients = list(getattr(settings, self.settings_name))
+        return self.render_to_response(self.get_context_data(**self.get_forms(recipients), info=None))
 
-    def get_del_id(self):
-        if bool(int(self.request.GET.get("delinfo", "0"))):
-            return str(int(self.request.GET.get("delid", "normal")) - 1)
-        else:
-            return len(self.to_numbers_forms_list)
-
-    def get(self, request, *args, **kwargs):
+    def post(self, request, *args, **kwargs):
         """
-        GET method
-        handles http`s GET request
-        loads forms
-        shows info about successful change
+        POST method
+        handles http`s POST request
+        validates and saves all changes of formset at once
         """
-        delinfo = (bool(int(request.GET.get("delinfo", "0"))), request.GET.get("delid", "normal"))
-
-        self.forms_list = []
-        self.to_numbers_forms_list = {}
-        self.create_changeenvvarform('from_number_button', _("NUMBER OF SENDER"), settings.FROM_NUMBER)
-
-        for i, number in enumerate(settings.TO_NUMBERS):
-            label = "to_number_" + str(i + 1)
-            button_name = label + "_button"
-            label_tag = _("DESTINATION NUMBER ") + str(i + 1) + "."
-            form = self.create_changeenvvarform(button_name, label_tag, number)
-            self.to_numbers_forms_list[label] = form
-
-        next_number_id = len(settings.TO_NUMBERS) + 1
-        self.create_changeenvvarform('new_number_button', _("DESTINATION NUMBER ") + str(next_number_id) + ".", "")
-
-        if delinfo[0]:
-            id = delinfo[1]
-            label = "to_number_" + str(id)
-            form = self.to_numbers_forms_list.pop(label)
-            self.forms_list.remove(form)
-            self.forms_list[-2].deletable = True
-            self.forms_list[-1].fields["new_value"].label = _("DESTINATION NUMBER ") + str(
-                len(self.to_numbers_forms_list) + 1) + "."
-        contex = self.get_context_data(forms_list=self.forms_list, info=self.info, delinfo=delinfo,
-                                       SECRET_KEY=settings.SECRET_KEY, last_id=self.get_del_id())
-
-        return self.render_to_response(contex)
-
-    def create_changeenvvarform(self, button_name, label, default, post_data=()):
+        recipients = list(getattr(settings, self.settings_name))
+        forms = self.get_forms(recipients, request.POST)
+        if not all(form.is_valid() for form in forms.values() if form is not None):
+            return self.render_to_response(self.get_context_data(**forms, info=None))
+
+        new_recipients = [form.cleaned_data["value"] for form in forms["formset"]
+                          if form.cleaned_data.get("value") and not form.cleaned_data.get("DELETE")]
+        changes = get_list_changes(self.prefix, recipients, new_recipients)
+        sender = new_sender = None
+        if self.sender:
+            sender, new_sender = getattr(settings, self.sender[1]), forms["sender_form"].cleaned_data["new_value"]
+            if new_sender != sender:
+                changes[self.sender[0]] = new_sender
+
+        info = None
+        if changes and change_config_vars(changes):
+            info = (True, _("CHANGED"))
+            recipients, sender = new_recipients, new_sender
+        elif changes:
+            info = (False, "unsuccess")
+        return self.render_to_response(self.get_context_data(**self.get_forms(recipients, sender=sender), info=info))
+
+    def get_forms(self, recipients, data=None, sender=None):
         """
-        creates form and adds it to forms_list
-        :param button_name: string, unique button name
-        :param label: string, field`s display name
-        :param default: string, default value of form`s field
-        :param post_data: request.POST or empty tuple
-        :return: ready to use form
+        :param recipients: list of current recipients
+        :param data: request.POST or None
+        :param sender: current sender (defaults to value from settings)
+        :return: dict with formset of recipients and sender`s form (None if view has no sender)
         """
-        if button_name in post_data:
-            form = ChangeEnvVariableForm(post_data)
-        else:
-            form = ChangeEnvVariableForm()
-
-        form.button_name = button_name
-        form.fields['new_value'].label = label
-        form.fields['new_value'].initial = default
-        form.fields["new_value"].required = False
-        if form.button_name == 'new_number_button':  # special treatment for adding new number form
-            form.action = _("ADD")
-            if len(self.forms_list) > 0:
-                self.forms_list[-1].deletable = True
-        else:
-            form.action = _("CHANGE")
+        formset = RecipientFormSet(data, initial=[{"value": recipient} for recipient in recipients])
+        for i, form in enumerate(formset):
+            form.fields["value"].label = str(self.item_label) + str(i + 1) + "."
+
+        sender_form = None
+        if self.sender:
+            sender_form = ChangeEnvVariableForm(data, prefix="sender")
+            sender_form.fields["new_value"].label = self.sender[2]
+            sender_form.fields["new_value"].initial = getattr(settings, self.sender[1]) if sender is None else sender
+            sender_form.fields["new_value"].required = False
+        return {"formset": formset, "sender_form": sender_form}
 
-        self.forms_list.append(form)
-        return form
-
-    def save_changeenvvarform(self, form, label):
+    def get_context_data(self, **kwargs):
         """
-        reads data from submitted form and changes config variables
-        :param form: submitted form
-        :param label: name of config variable
-        :return: already used form and info about successful change
+        :return: contex data
         """
-        var = form.cleaned_data["new_value"]
-        if change_config_var(label, var):
-            if form.button_name == 'new_number_button':  # special treatment for adding new number form
-                action = _("ADDED")
-                if len(self.forms_list) > 1:
-                    self.forms_list[-2].deletable = False
-                form.action = _("CHANGE")
-                form.button_name = label + "_button"
-                self.to_numbers_forms_list[label] = form
-                next_number_id = len(self.to_numbers_forms_list) + 1
-                self.create_changeenvvarform('new_number_button',
-                                             _("DESTINATION NUMBER ") + str(next_number_id) + ".",
-                                             "")
-
-
-            else:
-                action = _("CHANGED")
-            info2 = [True, form.fields['new_value'].label, action]
-        else:
-            info2 = [False, form.fields['new_value'].label, "unsuccess"]
-
-        return form, info2
+        return super().get_context_data(**kwargs, SECRET_KEY=settings.SECRET_KEY)
 
 
-@secret_key_required
-@set_language_to_LANGUAGE_CODE
-def number_delete_view(request, number_id):
+class ManagePhoneNumbersView(ManageRecipientsView):
     """
-     view handles requests for phone number deleting
-    :param request: http request
-    :param number_id: assigned number of phone number (requested to deleting)
-    :return: redirects to phone numbers management view
+    allows user to change, add or delete his phone numbers
     """
-    label = "to_number_" + str(number_id)
+    template_name = "remider/manage_ph.html"
+    prefix = "to_number_"
+    settings_name = "TO_NUMBERS"
+    item_label = ugettext_lazy("DESTINATION NUMBER ")
+    sender = ("from_number", "FROM_NUMBER", ugettext_lazy("NUMBER OF SENDER"))
 
-    if change_config_var(label, None):
-        deleted = 1
-    else:
-        deleted = 0
 
-    return redirect("/phonenumbers/?key={}&delinfo={}&delid={}".format(settings.SECRET_KEY, deleted, number_id))
+class ManageIFTTTMakersView(ManageRecipientsView):
+    """
+    view for adding, changing and deleting IFTTT makers
+    """
+    template_name = "remider/manage_ifttt.html"
+    prefix = "IFTTT_MAKER_"
+    settings_name = "IFTTT_MAKERS"
+    item_label = "IFTTT MAKER "
 
 
-@secret_key_required
-@set_language_to_LANGUAGE_CODE
-def ifttt_delete_view(request, maker_id):
+def get_list_changes(prefix, old, new):
     """
-     view handles requests for IFTTT makers deleting
-    :param request: http request
-    :param maker_id: assigned number of IFTTT maker (requested to deleting)
-    :return: redirects to IFTTT makers management view
+    :param prefix: prefix of config variables` names (list is saved as prefix1, prefix2, ...)
+    :param old: list of old values
+    :param new: list of new values
+    :return: dict of changed config variables (None - deleted variable)
     """
-    label = "IFTTT_MAKER_" + str(maker_id)
-    if change_config_var(label, None):
-        deleted = 1
-    else:
-        deleted = 0
-    return redirect("/iftttmakers/?key={}&delinfo={}&delid={}".format(settings.SECRET_KEY, deleted, maker_id))
+    changes = {prefix + str(i + 1): value for i, value in enumerate(new) if i >= len(old) or old[i] != value}
+    changes.update({prefix + str(i + 1): None for i in range(len(new), len(old))})
+    return changes
 
 
 class NotificationsCenterView(FormView):
@@ -479,153 +519,3 @@ class NotificationsCenterView(FormView):
         form.fields["sms_notifications"].initial = sms
 
         return self.render_to_response(self.get_context_data())
-
-
-class ManageIFTTTMakersView(TemplateView):
-    """
-    view for adding, changing and deleting IFTTT makers
-    """
-    template_name = "remider/manage_ifttt.html"
-    forms_list = []
-    makers_dict = {}
-    info = (False, "")
-    ignore_delinfo_in_url = False
-
-    def post(self, request, *args, **kwargs):
-        """
-        GET method
-        handles http`s GET request
-        loads forms
-        shows info about successful change
-        """
-        self.makers_dict = {}
-        self.forms_list = []
-        post_data = request.POST
-
-        for i, maker in enumerate(settings.IFTTT_MAKERS):
-            label = "IFTTT_MAKER_" + str(i + 1)
-            button_name = label + "_button"
-            label_tag = "IFTTT MAKER " + str(i + 1) + "."
-            form = self.create_changeenvvarform(button_name, label_tag, maker, post_data)
-            self.makers_dict[label] = form
-        next_maker_id = len(settings.IFTTT_MAKERS) + 1
-        new_maker_form = self.create_changeenvvarform('new_maker_button',
-                                                      "IFTTT MAKER " + str(next_maker_id) + ".", "", post_data)
-
-        for i, maker in enumerate(settings.IFTTT_MAKERS):
-            label = "IFTTT_MAKER_" + str(i + 1)
-            button_name = label + "_button"
-            form = self.makers_dict[label]
-            if form.is_valid() and button_name in post_data:
-                form, self.info = self.save_changeenvvarform(form, label)
-                break
-        if new_maker_form.is_valid() and 'new_maker_button' in post_data:
-            new_maker_form, self.info = self.save_changeenvvarform(new_maker_form, "IFTTT_MAKER_" + str(next_maker_id))
-            if self.request.GET.get("delinfo", False) and self.info[0]:
-                self.ignore_delinfo_in_url = True
-        contex = self.get_context_data(forms_list=self.forms_list, info=self.info, delinfo=(False, "normal"),
-                                       SECRET_KEY=settings.SECRET_KEY, last_id=self.get_del_id())
-
-        return self.render_to_response(contex)
-
-    def get(self, request, *args, **kwargs):
-        """
-        GET method
-        handles http`s GET request
-        loads forms
-        shows info about successful change
-        """
-        delinfo = (bool(int(request.GET.get("delinfo", "0"))), request.GET.get("delid", "normal"))
-
-        self.forms_list = []
-        self.makers_dict = {}
-
-        for i, maker in enumerate(settings.IFTTT_MAKERS):
-            label = "IFTTT_MAKER_" + str(i + 1)
-            button_name = label + "_button"
-            label_tag = "IFTTT MAKER " + str(i + 1) + "."
-            form = self.create_changeenvvarform(button_name, label_tag, maker)
-            self.makers_dict[label] = form
-
-        next_maker_id = len(settings.IFTTT_MAKERS) + 1
-        self.create_changeenvvarform('new_maker_button', "IFTTT MAKER " + str(next_maker_id) + ".", "")
-
-        if delinfo[0] and not self.ignore_delinfo_in_url:
-            id = delinfo[1]
-            label = "IFTTT_MAKER_" + str(id)
-            try:
-                form = self.makers_dict.pop(label)
-                self.forms_list.remove(form)
-                self.forms_list[-2].deletable = True
-                self.forms_list[-1].fields["new_value"].label = "IFTTT MAKER " + str(
-                    len(self.makers_dict) + 1) + "."
-            except KeyError:
-                pass
-        contex = self.get_context_data(forms_list=self.forms_list, info=self.info, delinfo=delinfo,
-                                       SECRET_KEY=settings.SECRET_KEY, last_id=self.get_del_id())
-
-        return self.render_to_response(contex)
-
-    def get_del_id(self):
-        if self.ignore_delinfo_in_url:
-            return len(settings.IFTTT_MAKERS)
-
-        delinfo = (bool(int(self.request.GET.get("delinfo", "0"))), self.request.GET.get("delid", "normal"))
-
-        return str(int(delinfo[1]) - 1) if delinfo[0] else len(self.makers_dict)
-
-    def create_changeenvvarform(self, button_name, label, default, post_data=()):
-        """
-        creates form and adds it to forms_list
-        :param button_name: string, unique button name
-        :param label: string, field`s display name
-        :param default: string, default value of form`s field
-        :param post_data: request.POST or empty tuple
-        :return: ready to use form
-        """
-        if button_name in post_data:
-            form = ChangeEnvVariableForm(post_data)
-        else:
-            form = ChangeEnvVariableForm()
-
-        form.button_name = button_name
-        form.fields['new_value'].label = label
-        form.fields['new_value'].initial = default
-        form.fields["new_value"].required = False
-        if form.button_name == 'new_maker_button':  # special treatment for adding new maker form
-            form.action = _("ADD")
-            if len(self.forms_list) > 0:
-                self.forms_list[-1].deletable = True
-        else:
-            form.action = _("CHANGE")
-
-        self.forms_list.append(form)
-        return form
-
-    def save_changeenvvarform(self, form, label):
-        """
-        reads data from submitted form and changes config variables
-        :param form: submitted form
-        :param label: name of config variable
-        :return: already used form and info about successful change
-        """
-        var = form.cleaned_data["new_value"]
-        if change_config_var(label, var):
-            if form.button_name == 'new_maker_button':  # special treatment for adding new maker form
-                action = _("ADDED")
-                if len(self.forms_list) > 1:
-                    self.forms_list[-2].deletable = False
-                form.action = _("CHANGE")
-                form.button_name = label + "_button"
-                self.makers_dict[label] = form
-                next_maker_id = len(self.makers_dict) + 1
-                self.create_changeenvvarform('new_maker_button', "IFTTT MAKER " + str(next_maker_id) + ".", "")
-
-
-            else:
-                action = _("CHANGED")
-            info2 = [True, form.fields['new_value'].label, action]
-        else:
-            info2 = [False, form.fields['new_value'].label, "unsuccess"]
-
-        return form, info2
@@ -0,0 +1,119 @@
+import json
+
+from django.conf import settings
+from django.utils.translation import ugettext as _
+
+from .models import WearStatistics
+from .tenancy import get_config
+
+HISTOGRAM_HOURS = 24 * 14  # longer intervals are counted in the last bin
+MIN_COUNT = 3  # minimal number of intervals shown in sms
+AGGREGATE_FIELDS = ("last_change", "count", "mean", "m2", "early", "late", "histogram")
+
+
+def observe_change(kind, date, patient=None):
+    """
+    updates wear statistics with change (if it`s newer than previous one)
+    row is written only if its last change hasn`t moved since it was read (ingest and workers run concurrently,
+    interval must not be added twice), otherwise it`s read again
+    :param kind: "infusion" or "sensor"
+    :param date: aware datetime of change
+    :param patient: Patient (None - app`s own data)
+    :return: WearStatistics
+    """
+    statistics, created = WearStatistics.objects.get_or_create(kind=kind, patient=patient)
+    while statistics.last_change is None or date > statistics.last_change:
+        previous = statistics.last_change
+        if previous is not None:
+            config = get_config(patient)
+            frequency = config.infusion_set_alert_frequency if kind == "infusion" else config.sensor_alert_frequency
+            add_interval(statistics, (date - previous).total_seconds() / 3600, frequency)
+        statistics.last_change = date
+        if WearStatistics.objects.filter(pk=statistics.pk, last_change=previous).update(
+                **{field: getattr(statistics, field) for field in AGGREGATE_FIELDS}):
+            break
+        statistics = WearStatistics.objects.get(pk=statistics.pk)
+    return statistics
+
+
+def add_interval(statistics, hours, frequency):
+    """
+    adds interval between changes to streaming aggregates
+    :param statistics: WearStatistics
+    :param hours: interval between changes
+    :param frequency: expected hours between changes
+    """
+    statistics.count += 1
+    delta = hours - statistics.mean
+    statistics.mean += delta / statistics.count
+    statistics.m2 += delta * (hours - statistics.mean)
+
+    if hours < frequency - settings.WEAR_TOLERANCE:
+        statistics.early += 1
+    elif hours > frequency + settings.WEAR_TOLERANCE:
+        statistics.late += 1
+
+    histogram = json.loads(statistics.histogram) or [0] * (HISTOGRAM_HOURS + 1)
+    histogram[min(int(hours), HISTOGRAM_HOURS)] += 1
+    statistics.histogram = json.dumps(histogram)
+
+
+def get_variance(statistics):
+    """
+    :return: sample variance of intervals (None if there are less than two of them)
+    """
+    if statistics.count < 2:
+        return None
+    return statistics.m2 / (statistics.count - 1)
+
+
+def get_percentile(statistics, percent):
+    """
+    reads percentile of intervals from histogram (with one hour accuracy)
+    :param percent: number from 0 to 100
+    :return: hours (None if there are no intervals)
+    """
+    if not statistics.count:
+        return None
+    rank = percent / 100 * statistics.count
+    cumulative = 0
+    for hours, count in enumerate(json.loads(statistics.histogram)):
+        cumulative += count
+        if count and cumulative >= rank:
+            return hours + 0.5
+    return HISTOGRAM_HOURS + 0.5
+
+
+def get_wear_statistics(patient=None):
+    """
+    :param patient: Patient (None - app`s own data)
+    :return: list of dicts with wear statistics of infusion set and CGM sensor
+    """
+    summaries = []
+    for statistics in WearStatistics.objects.filter(patient=patient).order_by("kind"):
+        variance = get_variance(statistics)
+        summaries.append({
+            "kind": statistics.kind,
+            "count": statistics.count,
+            "mean": statistics.mean if statistics.count else None,
+            "std": variance ** 0.5 if variance is not None else None,
+            "p10": get_percentile(statistics, 10),
+            "median": get_percentile(statistics, 50),
+            "p90": get_percentile(statistics, 90),
+            "early": statistics.early,
+            "late": statistics.late,
+        })
+    return summaries
+
+
+def get_sms_txt_wear_habit(kind, patient=None):
+    """
+    add info about usual interval between changes to sms`s text
+    :param kind: "infusion" or "sensor"
+    :param patient: Patient (None - app`s own data)
+    :return: part of text for sms notification (empty if there are too few changes)
+    """
+    statistics = WearStatistics.objects.filter(kind=kind, patient=patient).first()
+    if statistics is None or statistics.count < MIN_COUNT:
+        return ""
+    return _(" You usually change after {}h.").format(int(get_percentile(statistics, 50)))